@@ -0,0 +1,993 @@
+#pragma once
+
+#include <protosaurus/protosaurus.h>
+
+#include <cstdint>      // int32_t, int64_t, uint8_t, INT32_MAX
+#include <cstring>      // memcpy
+#include <memory>       // unique_ptr, make_unique
+#include <optional>     // optional
+#include <stdexcept>    // runtime_error
+#include <string>       // string
+#include <string_view>  // string_view
+#include <vector>       // vector
+
+// Converts between protobuf messages and Arrow arrays, without linking
+// against Arrow. The arrays are handed over through the Arrow C data interface
+// (https://arrow.apache.org/docs/format/CDataInterface.html), whose two
+// structs below are ABI-stable and meant to be copied verbatim into producers.
+// In both directions the layout is taken from an ArrowSchema, so the Python
+// side stays the single place that maps protobuf types to Arrow types.
+
+#ifndef ARROW_C_DATA_INTERFACE
+#define ARROW_C_DATA_INTERFACE
+
+#define ARROW_FLAG_DICTIONARY_ORDERED 1
+#define ARROW_FLAG_NULLABLE 2
+#define ARROW_FLAG_MAP_KEYS_SORTED 4
+
+struct ArrowSchema {
+  // Array type description
+  const char* format;
+  const char* name;
+  const char* metadata;
+  int64_t flags;
+  int64_t n_children;
+  struct ArrowSchema** children;
+  struct ArrowSchema* dictionary;
+
+  // Release callback
+  void (*release)(struct ArrowSchema*);
+  // Opaque producer-specific data
+  void* private_data;
+};
+
+struct ArrowArray {
+  // Array data description
+  int64_t length;
+  int64_t null_count;
+  int64_t offset;
+  int64_t n_buffers;
+  int64_t n_children;
+  const void** buffers;
+  struct ArrowArray** children;
+  struct ArrowArray* dictionary;
+
+  // Release callback
+  void (*release)(struct ArrowArray*);
+  // Opaque producer-specific data
+  void* private_data;
+};
+
+#endif  // ARROW_C_DATA_INTERFACE
+
+namespace protosaurus {
+
+using google::protobuf::Reflection;
+
+namespace arrow {
+
+// Owns everything an exported ArrowArray points to. Children are stored by
+// value here and only referenced from the ArrowArray, as the C data interface
+// allows a consumer to move a child out and leave it released.
+struct ExportedArray {
+  std::vector<std::vector<std::uint8_t>> buffers;
+  std::vector<const void*> buffer_pointers;
+  std::vector<ArrowArray> children;
+  std::vector<ArrowArray*> child_pointers;
+  std::unique_ptr<ArrowArray> dictionary;
+};
+
+inline void release_array(ArrowArray* array) {
+  auto* exported = static_cast<ExportedArray*>(array->private_data);
+
+  for (ArrowArray& child : exported->children) {
+    if (child.release != nullptr) child.release(&child);
+  }
+
+  if (exported->dictionary && exported->dictionary->release != nullptr) {
+    exported->dictionary->release(exported->dictionary.get());
+  }
+
+  delete exported;
+  array->release = nullptr;
+}
+
+// Moves `buffers` and `children` into a fresh ArrowArray. A buffer left empty
+// is exported as a null pointer, which is how the format spells "no nulls"
+// for a validity bitmap.
+inline void export_array(ArrowArray* out, std::int64_t length, std::int64_t null_count,
+                         std::vector<std::vector<std::uint8_t>> buffers, std::vector<ArrowArray> children = {},
+                         std::unique_ptr<ArrowArray> dictionary = nullptr) {
+  auto exported = std::make_unique<ExportedArray>();
+  exported->buffers = std::move(buffers);
+  exported->children = std::move(children);
+  exported->dictionary = std::move(dictionary);
+
+  for (const auto& buffer : exported->buffers) {
+    exported->buffer_pointers.push_back(buffer.empty() ? nullptr : buffer.data());
+  }
+
+  for (ArrowArray& child : exported->children) {
+    exported->child_pointers.push_back(&child);
+  }
+
+  out->length = length;
+  out->null_count = null_count;
+  out->offset = 0;
+  out->n_buffers = static_cast<std::int64_t>(exported->buffer_pointers.size());
+  out->n_children = static_cast<std::int64_t>(exported->child_pointers.size());
+  out->buffers = exported->buffer_pointers.data();
+  out->children = exported->child_pointers.empty() ? nullptr : exported->child_pointers.data();
+  out->dictionary = exported->dictionary.get();
+  out->release = &release_array;
+  out->private_data = exported.release();
+}
+
+
+// A growable bitmap, least significant bit first as Arrow lays it out.
+class Bitmap {
+private:
+  std::vector<std::uint8_t> m_bytes;
+  std::int64_t m_length = 0;
+
+public:
+  void append(bool value) {
+    if (m_length % 8 == 0) m_bytes.push_back(0);
+    if (value) m_bytes.back() |= static_cast<std::uint8_t>(1u << (m_length % 8));
+    ++m_length;
+  }
+
+  std::vector<std::uint8_t> finish() { return std::move(m_bytes); }
+};
+
+
+// Validity bookkeeping shared by every builder. The bitmap is only exported
+// when at least one slot is null.
+class Validity {
+private:
+  Bitmap m_bitmap;
+  std::int64_t m_null_count = 0;
+
+public:
+  void append(bool valid) {
+    m_bitmap.append(valid);
+    if (!valid) ++m_null_count;
+  }
+
+  std::int64_t null_count() const { return m_null_count; }
+
+  std::vector<std::uint8_t> finish() {
+    std::vector<std::uint8_t> bitmap = m_bitmap.finish();
+    if (m_null_count == 0) bitmap.clear();
+    return bitmap;
+  }
+};
+
+
+// A map entry's key and value never track presence, whatever the syntax: an
+// entry with its key or value left off the wire holds the default, exactly as
+// protobuf itself reads it.
+inline bool tracks_presence(const FieldDescriptor* field) {
+  return field->has_presence() && !field->containing_type()->options().map_entry();
+}
+
+
+template <typename T>
+void append_value(std::vector<std::uint8_t>& buffer, T value) {
+  const std::size_t position = buffer.size();
+  buffer.resize(position + sizeof(T));
+  std::memcpy(buffer.data() + position, &value, sizeof(T));
+}
+
+// 32-bit offsets are what the "u", "z", "+l" and "+m" formats use.
+inline std::int32_t checked_offset(std::size_t offset) {
+  if (offset > static_cast<std::size_t>(INT32_MAX)) {
+    throw std::runtime_error("Arrow column exceeds 2 GiB; decode the payloads in smaller batches");
+  }
+  return static_cast<std::int32_t>(offset);
+}
+
+
+// Builds one Arrow array from the values of one protobuf field. Every
+// builder is bound to the field it reads when it is created; the message to
+// read from is passed per call.
+class Builder {
+public:
+  virtual ~Builder() = default;
+
+  // The field's value in `message`: null when the field tracks presence and
+  // is unset, otherwise its value -- for fields without presence that is the
+  // default when the field is absent from the wire.
+  virtual void append(const Message& message) = 0;
+
+  // Element `index` of the repeated field in `message`.
+  virtual void append_element(const Message& message, int index) = 0;
+
+  // A null slot, for a field whose parent struct is null.
+  virtual void append_null() = 0;
+
+  virtual void finish(ArrowArray* out) = 0;
+};
+
+
+template <typename T, T (Reflection::*Get)(const Message&, const FieldDescriptor*) const,
+          T (Reflection::*GetRepeated)(const Message&, const FieldDescriptor*, int) const>
+class PrimitiveBuilder : public Builder {
+private:
+  const FieldDescriptor* m_field;
+  Validity m_validity;
+  std::vector<std::uint8_t> m_values;
+  std::int64_t m_length = 0;
+
+  void push(bool valid, T value) {
+    m_validity.append(valid);
+    append_value(m_values, value);
+    ++m_length;
+  }
+
+public:
+  explicit PrimitiveBuilder(const FieldDescriptor* field) : m_field(field) {}
+
+  void append(const Message& message) override {
+    const Reflection* reflection = message.GetReflection();
+
+    if (tracks_presence(m_field) && !reflection->HasField(message, m_field)) {
+      push(false, T{});
+    } else {
+      push(true, (reflection->*Get)(message, m_field));
+    }
+  }
+
+  void append_element(const Message& message, int index) override {
+    push(true, (message.GetReflection()->*GetRepeated)(message, m_field, index));
+  }
+
+  void append_null() override { push(false, T{}); }
+
+  void finish(ArrowArray* out) override {
+    const std::int64_t null_count = m_validity.null_count();
+    export_array(out, m_length, null_count, {m_validity.finish(), std::move(m_values)});
+  }
+};
+
+using Int32Builder = PrimitiveBuilder<std::int32_t, &Reflection::GetInt32, &Reflection::GetRepeatedInt32>;
+using Int64Builder = PrimitiveBuilder<std::int64_t, &Reflection::GetInt64, &Reflection::GetRepeatedInt64>;
+using UInt32Builder = PrimitiveBuilder<std::uint32_t, &Reflection::GetUInt32, &Reflection::GetRepeatedUInt32>;
+using UInt64Builder = PrimitiveBuilder<std::uint64_t, &Reflection::GetUInt64, &Reflection::GetRepeatedUInt64>;
+using FloatBuilder = PrimitiveBuilder<float, &Reflection::GetFloat, &Reflection::GetRepeatedFloat>;
+using DoubleBuilder = PrimitiveBuilder<double, &Reflection::GetDouble, &Reflection::GetRepeatedDouble>;
+
+
+class BoolBuilder : public Builder {
+private:
+  const FieldDescriptor* m_field;
+  Validity m_validity;
+  Bitmap m_values;
+  std::int64_t m_length = 0;
+
+  void push(bool valid, bool value) {
+    m_validity.append(valid);
+    m_values.append(value);
+    ++m_length;
+  }
+
+public:
+  explicit BoolBuilder(const FieldDescriptor* field) : m_field(field) {}
+
+  void append(const Message& message) override {
+    const Reflection* reflection = message.GetReflection();
+
+    if (tracks_presence(m_field) && !reflection->HasField(message, m_field)) {
+      push(false, false);
+    } else {
+      push(true, reflection->GetBool(message, m_field));
+    }
+  }
+
+  void append_element(const Message& message, int index) override {
+    push(true, message.GetReflection()->GetRepeatedBool(message, m_field, index));
+  }
+
+  void append_null() override { push(false, false); }
+
+  void finish(ArrowArray* out) override {
+    const std::int64_t null_count = m_validity.null_count();
+    export_array(out, m_length, null_count, {m_validity.finish(), m_values.finish()});
+  }
+};
+
+
+// string and bytes: both are a run of int32 offsets into one data buffer.
+class BinaryBuilder : public Builder {
+private:
+  const FieldDescriptor* m_field;
+  Validity m_validity;
+  std::vector<std::uint8_t> m_offsets;
+  std::vector<std::uint8_t> m_data;
+  std::int64_t m_length = 0;
+  std::string m_scratch;
+
+  void push(bool valid, std::string_view value) {
+    m_validity.append(valid);
+    m_data.insert(m_data.end(), value.begin(), value.end());
+    append_value(m_offsets, checked_offset(m_data.size()));
+    ++m_length;
+  }
+
+public:
+  explicit BinaryBuilder(const FieldDescriptor* field) : m_field(field) { append_value(m_offsets, std::int32_t{0}); }
+
+  void append(const Message& message) override {
+    const Reflection* reflection = message.GetReflection();
+
+    if (tracks_presence(m_field) && !reflection->HasField(message, m_field)) {
+      push(false, {});
+    } else {
+      push(true, reflection->GetStringReference(message, m_field, &m_scratch));
+    }
+  }
+
+  void append_element(const Message& message, int index) override {
+    push(true, message.GetReflection()->GetRepeatedStringReference(message, m_field, index, &m_scratch));
+  }
+
+  void append_null() override { push(false, {}); }
+
+  void finish(ArrowArray* out) override {
+    const std::int64_t null_count = m_validity.null_count();
+    export_array(out, m_length, null_count, {m_validity.finish(), std::move(m_offsets), std::move(m_data)});
+  }
+};
+
+
+// An enum becomes dictionary(int32, string): the indices point into the list
+// of the enum's value names, in declaration order. A number the enum does not
+// declare -- possible for open proto3 enums -- has no name and becomes null.
+class EnumBuilder : public Builder {
+private:
+  const FieldDescriptor* m_field;
+  Validity m_validity;
+  std::vector<std::uint8_t> m_indices;
+  std::int64_t m_length = 0;
+
+  void push_number(int number) {
+    const EnumValueDescriptor* value = m_field->enum_type()->FindValueByNumber(number);
+
+    m_validity.append(value != nullptr);
+    append_value(m_indices, std::int32_t{value != nullptr ? value->index() : 0});
+    ++m_length;
+  }
+
+public:
+  explicit EnumBuilder(const FieldDescriptor* field) : m_field(field) {}
+
+  void append(const Message& message) override {
+    const Reflection* reflection = message.GetReflection();
+
+    if (tracks_presence(m_field) && !reflection->HasField(message, m_field)) {
+      append_null();
+    } else {
+      push_number(reflection->GetEnumValue(message, m_field));
+    }
+  }
+
+  void append_element(const Message& message, int index) override {
+    push_number(message.GetReflection()->GetRepeatedEnumValue(message, m_field, index));
+  }
+
+  void append_null() override {
+    m_validity.append(false);
+    append_value(m_indices, std::int32_t{0});
+    ++m_length;
+  }
+
+  void finish(ArrowArray* out) override {
+    const EnumDescriptor* enum_type = m_field->enum_type();
+
+    std::vector<std::uint8_t> offsets;
+    std::vector<std::uint8_t> names;
+    append_value(offsets, std::int32_t{0});
+
+    for (int i = 0; i < enum_type->value_count(); ++i) {
+      const std::string_view name = enum_type->value(i)->name();
+      names.insert(names.end(), name.begin(), name.end());
+      append_value(offsets, checked_offset(names.size()));
+    }
+
+    auto dictionary = std::make_unique<ArrowArray>();
+    export_array(dictionary.get(), enum_type->value_count(), 0, {{}, std::move(offsets), std::move(names)});
+
+    const std::int64_t null_count = m_validity.null_count();
+    export_array(out, m_length, null_count, {m_validity.finish(), std::move(m_indices)}, {}, std::move(dictionary));
+  }
+};
+
+
+std::unique_ptr<Builder> make_field_builder(const ArrowSchema& schema, const FieldDescriptor* field);
+
+
+// A message becomes a struct with one child per Arrow field, matched to the
+// protobuf field of the same name. `m_field` is null for the root, whose
+// slots are the parsed messages themselves.
+class StructBuilder : public Builder {
+private:
+  const FieldDescriptor* m_field;
+  std::vector<std::unique_ptr<Builder>> m_children;
+  Validity m_validity;
+  std::int64_t m_length = 0;
+
+public:
+  StructBuilder(const ArrowSchema& schema, const Descriptor* descriptor, const FieldDescriptor* field)
+      : m_field(field) {
+    for (std::int64_t i = 0; i < schema.n_children; ++i) {
+      const ArrowSchema& child = *schema.children[i];
+      const std::string name = child.name != nullptr ? child.name : "";
+
+      const FieldDescriptor* child_field = descriptor->FindFieldByName(name);
+
+      if (child_field == nullptr) {
+        throw std::runtime_error("Arrow field \"" + name + "\" has no counterpart in message type \"" +
+                                 std::string(descriptor->full_name()) + "\"");
+      }
+
+      m_children.push_back(make_field_builder(child, child_field));
+    }
+  }
+
+  // Appends `message` itself as one struct slot.
+  void append_message(const Message& message) {
+    for (auto& child : m_children) {
+      child->append(message);
+    }
+
+    m_validity.append(true);
+    ++m_length;
+  }
+
+  void append(const Message& message) override {
+    if (tracks_presence(m_field) && !message.GetReflection()->HasField(message, m_field)) {
+      append_null();
+      return;
+    }
+
+    append_message(message.GetReflection()->GetMessage(message, m_field));
+  }
+
+  void append_element(const Message& message, int index) override {
+    append_message(message.GetReflection()->GetRepeatedMessage(message, m_field, index));
+  }
+
+  void append_null() override {
+    for (auto& child : m_children) {
+      child->append_null();
+    }
+
+    m_validity.append(false);
+    ++m_length;
+  }
+
+  void finish(ArrowArray* out) override {
+    std::vector<ArrowArray> children(m_children.size());
+
+    for (std::size_t i = 0; i < m_children.size(); ++i) {
+      m_children[i]->finish(&children[i]);
+    }
+
+    const std::int64_t null_count = m_validity.null_count();
+    export_array(out, m_length, null_count, {m_validity.finish()}, std::move(children));
+  }
+};
+
+
+// A repeated field becomes a list. Lists are never null: an unset repeated
+// field is an empty list, so only a null parent struct produces a null slot.
+// Maps use the same layout -- a list of key/value entry structs -- so this
+// builder serves both, with `m_items` reading the elements as a whole.
+class ListBuilder : public Builder {
+private:
+  const FieldDescriptor* m_field;
+  std::unique_ptr<Builder> m_items;
+  Validity m_validity;
+  std::vector<std::uint8_t> m_offsets;
+  std::size_t m_item_count = 0;
+  std::int64_t m_length = 0;
+
+public:
+  ListBuilder(const FieldDescriptor* field, std::unique_ptr<Builder> items)
+      : m_field(field), m_items(std::move(items)) {
+    append_value(m_offsets, std::int32_t{0});
+  }
+
+  void append(const Message& message) override {
+    const int size = message.GetReflection()->FieldSize(message, m_field);
+
+    for (int i = 0; i < size; ++i) {
+      m_items->append_element(message, i);
+    }
+
+    m_item_count += static_cast<std::size_t>(size);
+    append_value(m_offsets, checked_offset(m_item_count));
+    m_validity.append(true);
+    ++m_length;
+  }
+
+  void append_element(const Message& /*message*/, int /*index*/) override {
+    // protobuf has no repeated-of-repeated, so a list is never an element.
+    throw std::logic_error("a list cannot be an element of another list");
+  }
+
+  void append_null() override {
+    append_value(m_offsets, checked_offset(m_item_count));
+    m_validity.append(false);
+    ++m_length;
+  }
+
+  void finish(ArrowArray* out) override {
+    std::vector<ArrowArray> children(1);
+    m_items->finish(&children[0]);
+
+    const std::int64_t null_count = m_validity.null_count();
+    export_array(out, m_length, null_count, {m_validity.finish(), std::move(m_offsets)}, std::move(children));
+  }
+};
+
+
+inline std::string format_of(const ArrowSchema& schema) { return schema.format != nullptr ? schema.format : ""; }
+
+[[noreturn]] inline void throw_type_mismatch(const ArrowSchema& schema, const FieldDescriptor* field,
+                                             const std::string& expected) {
+  throw std::runtime_error("Arrow field \"" + std::string(field->name()) + "\" has format \"" + format_of(schema) +
+                           "\", but protobuf field \"" + std::string(field->full_name()) + "\" of type " +
+                           std::string(field->type_name()) + " needs \"" + expected + "\"");
+}
+
+// A builder for a single (non-repeated) value of `field` in the Arrow type
+// that `schema` describes, or for one element if `field` is repeated.
+inline std::unique_ptr<Builder> make_value_builder(const ArrowSchema& schema, const FieldDescriptor* field) {
+  const std::string format = format_of(schema);
+
+  const auto expect = [&](const char* expected) {
+    if (format != expected || schema.dictionary != nullptr) throw_type_mismatch(schema, field, expected);
+  };
+
+  switch (field->type()) {
+    case FieldDescriptor::TYPE_INT32:
+    case FieldDescriptor::TYPE_SINT32:
+    case FieldDescriptor::TYPE_SFIXED32:
+      expect("i");
+      return std::make_unique<Int32Builder>(field);
+    case FieldDescriptor::TYPE_INT64:
+    case FieldDescriptor::TYPE_SINT64:
+    case FieldDescriptor::TYPE_SFIXED64:
+      expect("l");
+      return std::make_unique<Int64Builder>(field);
+    case FieldDescriptor::TYPE_UINT32:
+    case FieldDescriptor::TYPE_FIXED32:
+      expect("I");
+      return std::make_unique<UInt32Builder>(field);
+    case FieldDescriptor::TYPE_UINT64:
+    case FieldDescriptor::TYPE_FIXED64:
+      expect("L");
+      return std::make_unique<UInt64Builder>(field);
+    case FieldDescriptor::TYPE_FLOAT:
+      expect("f");
+      return std::make_unique<FloatBuilder>(field);
+    case FieldDescriptor::TYPE_DOUBLE:
+      expect("g");
+      return std::make_unique<DoubleBuilder>(field);
+    case FieldDescriptor::TYPE_BOOL:
+      expect("b");
+      return std::make_unique<BoolBuilder>(field);
+    case FieldDescriptor::TYPE_STRING:
+      expect("u");
+      return std::make_unique<BinaryBuilder>(field);
+    case FieldDescriptor::TYPE_BYTES:
+      expect("z");
+      return std::make_unique<BinaryBuilder>(field);
+    case FieldDescriptor::TYPE_ENUM:
+      if (format != "i" || schema.dictionary == nullptr || format_of(*schema.dictionary) != "u") {
+        throw_type_mismatch(schema, field, "dictionary(i, u)");
+      }
+      return std::make_unique<EnumBuilder>(field);
+    case FieldDescriptor::TYPE_MESSAGE:
+    case FieldDescriptor::TYPE_GROUP:
+      expect("+s");
+      return std::make_unique<StructBuilder>(schema, field->message_type(), field);
+  }
+
+  throw_type_mismatch(schema, field, "a supported type");
+}
+
+inline std::unique_ptr<Builder> make_field_builder(const ArrowSchema& schema, const FieldDescriptor* field) {
+  if (field->is_map()) {
+    // map<K, V> is "+m" with a single non-null "entries" struct child, whose
+    // two children line up with the map entry message's key and value.
+    if (format_of(schema) != "+m" || schema.n_children != 1) throw_type_mismatch(schema, field, "+m");
+
+    const ArrowSchema& entries = *schema.children[0];
+
+    return std::make_unique<ListBuilder>(field, std::make_unique<StructBuilder>(entries, field->message_type(), field));
+  }
+
+  if (field->is_repeated()) {
+    if (format_of(schema) != "+l" || schema.n_children != 1) throw_type_mismatch(schema, field, "+l");
+
+    return std::make_unique<ListBuilder>(field, make_value_builder(*schema.children[0], field));
+  }
+
+  return make_value_builder(schema, field);
+}
+
+
+// Decodes every item of `data` as `message_type` into one struct array laid
+// out as `schema` describes -- the form in which Arrow passes a record batch
+// over the C data interface. Every field of `schema` must name a field of the
+// message with a matching type; message fields that `schema` leaves out are
+// skipped in the wire format without being parsed.
+inline void to_arrow(Context& context, const std::string& message_type, const std::vector<std::string_view>& data,
+                     const ArrowSchema& schema, ArrowArray* out) {
+  if (format_of(schema) != "+s") {
+    throw std::runtime_error("Arrow schema must describe a struct (format \"+s\"), not \"" + format_of(schema) + "\"");
+  }
+
+  StructBuilder builder(schema, context.message_descriptor(message_type), nullptr);
+
+  // only the fields of the schema are parsed, the others are skipped
+  std::vector<std::string> fields;
+  fields.reserve(schema.n_children);
+
+  for (std::int64_t i = 0; i < schema.n_children; ++i) {
+    fields.emplace_back(schema.children[i]->name != nullptr ? schema.children[i]->name : "");
+  }
+
+  context.parse_many(
+      message_type, data, [&](std::size_t /*index*/, const Message& message) { builder.append_message(message); },
+      fields);
+
+  builder.finish(out);
+}
+
+// --- Arrow to protobuf ---
+//
+// The readers mirror the builders above: each is bound to one protobuf field
+// and one Arrow array and copies slots of the array into messages. Indices
+// passed to a reader are logical indices into its array; the array's own
+// offset is applied inside, so sliced batches read correctly.
+
+inline bool is_valid(const ArrowArray& array, std::int64_t index) {
+  if (array.null_count == 0 || array.buffers[0] == nullptr) return true;
+
+  const std::int64_t bit = array.offset + index;
+  const auto* bitmap = static_cast<const std::uint8_t*>(array.buffers[0]);
+  return (bitmap[bit / 8] >> (bit % 8)) & 1;
+}
+
+template <typename T>
+T value_at(const ArrowArray& array, int buffer, std::int64_t index) {
+  T value;
+  std::memcpy(&value, static_cast<const std::uint8_t*>(array.buffers[buffer]) + (array.offset + index) * sizeof(T),
+              sizeof(T));
+  return value;
+}
+
+inline bool bit_at(const ArrowArray& array, int buffer, std::int64_t index) {
+  const std::int64_t bit = array.offset + index;
+  const auto* bitmap = static_cast<const std::uint8_t*>(array.buffers[buffer]);
+  return (bitmap[bit / 8] >> (bit % 8)) & 1;
+}
+
+
+class Reader {
+public:
+  virtual ~Reader() = default;
+
+  // Sets the field in `message` from slot `index`; a null slot leaves it unset.
+  virtual void read(Message& message, std::int64_t index) = 0;
+
+  // Appends slot `index` to the repeated field in `message`.
+  virtual void add(Message& message, std::int64_t index) = 0;
+};
+
+
+[[noreturn]] inline void throw_null_element(const FieldDescriptor* field) {
+  throw std::runtime_error("Repeated field \"" + std::string(field->full_name()) + "\" cannot hold a null element");
+}
+
+
+template <typename T, void (Reflection::*Set)(Message*, const FieldDescriptor*, T) const,
+          void (Reflection::*Add)(Message*, const FieldDescriptor*, T) const>
+class PrimitiveReader : public Reader {
+private:
+  const FieldDescriptor* m_field;
+  const ArrowArray& m_array;
+
+public:
+  PrimitiveReader(const FieldDescriptor* field, const ArrowArray& array) : m_field(field), m_array(array) {}
+
+  void read(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) return;
+    (message.GetReflection()->*Set)(&message, m_field, value_at<T>(m_array, 1, index));
+  }
+
+  void add(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) throw_null_element(m_field);
+    (message.GetReflection()->*Add)(&message, m_field, value_at<T>(m_array, 1, index));
+  }
+};
+
+using Int32Reader = PrimitiveReader<std::int32_t, &Reflection::SetInt32, &Reflection::AddInt32>;
+using Int64Reader = PrimitiveReader<std::int64_t, &Reflection::SetInt64, &Reflection::AddInt64>;
+using UInt32Reader = PrimitiveReader<std::uint32_t, &Reflection::SetUInt32, &Reflection::AddUInt32>;
+using UInt64Reader = PrimitiveReader<std::uint64_t, &Reflection::SetUInt64, &Reflection::AddUInt64>;
+using FloatReader = PrimitiveReader<float, &Reflection::SetFloat, &Reflection::AddFloat>;
+using DoubleReader = PrimitiveReader<double, &Reflection::SetDouble, &Reflection::AddDouble>;
+
+
+class BoolReader : public Reader {
+private:
+  const FieldDescriptor* m_field;
+  const ArrowArray& m_array;
+
+public:
+  BoolReader(const FieldDescriptor* field, const ArrowArray& array) : m_field(field), m_array(array) {}
+
+  void read(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) return;
+    message.GetReflection()->SetBool(&message, m_field, bit_at(m_array, 1, index));
+  }
+
+  void add(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) throw_null_element(m_field);
+    message.GetReflection()->AddBool(&message, m_field, bit_at(m_array, 1, index));
+  }
+};
+
+
+inline std::string string_at(const ArrowArray& array, std::int64_t index) {
+  const auto begin = value_at<std::int32_t>(array, 1, index);
+  const auto end = value_at<std::int32_t>(array, 1, index + 1);
+  const auto* data = static_cast<const char*>(array.buffers[2]);
+  return std::string(data + begin, data + end);
+}
+
+
+class BinaryReader : public Reader {
+private:
+  const FieldDescriptor* m_field;
+  const ArrowArray& m_array;
+
+public:
+  BinaryReader(const FieldDescriptor* field, const ArrowArray& array) : m_field(field), m_array(array) {}
+
+  void read(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) return;
+    message.GetReflection()->SetString(&message, m_field, string_at(m_array, index));
+  }
+
+  void add(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) throw_null_element(m_field);
+    message.GetReflection()->AddString(&message, m_field, string_at(m_array, index));
+  }
+};
+
+
+// The dictionary holds enum value names; it is resolved to numbers once, when
+// the reader is created, so rows only translate an index. A name the enum
+// does not declare is only an error once a row actually uses it.
+class EnumReader : public Reader {
+private:
+  const FieldDescriptor* m_field;
+  const ArrowArray& m_array;
+  std::vector<std::optional<int>> m_numbers;
+
+  int number_at(std::int64_t index) const {
+    const auto position = value_at<std::int32_t>(m_array, 1, index);
+    const std::optional<int>& number = m_numbers.at(static_cast<std::size_t>(position));
+
+    if (!number) {
+      throw std::runtime_error("\"" + string_at(*m_array.dictionary, position) + "\" is not a value of enum \"" +
+                               std::string(m_field->enum_type()->full_name()) + "\"");
+    }
+
+    return *number;
+  }
+
+public:
+  EnumReader(const FieldDescriptor* field, const ArrowArray& array) : m_field(field), m_array(array) {
+    const ArrowArray& dictionary = *array.dictionary;
+
+    for (std::int64_t i = 0; i < dictionary.length; ++i) {
+      const EnumValueDescriptor* value =
+          is_valid(dictionary, i) ? field->enum_type()->FindValueByName(string_at(dictionary, i)) : nullptr;
+
+      m_numbers.push_back(value != nullptr ? std::optional<int>(value->number()) : std::nullopt);
+    }
+  }
+
+  void read(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) return;
+    message.GetReflection()->SetEnumValue(&message, m_field, number_at(index));
+  }
+
+  void add(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) throw_null_element(m_field);
+    message.GetReflection()->AddEnumValue(&message, m_field, number_at(index));
+  }
+};
+
+
+std::unique_ptr<Reader> make_field_reader(const ArrowSchema& schema, const ArrowArray& array,
+                                          const FieldDescriptor* field);
+
+
+// Reads the children of a struct array into the fields of the same name.
+// `m_field` is null for the root, which reads into the message it is given.
+class StructReader : public Reader {
+private:
+  const FieldDescriptor* m_field;
+  const ArrowArray& m_array;
+  std::vector<std::unique_ptr<Reader>> m_children;
+
+public:
+  StructReader(const ArrowSchema& schema, const ArrowArray& array, const Descriptor* descriptor,
+               const FieldDescriptor* field)
+      : m_field(field), m_array(array) {
+    for (std::int64_t i = 0; i < schema.n_children; ++i) {
+      const ArrowSchema& child = *schema.children[i];
+      const std::string name = child.name != nullptr ? child.name : "";
+
+      const FieldDescriptor* child_field = descriptor->FindFieldByName(name);
+
+      if (child_field == nullptr) {
+        throw std::runtime_error("Arrow field \"" + name + "\" has no counterpart in message type \"" +
+                                 std::string(descriptor->full_name()) + "\"");
+      }
+
+      m_children.push_back(make_field_reader(child, *array.children[i], child_field));
+    }
+  }
+
+  // Copies slot `index` into `message` itself.
+  void read_into(Message& message, std::int64_t index) {
+    // Struct children are indexed with the parent's offset already applied.
+    for (auto& child : m_children) {
+      child->read(message, m_array.offset + index);
+    }
+  }
+
+  void read(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) return;
+    read_into(*message.GetReflection()->MutableMessage(&message, m_field), index);
+  }
+
+  void add(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) throw_null_element(m_field);
+    read_into(*message.GetReflection()->AddMessage(&message, m_field), index);
+  }
+};
+
+
+// Lists and maps: every element between the slot's two offsets is appended
+// to the repeated field. A null list leaves the field empty.
+class ListReader : public Reader {
+private:
+  const ArrowArray& m_array;
+  std::unique_ptr<Reader> m_items;
+
+public:
+  ListReader(const ArrowArray& array, std::unique_ptr<Reader> items) : m_array(array), m_items(std::move(items)) {}
+
+  void read(Message& message, std::int64_t index) override {
+    if (!is_valid(m_array, index)) return;
+
+    const auto begin = value_at<std::int32_t>(m_array, 1, index);
+    const auto end = value_at<std::int32_t>(m_array, 1, index + 1);
+
+    for (std::int64_t item = begin; item < end; ++item) {
+      m_items->add(message, item);
+    }
+  }
+
+  void add(Message& /*message*/, std::int64_t /*index*/) override {
+    // protobuf has no repeated-of-repeated, so a list is never an element.
+    throw std::logic_error("a list cannot be an element of another list");
+  }
+};
+
+
+inline std::unique_ptr<Reader> make_value_reader(const ArrowSchema& schema, const ArrowArray& array,
+                                                 const FieldDescriptor* field) {
+  const std::string format = format_of(schema);
+
+  const auto expect = [&](const char* expected) {
+    if (format != expected || schema.dictionary != nullptr) throw_type_mismatch(schema, field, expected);
+  };
+
+  switch (field->type()) {
+    case FieldDescriptor::TYPE_INT32:
+    case FieldDescriptor::TYPE_SINT32:
+    case FieldDescriptor::TYPE_SFIXED32:
+      expect("i");
+      return std::make_unique<Int32Reader>(field, array);
+    case FieldDescriptor::TYPE_INT64:
+    case FieldDescriptor::TYPE_SINT64:
+    case FieldDescriptor::TYPE_SFIXED64:
+      expect("l");
+      return std::make_unique<Int64Reader>(field, array);
+    case FieldDescriptor::TYPE_UINT32:
+    case FieldDescriptor::TYPE_FIXED32:
+      expect("I");
+      return std::make_unique<UInt32Reader>(field, array);
+    case FieldDescriptor::TYPE_UINT64:
+    case FieldDescriptor::TYPE_FIXED64:
+      expect("L");
+      return std::make_unique<UInt64Reader>(field, array);
+    case FieldDescriptor::TYPE_FLOAT:
+      expect("f");
+      return std::make_unique<FloatReader>(field, array);
+    case FieldDescriptor::TYPE_DOUBLE:
+      expect("g");
+      return std::make_unique<DoubleReader>(field, array);
+    case FieldDescriptor::TYPE_BOOL:
+      expect("b");
+      return std::make_unique<BoolReader>(field, array);
+    case FieldDescriptor::TYPE_STRING:
+      expect("u");
+      return std::make_unique<BinaryReader>(field, array);
+    case FieldDescriptor::TYPE_BYTES:
+      expect("z");
+      return std::make_unique<BinaryReader>(field, array);
+    case FieldDescriptor::TYPE_ENUM:
+      if (format != "i" || schema.dictionary == nullptr || format_of(*schema.dictionary) != "u") {
+        throw_type_mismatch(schema, field, "dictionary(i, u)");
+      }
+      return std::make_unique<EnumReader>(field, array);
+    case FieldDescriptor::TYPE_MESSAGE:
+    case FieldDescriptor::TYPE_GROUP:
+      expect("+s");
+      return std::make_unique<StructReader>(schema, array, field->message_type(), field);
+  }
+
+  throw_type_mismatch(schema, field, "a supported type");
+}
+
+inline std::unique_ptr<Reader> make_field_reader(const ArrowSchema& schema, const ArrowArray& array,
+                                                 const FieldDescriptor* field) {
+  if (field->is_map()) {
+    if (format_of(schema) != "+m" || schema.n_children != 1) throw_type_mismatch(schema, field, "+m");
+
+    return std::make_unique<ListReader>(
+        array, std::make_unique<StructReader>(*schema.children[0], *array.children[0], field->message_type(), field));
+  }
+
+  if (field->is_repeated()) {
+    if (format_of(schema) != "+l" || schema.n_children != 1) throw_type_mismatch(schema, field, "+l");
+
+    return std::make_unique<ListReader>(array, make_value_reader(*schema.children[0], *array.children[0], field));
+  }
+
+  return make_value_reader(schema, array, field);
+}
+
+
+// Encodes every row of the struct array `array` -- a record batch as the C
+// data interface passes it -- as one `message_type` message. Every field of
+// `schema` must name a field of the message with a matching type; message
+// fields the batch has no column for are left unset, as are null slots.
+inline std::vector<std::string> from_arrow(Context& context, const std::string& message_type, const ArrowSchema& schema,
+                                           const ArrowArray& array) {
+  if (format_of(schema) != "+s") {
+    throw std::runtime_error("Arrow schema must describe a struct (format \"+s\"), not \"" + format_of(schema) + "\"");
+  }
+
+  StructReader reader(schema, array, context.message_descriptor(message_type), nullptr);
+
+  return context.serialize_many(
+      message_type, static_cast<std::size_t>(array.length),
+      [&](std::size_t index, Message& message) { reader.read_into(message, static_cast<std::int64_t>(index)); });
+}
+
+
+}  // namespace arrow
+
+}  // namespace protosaurus
@@ -0,0 +1,191 @@
+#pragma once
+
+#include <protosaurus/protosaurus.h>
+#include <protosaurus/view.h>
+
+#include <cstddef>      // size_t
+#include <cstdint>      // int64_t, uint64_t, int32_t, uint32_t
+#include <stdexcept>    // runtime_error
+#include <string>       // string, to_string
+#include <string_view>  // string_view
+#include <vector>       // vector
+
+// Reading one scalar field out of many wire format messages into a column,
+// such as a double from every message of a batch. Each message is walked at
+// the tag level down the path to the field, so only that field's values are
+// decoded and nothing is allocated per message.
+
+namespace protosaurus {
+
+// How many fields deep a column path may lead, protobuf's default recursion
+// limit: it does not parse messages nested any deeper.
+inline constexpr std::size_t MAX_COLUMN_DEPTH = 100;
+
+
+// A singular numeric, bool or enum field, reached from a message type through
+// singular submessages.
+struct ColumnPath {
+  const Descriptor* message_type;
+  // The field numbers from the message down to the field.
+  std::vector<int> numbers;
+  const FieldDescriptor* field;
+};
+
+
+// Resolves the dotted field path `path`, as for Context::to_json's fields, in
+// the message type `descriptor`. Throws std::runtime_error if it does not lead
+// to a field that read_column can read.
+inline ColumnPath resolve_column(const Descriptor* descriptor, const std::string& path) {
+  auto fail = [&](const std::string& reason) {
+    throw std::runtime_error("Invalid column path \"" + path + "\": " + reason);
+  };
+
+  ColumnPath column{descriptor, {}, nullptr};
+  const Descriptor* current = descriptor;
+  std::size_t begin = 0;
+
+  while (true) {
+    const std::size_t dot = path.find('.', begin);
+    const std::string_view name = std::string_view(path).substr(begin, dot - begin);
+
+    if (current == nullptr) {
+      fail("field \"" + std::string(column.field->full_name()) + "\" is not a message");
+    }
+
+    column.field = find_field(current, name);
+
+    if (column.field == nullptr) {
+      fail("message type \"" + std::string(current->full_name()) + "\" has no field named \"" + std::string(name) +
+           "\"");
+    }
+
+    if (column.field->type() == FieldDescriptor::TYPE_GROUP) {
+      fail("field \"" + std::string(column.field->full_name()) + "\" is a group, which columns do not support");
+    }
+
+    if (column.field->is_repeated()) {
+      fail("field \"" + std::string(column.field->full_name()) + "\" is repeated, so it has no single value");
+    }
+
+    column.numbers.push_back(column.field->number());
+
+    if (column.numbers.size() > MAX_COLUMN_DEPTH) {
+      fail("it is more than " + std::to_string(MAX_COLUMN_DEPTH) + " fields deep");
+    }
+
+    if (dot == std::string::npos) break;
+
+    current = column.field->message_type();
+    begin = dot + 1;
+  }
+
+  if (column.field->cpp_type() == FieldDescriptor::CPPTYPE_STRING ||
+      column.field->cpp_type() == FieldDescriptor::CPPTYPE_MESSAGE) {
+    fail("field \"" + std::string(column.field->full_name()) + "\" is of type " +
+         std::string(column.field->type_name()) + ", not a number, bool or enum");
+  }
+
+  return column;
+}
+
+
+// The default of `field`, whose C++ type is T -- int32_t for an enum.
+template <typename T>
+T column_default(const FieldDescriptor* field) {
+  switch (field->cpp_type()) {
+    case FieldDescriptor::CPPTYPE_INT32:
+      return static_cast<T>(field->default_value_int32());
+    case FieldDescriptor::CPPTYPE_INT64:
+      return static_cast<T>(field->default_value_int64());
+    case FieldDescriptor::CPPTYPE_UINT32:
+      return static_cast<T>(field->default_value_uint32());
+    case FieldDescriptor::CPPTYPE_UINT64:
+      return static_cast<T>(field->default_value_uint64());
+    case FieldDescriptor::CPPTYPE_FLOAT:
+      return static_cast<T>(field->default_value_float());
+    case FieldDescriptor::CPPTYPE_DOUBLE:
+      return static_cast<T>(field->default_value_double());
+    case FieldDescriptor::CPPTYPE_BOOL:
+      return static_cast<T>(field->default_value_bool());
+    case FieldDescriptor::CPPTYPE_ENUM:
+      return static_cast<T>(field->default_value_enum()->number());
+    default:
+      return T();
+  }
+}
+
+
+// Reads the last value of the field at column.numbers[depth:] of the message
+// `data` into `value`, and returns whether there was one. The occurrences of
+// a submessage merge, so reading them one after another finds the value the
+// merged message holds. This recurses once per submessage on the path, which
+// resolve_column keeps to MAX_COLUMN_DEPTH.
+template <typename T>
+bool read_column_value(std::string_view data, const ColumnPath& column, std::size_t depth, T& value) {
+  const int number = column.numbers[depth];
+  const bool leaf = depth + 1 == column.numbers.size();
+  const int wire_type = wire_type_of(column.field->type());
+
+  bool found = false;
+  std::size_t position = 0;
+
+  while (position < data.size()) {
+    const Varint tag = read_varint(data, position);
+    const std::size_t end = skip_field(data, tag.offset, tag.value);
+
+    if (static_cast<int>(tag.value >> 3) == number) {
+      const auto tag_wire_type = static_cast<int>(tag.value & 7);
+
+      if (!leaf) {
+        if (tag_wire_type == 2) {
+          const Varint length = read_varint(data, tag.offset);
+          found = read_column_value(data.substr(length.offset, length.value), column, depth + 1, value) || found;
+        }
+      } else if (tag_wire_type == wire_type) {
+        auto visit = [&](auto v) { value = static_cast<T>(v); };
+        read_scalar(data.substr(tag.offset, end - tag.offset), column.field->type(), visit);
+        found = true;
+      }
+      // any other wire type makes it an unknown field, as for protobuf
+    }
+
+    position = end;
+  }
+
+  return found;
+}
+
+
+// Reads the field at `column` from every item of `data`: values[i] gets its
+// last value, as when protobuf parses the message, or its default if it is
+// not set, and present[i], unless present is null, whether it is set. T must
+// be the field's C++ type, int32_t for an enum. With more than one worker,
+// the batch is split across threads as run_in_parallel describes. Throws
+// std::runtime_error, naming the position, for an item that is not valid
+// wire format along the path.
+template <typename T>
+void read_column(const ColumnPath& column, const std::vector<std::string_view>& data, T* values, bool* present,
+                 std::size_t workers = 1) {
+  const T default_value = column_default<T>(column.field);
+
+  run_in_parallel(data.size(), workers, [&](std::size_t begin, std::size_t end) {
+    for (std::size_t i = begin; i < end; ++i) {
+      T value = default_value;
+      bool found = false;
+
+      try {
+        found = read_column_value(data[i], column, 0, value);
+      } catch (const std::runtime_error&) {
+        throw std::runtime_error("Payload " + std::to_string(i) + ": Could not parse " +
+                                 std::to_string(data[i].size()) + " bytes as message type \"" +
+                                 std::string(column.message_type->full_name()) +
+                                 "\": the data is not valid protobuf wire format");
+      }
+
+      values[i] = value;
+      if (present != nullptr) present[i] = found;
+    }
+  });
+}
+
+}  // namespace protosaurus
@@ -0,0 +1,865 @@
+#pragma once
+
+#include <protosaurus/protosaurus.h>
+
+#include <bit>           // bit_cast
+#include <cctype>        // isalpha, isalnum, isdigit, isspace
+#include <charconv>      // from_chars
+#include <compare>       // partial_ordering
+#include <cstddef>       // size_t
+#include <cstdint>       // int64_t, uint64_t, int32_t, uint32_t
+#include <limits>        // numeric_limits
+#include <stdexcept>     // runtime_error
+#include <string>        // string, to_string
+#include <string_view>   // string_view
+#include <system_error>  // errc
+#include <utility>       // move
+#include <vector>        // vector
+
+// Predicates over wire format messages, such as
+//
+//   status == "FAILED" and region in ("eu", "us")
+//
+// evaluated against the encoded bytes without parsing the message: every
+// comparison walks the tags of the payload and decodes only the field it
+// names. An expression compares fields, addressed by dotted paths as for
+// Context::to_json's fields, with literals -- "strings" or 'strings',
+// integers, floats, true and false -- using ==, !=, <, <=, >, >=, in (...) and
+// not in (...), and combines comparisons with and, or, not and parentheses.
+// An enum field compares with the name of a value or its number.
+//
+// A field that is not set compares as its default, like protobuf returns it,
+// also in every element of a repeated message the path leads through.
+// A field that is repeated, or reached through a repeated field, matches if
+// any of its values does; != and not in are the negations of == and in, so
+// they match if none does.
+
+namespace protosaurus {
+
+// The comparison a filter makes, with != and not in expressed as a negated ==
+// and in.
+enum class FilterOp { eq, lt, le, gt, ge, in };
+
+// A value read from the wire. Only the member of the field's kind is
+// meaningful.
+struct FilterValue {
+  enum class Kind { signed_integer, unsigned_integer, floating, bytes };
+
+  std::int64_t signed_integer = 0;
+  std::uint64_t unsigned_integer = 0;
+  double floating = 0;
+  std::string_view bytes;
+};
+
+// A literal of an expression, converted to the type of the field it is
+// compared with.
+struct FilterLiteral {
+  std::int64_t signed_integer = 0;
+  std::uint64_t unsigned_integer = 0;
+  double floating = 0;
+  std::string bytes;
+};
+
+class MessageFilter {
+public:
+  const std::string& message_type() const { return m_message_type; }
+
+  const std::string& expression() const { return m_expression; }
+
+  // Whether the wire format message `data` matches. Throws std::runtime_error
+  // if the data is not valid wire format where the filter reads it; the rest
+  // of the message is only checked for its framing.
+  bool matches(std::string_view data) const {
+    try {
+      return evaluate(m_root, data);
+    } catch (const std::runtime_error&) {
+      throw std::runtime_error("Could not parse " + std::to_string(data.size()) + " bytes as message type \"" +
+                               m_message_type + "\": the data is not valid protobuf wire format");
+    }
+  }
+
+  // The positions of the items of `data` that match, in order. With more than
+  // one worker, the batch is split across threads as run_in_parallel
+  // describes. An invalid payload is reported with its position prepended.
+  std::vector<std::size_t> filter_many(const std::vector<std::string_view>& data, std::size_t workers = 1) const {
+    std::vector<char> matched(data.size());
+
+    run_in_parallel(data.size(), workers, [&](std::size_t begin, std::size_t end) {
+      for (std::size_t i = begin; i < end; ++i) {
+        try {
+          matched[i] = matches(data[i]);
+        } catch (const std::runtime_error& e) {
+          throw std::runtime_error("Payload " + std::to_string(i) + ": " + e.what());
+        }
+      }
+    });
+
+    std::vector<std::size_t> out;
+
+    for (std::size_t i = 0; i < matched.size(); ++i) {
+      if (matched[i]) out.push_back(i);
+    }
+
+    return out;
+  }
+
+private:
+  struct Comparison {
+    // The field numbers from the message down to the compared field.
+    std::vector<int> path;
+    // Whether the compared field is repeated, so that a message holds any
+    // number of its values rather than exactly one.
+    bool repeated = false;
+    // The depth below the last repeated message on the path, if any: every
+    // element of that field is a message of its own, with its own value or
+    // default of the compared field.
+    std::size_t element_depth = 0;
+    FieldDescriptor::Type type = FieldDescriptor::TYPE_INT64;
+    FilterValue::Kind kind = FilterValue::Kind::signed_integer;
+    FilterOp op = FilterOp::eq;
+    bool negated = false;
+    std::vector<FilterLiteral> values;
+    // What an unset singular field reads as.
+    FilterLiteral default_value;
+  };
+
+  struct Node {
+    enum class Kind { all, any, negation, comparison };
+
+    Kind kind = Kind::comparison;
+    std::vector<Node> children;
+    Comparison comparison;
+  };
+
+  std::string m_message_type;
+  std::string m_expression;
+  Node m_root;
+
+  friend class FilterCompiler;
+
+  // Reads one value of `type` from the start of `data`, written with the
+  // field's own wire type, and returns the position after it.
+  static std::size_t read_value(std::string_view data, FieldDescriptor::Type type, FilterValue& value) {
+    switch (wire_type_of(type)) {
+      case 1: {
+        const std::uint64_t bits = read_fixed(data, 8);
+        value.unsigned_integer = bits;
+        value.signed_integer = static_cast<std::int64_t>(bits);
+        value.floating = std::bit_cast<double>(bits);
+        return 8;
+      }
+      case 2: {
+        const Varint length = read_varint(data, 0);
+        if (data.size() - length.offset < length.value) throw MalformedWire();
+        value.bytes = data.substr(length.offset, length.value);
+        return length.offset + length.value;
+      }
+      case 5: {
+        const auto bits = static_cast<std::uint32_t>(read_fixed(data, 4));
+        value.unsigned_integer = bits;
+        value.signed_integer = static_cast<std::int32_t>(bits);
+        value.floating = std::bit_cast<float>(bits);
+        return 4;
+      }
+    }
+
+    const Varint varint = read_varint(data, 0);
+
+    switch (type) {
+      case FieldDescriptor::TYPE_INT32:
+      case FieldDescriptor::TYPE_ENUM:
+        value.signed_integer = static_cast<std::int32_t>(varint.value);
+        break;
+      case FieldDescriptor::TYPE_SINT32:
+        value.signed_integer = static_cast<std::int32_t>(zigzag_decode(varint.value));
+        break;
+      case FieldDescriptor::TYPE_SINT64:
+        value.signed_integer = zigzag_decode(varint.value);
+        break;
+      case FieldDescriptor::TYPE_UINT32:
+        value.unsigned_integer = static_cast<std::uint32_t>(varint.value);
+        break;
+      case FieldDescriptor::TYPE_BOOL:
+        value.unsigned_integer = varint.value != 0;
+        break;
+      default:
+        value.signed_integer = static_cast<std::int64_t>(varint.value);
+        value.unsigned_integer = varint.value;
+    }
+
+    return varint.offset;
+  }
+
+  // Calls on_value(value) for every value of the field at c.path[depth:] in
+  // the message `data`, in wire order, and on_element(element) for every
+  // element of the last repeated message on the path instead of descending
+  // into it.
+  template <typename OnValue, typename OnElement>
+  static void visit_values(std::string_view data, const Comparison& c, std::size_t depth, OnValue& on_value,
+                           OnElement& on_element) {
+    const int number = c.path[depth];
+    const bool leaf = depth + 1 == c.path.size();
+
+    std::size_t position = 0;
+
+    while (position < data.size()) {
+      const Varint tag = read_varint(data, position);
+      const std::size_t end = skip_field(data, tag.offset, tag.value);
+
+      if (static_cast<int>(tag.value >> 3) == number) {
+        const auto wire_type = static_cast<int>(tag.value & 7);
+        const std::string_view value = data.substr(tag.offset, end - tag.offset);
+
+        if (!leaf) {
+          if (wire_type == 2) {
+            const Varint length = read_varint(value, 0);
+            const std::string_view message = value.substr(length.offset);
+
+            if (depth + 1 == c.element_depth) {
+              on_element(message);
+            } else {
+              // the occurrences of a singular message merge, so reading them
+              // one after another reads the merged message
+              visit_values(message, c, depth + 1, on_value, on_element);
+            }
+          }
+        } else if (wire_type == wire_type_of(c.type)) {
+          FilterValue v;
+          read_value(value, c.type, v);
+          on_value(v);
+        } else if (wire_type == 2) {
+          // a packed run of scalars
+          const Varint length = read_varint(value, 0);
+          std::string_view values = value.substr(length.offset);
+
+          while (!values.empty()) {
+            FilterValue v;
+            values.remove_prefix(read_value(values, c.type, v));
+            on_value(v);
+          }
+        }
+        // any other wire type makes it an unknown field, as for protobuf
+      }
+
+      position = end;
+    }
+  }
+
+  static std::partial_ordering compare(FilterValue::Kind kind, const FilterValue& a, const FilterLiteral& b) {
+    switch (kind) {
+      case FilterValue::Kind::signed_integer:
+        return a.signed_integer <=> b.signed_integer;
+      case FilterValue::Kind::unsigned_integer:
+        return a.unsigned_integer <=> b.unsigned_integer;
+      case FilterValue::Kind::floating:
+        return a.floating <=> b.floating;
+      case FilterValue::Kind::bytes:
+        return a.bytes <=> b.bytes;
+    }
+
+    return std::partial_ordering::unordered;
+  }
+
+  static bool test(const Comparison& c, const FilterValue& value) {
+    switch (c.op) {
+      case FilterOp::eq:
+        return compare(c.kind, value, c.values[0]) == 0;
+      case FilterOp::lt:
+        return compare(c.kind, value, c.values[0]) < 0;
+      case FilterOp::le:
+        return compare(c.kind, value, c.values[0]) <= 0;
+      case FilterOp::gt:
+        return compare(c.kind, value, c.values[0]) > 0;
+      case FilterOp::ge:
+        return compare(c.kind, value, c.values[0]) >= 0;
+      case FilterOp::in:
+        for (const FilterLiteral& candidate : c.values) {
+          if (compare(c.kind, value, candidate) == 0) return true;
+        }
+        return false;
+    }
+
+    return false;
+  }
+
+  // Whether any value of the compared field in `data`, a message at `depth` of
+  // the path, passes the comparison.
+  static bool any_value_passes(const Comparison& c, std::string_view data, std::size_t depth) {
+    bool result = false;
+    auto on_element = [&](std::string_view element) {
+      result = result || any_value_passes(c, element, c.element_depth);
+    };
+
+    if (c.repeated || depth < c.element_depth) {
+      auto on_value = [&](const FilterValue& value) { result = result || test(c, value); };
+      visit_values(data, c, depth, on_value, on_element);
+    } else {
+      // the last value wins, as when protobuf parses the message
+      const FilterLiteral& d = c.default_value;
+      FilterValue last{d.signed_integer, d.unsigned_integer, d.floating, d.bytes};
+      auto on_value = [&](const FilterValue& value) { last = value; };
+      visit_values(data, c, depth, on_value, on_element);
+      result = test(c, last);
+    }
+
+    return result;
+  }
+
+  static bool evaluate(const Comparison& c, std::string_view data) { return any_value_passes(c, data, 0) != c.negated; }
+
+  static bool evaluate(const Node& node, std::string_view data) {
+    switch (node.kind) {
+      case Node::Kind::all:
+        for (const Node& child : node.children) {
+          if (!evaluate(child, data)) return false;
+        }
+        return true;
+      case Node::Kind::any:
+        for (const Node& child : node.children) {
+          if (evaluate(child, data)) return true;
+        }
+        return false;
+      case Node::Kind::negation:
+        return !evaluate(node.children[0], data);
+      case Node::Kind::comparison:
+        return evaluate(node.comparison, data);
+    }
+
+    return false;
+  }
+};
+
+
+// Parses a filter expression and binds it to a message type. The grammar,
+// loosest binding first:
+//
+//   expression := conjunction ("or" conjunction)*
+//   conjunction := negation ("and" negation)*
+//   negation := "not" negation | "(" expression ")" | comparison
+//   comparison := path ("==" | "!=" | "<" | "<=" | ">" | ">=") literal
+//               | path ["not"] "in" "(" literal ("," literal)* ")"
+class FilterCompiler {
+private:
+  struct Token {
+    enum class Kind { end, path, string, integer, floating, symbol };
+
+    Kind kind = Kind::end;
+    // The text of a path, symbol or number, or the value of a string.
+    std::string text;
+    std::size_t position = 0;
+  };
+
+  const Descriptor* m_descriptor;
+  const std::string& m_message_type;
+  const std::string& m_expression;
+  std::size_t m_position = 0;
+  Token m_token;
+
+  [[noreturn]] void fail(const std::string& reason, std::size_t position) const {
+    throw std::runtime_error("Could not compile filter for message type \"" + m_message_type + "\": " + reason +
+                             " at position " + std::to_string(position));
+  }
+
+  [[noreturn]] void fail_unexpected(const std::string& expected) const {
+    if (m_token.kind == Token::Kind::end) {
+      fail("expected " + expected + ", found the end of the expression", m_token.position);
+    }
+
+    fail("expected " + expected + ", found \"" + m_expression.substr(m_token.position, m_position - m_token.position) +
+             "\"",
+         m_token.position);
+  }
+
+  static bool is_word_start(char c) { return std::isalpha(static_cast<unsigned char>(c)) || c == '_'; }
+
+  static bool is_word(char c) { return std::isalnum(static_cast<unsigned char>(c)) || c == '_'; }
+
+  static bool is_digit(char c) { return std::isdigit(static_cast<unsigned char>(c)); }
+
+  void next() {
+    const std::string& s = m_expression;
+
+    while (m_position < s.size() && std::isspace(static_cast<unsigned char>(s[m_position]))) {
+      ++m_position;
+    }
+
+    m_token = Token{Token::Kind::end, "", m_position};
+
+    if (m_position == s.size()) return;
+
+    const char c = s[m_position];
+
+    if (is_word_start(c)) {
+      // a dotted path, or a keyword
+      const std::size_t begin = m_position;
+
+      while (m_position < s.size() && (is_word(s[m_position]) || s[m_position] == '.')) {
+        ++m_position;
+      }
+
+      m_token.kind = Token::Kind::path;
+      m_token.text = s.substr(begin, m_position - begin);
+    } else if (is_digit(c) || ((c == '-' || c == '+') && m_position + 1 < s.size() &&
+                               (is_digit(s[m_position + 1]) || s[m_position + 1] == '.'))) {
+      const std::size_t begin = m_position++;
+      bool floating = false;
+
+      while (m_position < s.size()) {
+        const char d = s[m_position];
+
+        if (d == '.' || d == 'e' || d == 'E') {
+          floating = true;
+        } else if ((d == '-' || d == '+') && (s[m_position - 1] == 'e' || s[m_position - 1] == 'E')) {
+          // the sign of an exponent
+        } else if (!is_digit(d) && !is_word(d)) {
+          break;
+        }
+
+        ++m_position;
+      }
+
+      m_token.kind = floating ? Token::Kind::floating : Token::Kind::integer;
+      m_token.text = s.substr(begin, m_position - begin);
+    } else if (c == '"' || c == '\'') {
+      ++m_position;
+
+      while (true) {
+        if (m_position == s.size()) {
+          fail("unterminated string", m_token.position);
+        }
+
+        char d = s[m_position++];
+
+        if (d == c) break;
+
+        if (d == '\\') {
+          if (m_position == s.size()) {
+            fail("unterminated string", m_token.position);
+          }
+
+          switch (d = s[m_position++]) {
+            case 'n':
+              d = '\n';
+              break;
+            case 't':
+              d = '\t';
+              break;
+            case '\\':
+            case '"':
+            case '\'':
+              break;
+            default:
+              fail("unknown escape sequence \"\\" + std::string(1, d) + "\"", m_position - 2);
+          }
+        }
+
+        m_token.text += d;
+      }
+
+      m_token.kind = Token::Kind::string;
+    } else {
+      for (const char* symbol : {"==", "!=", "<=", ">=", "<", ">", "(", ")", ","}) {
+        if (s.compare(m_position, std::char_traits<char>::length(symbol), symbol) == 0) {
+          m_token.kind = Token::Kind::symbol;
+          m_token.text = symbol;
+          m_position += m_token.text.size();
+          return;
+        }
+      }
+
+      fail("unexpected character \"" + std::string(1, c) + "\"", m_position);
+    }
+  }
+
+  bool at(Token::Kind kind, std::string_view text) const { return m_token.kind == kind && m_token.text == text; }
+
+  bool at_keyword(std::string_view keyword) const { return at(Token::Kind::path, keyword); }
+
+  bool at_symbol(std::string_view symbol) const { return at(Token::Kind::symbol, symbol); }
+
+  void expect_symbol(std::string_view symbol) {
+    if (!at_symbol(symbol)) fail_unexpected("\"" + std::string(symbol) + "\"");
+    next();
+  }
+
+  MessageFilter::Node parse_expression() {
+    MessageFilter::Node node;
+    node.kind = MessageFilter::Node::Kind::any;
+    node.children.push_back(parse_conjunction());
+
+    while (at_keyword("or")) {
+      next();
+      node.children.push_back(parse_conjunction());
+    }
+
+    return node.children.size() == 1 ? std::move(node.children[0]) : node;
+  }
+
+  MessageFilter::Node parse_conjunction() {
+    MessageFilter::Node node;
+    node.kind = MessageFilter::Node::Kind::all;
+    node.children.push_back(parse_negation());
+
+    while (at_keyword("and")) {
+      next();
+      node.children.push_back(parse_negation());
+    }
+
+    return node.children.size() == 1 ? std::move(node.children[0]) : node;
+  }
+
+  MessageFilter::Node parse_negation() {
+    if (at_keyword("not")) {
+      next();
+
+      MessageFilter::Node node;
+      node.kind = MessageFilter::Node::Kind::negation;
+      node.children.push_back(parse_negation());
+      return node;
+    }
+
+    if (at_symbol("(")) {
+      next();
+      MessageFilter::Node node = parse_expression();
+      expect_symbol(")");
+      return node;
+    }
+
+    MessageFilter::Node node;
+    node.comparison = parse_comparison();
+    return node;
+  }
+
+  static bool is_keyword(std::string_view word) {
+    return word == "and" || word == "or" || word == "not" || word == "in" || word == "true" || word == "false";
+  }
+
+  MessageFilter::Comparison parse_comparison() {
+    if (m_token.kind != Token::Kind::path || is_keyword(m_token.text)) {
+      fail_unexpected("a field path");
+    }
+
+    MessageFilter::Comparison c;
+    const Token path = m_token;
+    const FieldDescriptor* field = resolve_path(path, c);
+    next();
+
+    std::vector<Token> literals;
+
+    if (at_keyword("in") || at_keyword("not")) {
+      if (at_keyword("not")) {
+        c.negated = true;
+        next();
+
+        if (!at_keyword("in")) fail_unexpected("\"in\"");
+      }
+
+      c.op = FilterOp::in;
+      next();
+      expect_symbol("(");
+
+      while (true) {
+        literals.push_back(parse_literal());
+
+        if (!at_symbol(",")) break;
+        next();
+      }
+
+      expect_symbol(")");
+    } else {
+      if (at_symbol("==")) {
+        c.op = FilterOp::eq;
+      } else if (at_symbol("!=")) {
+        c.op = FilterOp::eq;
+        c.negated = true;
+      } else if (at_symbol("<")) {
+        c.op = FilterOp::lt;
+      } else if (at_symbol("<=")) {
+        c.op = FilterOp::le;
+      } else if (at_symbol(">")) {
+        c.op = FilterOp::gt;
+      } else if (at_symbol(">=")) {
+        c.op = FilterOp::ge;
+      } else {
+        fail_unexpected("a comparison operator");
+      }
+
+      next();
+      literals.push_back(parse_literal());
+    }
+
+    for (const Token& literal : literals) {
+      c.values.push_back(convert(literal, field));
+    }
+
+    return c;
+  }
+
+  Token parse_literal() {
+    const bool literal = m_token.kind == Token::Kind::string || m_token.kind == Token::Kind::integer ||
+                         m_token.kind == Token::Kind::floating || at_keyword("true") || at_keyword("false");
+
+    if (!literal) fail_unexpected("a literal");
+
+    Token token = m_token;
+    next();
+    return token;
+  }
+
+  // Resolves the path of `token` to the field it ends in, and fills in what
+  // `c` needs to know about the path and that field.
+  const FieldDescriptor* resolve_path(const Token& token, MessageFilter::Comparison& c) const {
+    const Descriptor* current = m_descriptor;
+    const FieldDescriptor* field = nullptr;
+    std::size_t begin = 0;
+
+    while (true) {
+      const std::size_t dot = token.text.find('.', begin);
+      const std::string_view name = std::string_view(token.text).substr(begin, dot - begin);
+
+      if (current == nullptr) {
+        fail("field \"" + std::string(field->full_name()) + "\" is not a message", token.position);
+      }
+
+      field = find_field(current, name);
+
+      if (field == nullptr) {
+        fail("message type \"" + std::string(current->full_name()) + "\" has no field named \"" + std::string(name) +
+                 "\"",
+             token.position);
+      }
+
+      if (field->type() == FieldDescriptor::TYPE_GROUP) {
+        fail("field \"" + std::string(field->full_name()) + "\" is a group, which filters do not support",
+             token.position);
+      }
+
+      c.path.push_back(field->number());
+
+      if (dot == std::string::npos) {
+        c.repeated = field->is_repeated();
+        break;
+      }
+
+      if (field->is_repeated()) c.element_depth = c.path.size();
+
+      current = field->message_type();
+      begin = dot + 1;
+    }
+
+    if (field->type() == FieldDescriptor::TYPE_MESSAGE) {
+      fail("field \"" + std::string(field->full_name()) + "\" is a message, compare one of its fields instead",
+           token.position);
+    }
+
+    c.type = field->type();
+    c.kind = kind_of(field);
+
+    switch (field->cpp_type()) {
+      case FieldDescriptor::CPPTYPE_INT32:
+        c.default_value.signed_integer = field->default_value_int32();
+        break;
+      case FieldDescriptor::CPPTYPE_INT64:
+        c.default_value.signed_integer = field->default_value_int64();
+        break;
+      case FieldDescriptor::CPPTYPE_UINT32:
+        c.default_value.unsigned_integer = field->default_value_uint32();
+        break;
+      case FieldDescriptor::CPPTYPE_UINT64:
+        c.default_value.unsigned_integer = field->default_value_uint64();
+        break;
+      case FieldDescriptor::CPPTYPE_FLOAT:
+        c.default_value.floating = field->default_value_float();
+        break;
+      case FieldDescriptor::CPPTYPE_DOUBLE:
+        c.default_value.floating = field->default_value_double();
+        break;
+      case FieldDescriptor::CPPTYPE_BOOL:
+        c.default_value.unsigned_integer = field->default_value_bool();
+        break;
+      case FieldDescriptor::CPPTYPE_ENUM:
+        c.default_value.signed_integer = field->default_value_enum()->number();
+        break;
+      case FieldDescriptor::CPPTYPE_STRING:
+        c.default_value.bytes = field->default_value_string();
+        break;
+      case FieldDescriptor::CPPTYPE_MESSAGE:
+        break;
+    }
+
+    return field;
+  }
+
+  static FilterValue::Kind kind_of(const FieldDescriptor* field) {
+    switch (field->cpp_type()) {
+      case FieldDescriptor::CPPTYPE_UINT32:
+      case FieldDescriptor::CPPTYPE_UINT64:
+      case FieldDescriptor::CPPTYPE_BOOL:
+        return FilterValue::Kind::unsigned_integer;
+      case FieldDescriptor::CPPTYPE_FLOAT:
+      case FieldDescriptor::CPPTYPE_DOUBLE:
+        return FilterValue::Kind::floating;
+      case FieldDescriptor::CPPTYPE_STRING:
+        return FilterValue::Kind::bytes;
+      default:
+        return FilterValue::Kind::signed_integer;
+    }
+  }
+
+  template <typename T>
+  T parse_number(const Token& literal, const FieldDescriptor* field) const {
+    // from_chars accepts a leading minus, but no plus
+    const char* begin = literal.text.data() + (literal.text[0] == '+' ? 1 : 0);
+    const char* end = literal.text.data() + literal.text.size();
+
+    T value{};
+    const auto [stop, error] = std::from_chars(begin, end, value);
+
+    if (error == std::errc::result_out_of_range) {
+      fail(literal.text + " is out of range for field \"" + std::string(field->full_name()) + "\"", literal.position);
+    }
+
+    if (error != std::errc() || stop != end) {
+      fail("invalid number \"" + literal.text + "\"", literal.position);
+    }
+
+    return value;
+  }
+
+  [[noreturn]] void fail_type(const Token& literal, const FieldDescriptor* field) const {
+    fail("cannot compare field \"" + std::string(field->full_name()) + "\" of type " + std::string(field->type_name()) +
+             " with " + m_expression.substr(literal.position, literal_size(literal)),
+         literal.position);
+  }
+
+  std::size_t literal_size(const Token& literal) const {
+    // strings are stored unquoted and unescaped, so measure them in the source
+    if (literal.kind != Token::Kind::string) return literal.text.size();
+
+    const char quote = m_expression[literal.position];
+    std::size_t end = literal.position + 1;
+
+    while (end < m_expression.size() && m_expression[end] != quote) {
+      end += m_expression[end] == '\\' ? 2 : 1;
+    }
+
+    return end + 1 - literal.position;
+  }
+
+  FilterLiteral convert(const Token& literal, const FieldDescriptor* field) const {
+    FilterLiteral value;
+
+    switch (field->cpp_type()) {
+      case FieldDescriptor::CPPTYPE_INT32:
+      case FieldDescriptor::CPPTYPE_INT64: {
+        if (literal.kind != Token::Kind::integer) fail_type(literal, field);
+
+        value.signed_integer = parse_number<std::int64_t>(literal, field);
+
+        if (field->cpp_type() == FieldDescriptor::CPPTYPE_INT32 &&
+            (value.signed_integer < std::numeric_limits<std::int32_t>::min() ||
+             value.signed_integer > std::numeric_limits<std::int32_t>::max())) {
+          fail(literal.text + " is out of range for field \"" + std::string(field->full_name()) + "\"",
+               literal.position);
+        }
+
+        break;
+      }
+      case FieldDescriptor::CPPTYPE_UINT32:
+      case FieldDescriptor::CPPTYPE_UINT64: {
+        if (literal.kind != Token::Kind::integer) fail_type(literal, field);
+
+        if (literal.text[0] == '-') {
+          fail(literal.text + " is out of range for field \"" + std::string(field->full_name()) + "\"",
+               literal.position);
+        }
+
+        value.unsigned_integer = parse_number<std::uint64_t>(literal, field);
+
+        if (field->cpp_type() == FieldDescriptor::CPPTYPE_UINT32 &&
+            value.unsigned_integer > std::numeric_limits<std::uint32_t>::max()) {
+          fail(literal.text + " is out of range for field \"" + std::string(field->full_name()) + "\"",
+               literal.position);
+        }
+
+        break;
+      }
+      case FieldDescriptor::CPPTYPE_FLOAT:
+      case FieldDescriptor::CPPTYPE_DOUBLE:
+        if (literal.kind != Token::Kind::integer && literal.kind != Token::Kind::floating) fail_type(literal, field);
+
+        value.floating = parse_number<double>(literal, field);
+
+        // a float field holds the float nearest to the literal, so compare with
+        // that rather than with the exact double
+        if (field->cpp_type() == FieldDescriptor::CPPTYPE_FLOAT) {
+          value.floating = static_cast<float>(value.floating);
+        }
+
+        break;
+      case FieldDescriptor::CPPTYPE_BOOL:
+        if (literal.kind != Token::Kind::path) fail_type(literal, field);
+
+        value.unsigned_integer = literal.text == "true";
+        break;
+      case FieldDescriptor::CPPTYPE_ENUM: {
+        if (literal.kind == Token::Kind::integer) {
+          value.signed_integer = parse_number<std::int32_t>(literal, field);
+          break;
+        }
+
+        if (literal.kind != Token::Kind::string) fail_type(literal, field);
+
+        const EnumValueDescriptor* enum_value = field->enum_type()->FindValueByName(literal.text);
+
+        if (enum_value == nullptr) {
+          fail("\"" + literal.text + "\" is not a value of enum \"" + std::string(field->enum_type()->full_name()) +
+                   "\"",
+               literal.position);
+        }
+
+        value.signed_integer = enum_value->number();
+        break;
+      }
+      case FieldDescriptor::CPPTYPE_STRING:
+        if (literal.kind != Token::Kind::string) fail_type(literal, field);
+
+        value.bytes = literal.text;
+        break;
+      case FieldDescriptor::CPPTYPE_MESSAGE:
+        fail_type(literal, field);
+    }
+
+    return value;
+  }
+
+public:
+  FilterCompiler(const Descriptor* descriptor, const std::string& message_type, const std::string& expression)
+      : m_descriptor(descriptor), m_message_type(message_type), m_expression(expression) {}
+
+  MessageFilter compile() {
+    next();
+
+    MessageFilter filter;
+    filter.m_message_type = m_message_type;
+    filter.m_expression = m_expression;
+    filter.m_root = parse_expression();
+
+    if (m_token.kind != Token::Kind::end) {
+      fail_unexpected("\"and\", \"or\" or the end of the expression");
+    }
+
+    return filter;
+  }
+};
+
+
+// Compiles `expression`, see the top of this file, into a filter for
+// messages of `message_type`. Throws std::runtime_error, naming the position
+// in the expression, if it does not parse or does not fit the message type,
+// and like Context::to_json for an unknown type.
+inline MessageFilter compile_filter(Context& context, const std::string& message_type, const std::string& expression) {
+  return FilterCompiler(context.message_descriptor(message_type), message_type, expression).compile();
+}
+
+}  // namespace protosaurus
@@ -0,0 +1,434 @@
+#pragma once
+
+#include <absl/strings/charconv.h>    // from_chars
+#include <absl/strings/str_format.h>  // StrFormat
+
+#include <charconv>      // from_chars
+#include <cmath>         // isinf, signbit, abs, copysign
+#include <cstddef>       // size_t
+#include <cstdint>       // uint32_t, uint8_t
+#include <cstdlib>       // abs
+#include <limits>        // numeric_limits
+#include <stdexcept>     // runtime_error
+#include <string>        // string, to_string
+#include <string_view>   // string_view
+#include <system_error>  // errc
+
+// Rewriting JSON into the form Python's json.dumps gives the value that
+// json.loads reads from it, so that json.dumps(json.loads(text)) is not needed
+// to get it: ", " and ": " between items, or the layout of indent=N, every
+// character outside printable ASCII escaped as with ensure_ascii, and numbers
+// as Python prints the int or float they read as. The JSON is rewritten token
+// by token, without building the value.
+//
+// Floats are formatted with absl rather than std::to_chars, which older
+// macOS deployment targets lack for floating point.
+
+namespace protosaurus {
+
+// Appends the UTF-16 code unit `unit` of a string to `out` as json.dumps
+// escapes it.
+inline void append_json_dumps_unit(std::string& out, std::uint32_t unit) {
+  switch (unit) {
+    case '"':
+      out += "\\\"";
+      return;
+    case '\\':
+      out += "\\\\";
+      return;
+    case '\b':
+      out += "\\b";
+      return;
+    case '\f':
+      out += "\\f";
+      return;
+    case '\n':
+      out += "\\n";
+      return;
+    case '\r':
+      out += "\\r";
+      return;
+    case '\t':
+      out += "\\t";
+      return;
+    default:
+      break;
+  }
+
+  if (unit >= 0x20 && unit < 0x7f) {
+    out += static_cast<char>(unit);
+    return;
+  }
+
+  constexpr const char* digits = "0123456789abcdef";
+
+  out += "\\u";
+
+  for (int shift = 12; shift >= 0; shift -= 4) {
+    out += digits[(unit >> shift) & 0xf];
+  }
+}
+
+
+// Appends the JSON string that starts at the quote at `position` of `json` to
+// `out`, escaped as json.dumps escapes it, and returns the position after its
+// closing quote. Throws std::runtime_error for a string that is cut short or
+// not valid UTF-8.
+inline std::size_t append_json_dumps_string(std::string& out, std::string_view json, std::size_t position) {
+  auto fail = [&]() { throw std::runtime_error("Invalid JSON string at position " + std::to_string(position)); };
+
+  auto byte = [&](std::size_t i) {
+    if (i >= json.size()) fail();
+    return static_cast<std::uint8_t>(json[i]);
+  };
+
+  out += '"';
+  std::size_t i = position + 1;
+
+  while (true) {
+    const std::uint8_t c = byte(i);
+
+    if (c == '"') break;
+
+    if (c == '\\') {
+      const std::uint8_t escape = byte(i + 1);
+      i += 2;
+
+      switch (escape) {
+        case '"':
+        case '\\':
+        case '/':
+          append_json_dumps_unit(out, escape);
+          break;
+        case 'b':
+          append_json_dumps_unit(out, '\b');
+          break;
+        case 'f':
+          append_json_dumps_unit(out, '\f');
+          break;
+        case 'n':
+          append_json_dumps_unit(out, '\n');
+          break;
+        case 'r':
+          append_json_dumps_unit(out, '\r');
+          break;
+        case 't':
+          append_json_dumps_unit(out, '\t');
+          break;
+        case 'u': {
+          // a code unit, which a surrogate pair leaves as two, as Python does
+          std::uint32_t unit = 0;
+          const char* begin = json.data() + i;
+          if (json.size() - i < 4) fail();
+          const auto [end, error] = std::from_chars(begin, begin + 4, unit, 16);
+          if (error != std::errc() || end != begin + 4) fail();
+          append_json_dumps_unit(out, unit);
+          i += 4;
+          break;
+        }
+        default:
+          fail();
+      }
+
+      continue;
+    }
+
+    if (c < 0x80) {
+      append_json_dumps_unit(out, c);
+      ++i;
+      continue;
+    }
+
+    // a code point written as UTF-8, escaped as its UTF-16 code units
+    const std::size_t size = c >= 0xf0 ? 4 : c >= 0xe0 ? 3 : c >= 0xc0 ? 2 : 0;
+    if (size == 0 || c >= 0xf8) fail();
+
+    std::uint32_t code_point = c & (0x7f >> size);
+
+    for (std::size_t k = 1; k < size; ++k) {
+      const std::uint8_t continuation = byte(i + k);
+      if ((continuation & 0xc0) != 0x80) fail();
+      code_point = (code_point << 6) | (continuation & 0x3f);
+    }
+
+    if (code_point >= 0x10000) {
+      append_json_dumps_unit(out, 0xd800 + ((code_point - 0x10000) >> 10));
+      append_json_dumps_unit(out, 0xdc00 + ((code_point - 0x10000) & 0x3ff));
+    } else {
+      append_json_dumps_unit(out, code_point);
+    }
+
+    i += size;
+  }
+
+  out += '"';
+  return i + 1;
+}
+
+
+// The significant digits of a positive double and the decimal exponent of
+// the first of them.
+struct JsonDumpsDecimal {
+  std::string digits;
+  int exponent = 0;
+};
+
+
+// Returns `value`, positive and finite, correctly rounded to `precision`
+// digits after the first.
+inline JsonDumpsDecimal json_dumps_decimal(double value, int precision) {
+  // scientific is "d[.ddd]e[+-]xx"
+  const std::string scientific = absl::StrFormat("%.*e", precision, value);
+  const std::size_t e = scientific.find('e');
+
+  JsonDumpsDecimal decimal;
+  decimal.digits = scientific.substr(0, 1);
+  if (e > 1) decimal.digits += scientific.substr(2, e - 2);
+
+  const char* exponent_begin = scientific.data() + e + 1 + (scientific[e + 1] == '+' ? 1 : 0);
+  std::from_chars(exponent_begin, scientific.data() + scientific.size(), decimal.exponent);
+
+  return decimal;
+}
+
+
+// Returns whether `decimal` reads back as `value`.
+inline bool json_dumps_reads_back(const JsonDumpsDecimal& decimal, double value) {
+  const std::string text =
+      decimal.digits + "e" + std::to_string(decimal.exponent + 1 - static_cast<int>(decimal.digits.size()));
+
+  double parsed = 0;
+  const auto result = absl::from_chars(text.data(), text.data() + text.size(), parsed);
+
+  // rounding up past the largest double overflows, which absl reports with
+  // the largest double
+  return result.ec == std::errc() && parsed == value;
+}
+
+
+// Sets `decimal` to digits of `value`, positive and finite, with `precision`
+// digits after the first that read back as it, and returns whether there are
+// any.
+inline bool json_dumps_round_trip(double value, int precision, JsonDumpsDecimal& decimal) {
+  decimal = json_dumps_decimal(value, precision);
+
+  if (json_dumps_reads_back(decimal, value)) return true;
+
+  // Above a power of two the doubles are twice as far apart as below it, so
+  // the digits one unit above the correctly rounded ones can read back when
+  // those do not, and repr takes them over more digits.
+  std::size_t i = decimal.digits.size();
+
+  while (i > 0 && decimal.digits[i - 1] == '9') {
+    decimal.digits[--i] = '0';
+  }
+
+  if (i == 0) {
+    decimal.digits.insert(0, 1, '1');
+    decimal.digits.pop_back();
+    ++decimal.exponent;
+  } else {
+    ++decimal.digits[i - 1];
+  }
+
+  return json_dumps_reads_back(decimal, value);
+}
+
+
+// Appends `value` to `out` as repr(value) prints it: the fewest significant
+// digits that read back as the same double, fixed-point unless the decimal
+// exponent is below -4 or above 15, and fixed-point with at least one
+// fractional digit.
+inline void append_json_dumps_float(std::string& out, double value) {
+  if (std::signbit(value)) {
+    out += '-';
+    value = -value;
+  }
+
+  if (std::isinf(value)) {
+    out += "Infinity";
+    return;
+  }
+
+  // An extra digit only brings the digits closer to the value, so the fewest
+  // that read back are found by bisection. Seventeen always do.
+  JsonDumpsDecimal decimal;
+  int low = 0;
+  int high = 16;
+
+  while (low < high) {
+    const int precision = (low + high) / 2;
+
+    if (json_dumps_round_trip(value, precision, decimal)) {
+      high = precision;
+    } else {
+      low = precision + 1;
+    }
+  }
+
+  json_dumps_round_trip(value, low, decimal);
+
+  std::string& digits = decimal.digits;
+  const int exponent = decimal.exponent;
+
+  // digits one unit up can end in zeros
+  while (digits.size() > 1 && digits.back() == '0') {
+    digits.pop_back();
+  }
+
+  // the position of the decimal point relative to the digits
+  const int point = exponent + 1;
+  const auto size = static_cast<int>(digits.size());
+
+  if (point > -4 && point <= 16) {
+    if (point <= 0) {
+      out += "0.";
+      out.append(static_cast<std::size_t>(-point), '0');
+      out += digits;
+    } else if (point >= size) {
+      out += digits;
+      out.append(static_cast<std::size_t>(point - size), '0');
+      out += ".0";
+    } else {
+      out += std::string_view(digits).substr(0, static_cast<std::size_t>(point));
+      out += '.';
+      out += std::string_view(digits).substr(static_cast<std::size_t>(point));
+    }
+  } else {
+    out += digits[0];
+
+    if (size > 1) {
+      out += '.';
+      out += std::string_view(digits).substr(1);
+    }
+
+    out += exponent < 0 ? "e-" : "e+";
+    const std::string magnitude = std::to_string(std::abs(exponent));
+    if (magnitude.size() < 2) out += '0';
+    out += magnitude;
+  }
+}
+
+
+// Appends the JSON number `token` to `out` as json.dumps prints what
+// json.loads reads from it: an int, as it is written, or a float.
+inline void append_json_dumps_number(std::string& out, std::string_view token) {
+  if (token.find_first_of(".eE") == std::string_view::npos) {
+    // int("-0") is 0
+    out += token == "-0" ? "0" : token;
+    return;
+  }
+
+  double value = 0;
+  const auto [end, error] = absl::from_chars(token.data(), token.data() + token.size(), value);
+
+  if (end != token.data() + token.size() || (error != std::errc() && error != std::errc::result_out_of_range)) {
+    throw std::runtime_error("Invalid JSON number \"" + std::string(token) + "\"");
+  }
+
+  // absl gives the largest double for a number too large, where Python reads
+  // an infinity, and zero for one too small, as Python does
+  if (error == std::errc::result_out_of_range && std::abs(value) > 1) {
+    value = std::copysign(std::numeric_limits<double>::infinity(), value);
+  }
+
+  append_json_dumps_float(out, value);
+}
+
+
+// Appends the JSON text `json` to `out` as json.dumps prints the value that
+// json.loads reads from it; with `indent` zero or more, as with indent=N.
+// Whitespace between tokens is ignored. The text is not otherwise validated,
+// beyond its strings and numbers, and for those throws std::runtime_error.
+inline void append_json_dumps(std::string& out, std::string_view json, int indent = -1) {
+  std::size_t position = 0;
+  std::size_t depth = 0;
+
+  auto skip_whitespace = [&]() {
+    while (position < json.size() &&
+           (json[position] == ' ' || json[position] == '\n' || json[position] == '\r' || json[position] == '\t')) {
+      ++position;
+    }
+  };
+
+  auto new_line = [&]() {
+    out += '\n';
+    out.append(depth * static_cast<std::size_t>(indent), ' ');
+  };
+
+  while (true) {
+    skip_whitespace();
+
+    if (position == json.size()) break;
+
+    const char c = json[position];
+
+    switch (c) {
+      case '{':
+      case '[': {
+        out += c;
+        ++position;
+        skip_whitespace();
+
+        const char close = c == '{' ? '}' : ']';
+
+        // an empty object or list has nothing to indent
+        if (position < json.size() && json[position] == close) {
+          out += close;
+          ++position;
+        } else {
+          ++depth;
+          if (indent >= 0) new_line();
+        }
+
+        break;
+      }
+      case '}':
+      case ']':
+        if (depth == 0) throw std::runtime_error("Invalid JSON: unbalanced \"" + std::string(1, c) + "\"");
+
+        --depth;
+        if (indent >= 0) new_line();
+        out += c;
+        ++position;
+        break;
+      case ',':
+        out += ',';
+        if (indent >= 0) {
+          new_line();
+        } else {
+          out += ' ';
+        }
+        ++position;
+        break;
+      case ':':
+        out += ": ";
+        ++position;
+        break;
+      case '"':
+        position = append_json_dumps_string(out, json, position);
+        break;
+      default: {
+        // true, false and null are copied, anything else is a number
+        const bool literal = c == 't' || c == 'f' || c == 'n';
+        const std::size_t end = json.find_first_not_of(literal ? "aeflnrstu" : "+-.0123456789Ee", position);
+        const std::string_view token = json.substr(position, end - position);
+
+        if (token.empty()) {
+          throw std::runtime_error("Invalid JSON: unexpected \"" + std::string(1, c) + "\" at position " +
+                                   std::to_string(position));
+        }
+
+        if (literal) {
+          out += token;
+        } else {
+          append_json_dumps_number(out, token);
+        }
+
+        position += token.size();
+      }
+    }
+  }
+}
+
+}  // namespace protosaurus
@@ -0,0 +1,138 @@
+#pragma once
+
+#include <protosaurus/protosaurus.h>
+
+#include <charconv>      // from_chars
+#include <cstddef>       // size_t
+#include <cstdint>       // int64_t, uint32_t, uint8_t, int8_t
+#include <stdexcept>     // runtime_error
+#include <string>        // string, to_string
+#include <string_view>   // string_view
+#include <system_error>  // errc
+#include <utility>       // move
+#include <vector>        // vector
+
+// Splits the output of `kcat -C -f "%o\n%k\n%R%s"` into records: the offset
+// and the key on a line each, then the value prefixed with its length as a
+// 32-bit big-endian integer. The value is expected in the schema-registry
+// wire format -- a zero magic byte, the 32-bit big-endian schema ID and the
+// zigzag varint array of message indexes -- followed by the message itself.
+
+namespace protosaurus {
+
+namespace kcat {
+
+// Longest message-index array accepted. The length comes from the data, so it
+// is checked before anything is sized by it.
+constexpr std::int64_t MAX_MESSAGE_INDEX_LENGTH = 100000;
+
+struct Record {
+  std::int64_t offset;
+  std::string_view key;
+  std::uint32_t schema_id;
+  std::vector<int> message_index;
+  // The message after the schema-registry header, as a view of the input.
+  std::string_view payload;
+};
+
+inline std::uint32_t read_uint32_be(std::string_view data, std::size_t position) {
+  std::uint32_t value = 0;
+
+  for (std::size_t i = 0; i < 4; ++i) {
+    value = (value << 8) | static_cast<std::uint8_t>(data[position + i]);
+  }
+
+  return value;
+}
+
+// Reads the schema-registry header at the start of `value` into `record`.
+// Throws std::runtime_error for a malformed header, and VarintTruncated when
+// the value ends inside the message-index array.
+inline void read_header(std::string_view value, Record& record) {
+  if (value.size() < 5) {
+    throw std::runtime_error("Record value of " + std::to_string(value.size()) +
+                             " bytes is too short for the schema registry header");
+  }
+
+  const auto magic_byte = static_cast<std::int8_t>(value[0]);
+
+  if (magic_byte != 0) {
+    throw std::runtime_error("Incorrect magic byte (" + std::to_string(magic_byte) + ").");
+  }
+
+  record.schema_id = read_uint32_be(value, 1);
+
+  const Varint length = read_varint(value, 5);
+  const std::int64_t index_length = zigzag_decode(length.value);
+
+  if (index_length < 0 || index_length > MAX_MESSAGE_INDEX_LENGTH) {
+    throw std::runtime_error("Invalid Protobuf message_index array length");
+  }
+
+  std::size_t position = length.offset;
+
+  // An empty array is the shorthand for the first message of the file.
+  if (index_length == 0) {
+    record.message_index.assign(1, 0);
+  } else {
+    record.message_index.reserve(static_cast<std::size_t>(index_length));
+
+    for (std::int64_t i = 0; i < index_length; ++i) {
+      const Varint index = read_varint(value, position);
+      record.message_index.push_back(static_cast<int>(zigzag_decode(index.value)));
+      position = index.offset;
+    }
+  }
+
+  record.payload = value.substr(position);
+}
+
+// Reads the complete records of `data` from `position` on, calling
+// visit(Record&&) for each, and returns the position of the first record that
+// is cut off by the end of the data -- or the end of the data if none is.
+// Everything before that position has been consumed.
+template <typename Visit>
+std::size_t read_records(std::string_view data, std::size_t position, Visit&& visit) {
+  while (position < data.size()) {
+    const std::size_t offset_end = data.find('\n', position);
+
+    if (offset_end == std::string_view::npos) {
+      break;
+    }
+
+    const std::size_t key_end = data.find('\n', offset_end + 1);
+
+    if (key_end == std::string_view::npos || data.size() - (key_end + 1) < 4) {
+      break;
+    }
+
+    const std::size_t value_size = read_uint32_be(data, key_end + 1);
+    const std::size_t value_begin = key_end + 5;
+
+    if (data.size() - value_begin < value_size) {
+      break;
+    }
+
+    Record record;
+
+    const std::string_view offset = data.substr(position, offset_end - position);
+    const auto [end, error] = std::from_chars(offset.data(), offset.data() + offset.size(), record.offset);
+
+    if (error != std::errc() || end != offset.data() + offset.size()) {
+      throw std::runtime_error("Invalid record offset '" + std::string(offset) + "'");
+    }
+
+    record.key = data.substr(offset_end + 1, key_end - offset_end - 1);
+    read_header(data.substr(value_begin, value_size), record);
+
+    visit(std::move(record));
+
+    position = value_begin + value_size;
+  }
+
+  return position;
+}
+
+}  // namespace kcat
+
+}  // namespace protosaurus
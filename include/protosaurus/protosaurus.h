@@ -1,27 +1,38 @@
 #pragma once
 
+#include <protosaurus/json_dumps.h>
+
+#include <google/protobuf/arena.h>            // Arena, ArenaOptions
 #include <google/protobuf/compiler/parser.h>  // Parser
 #include <google/protobuf/descriptor.h>       // DescriptorPool, FileDescriptorProto, FileDescriptor. Descriptor
+#include <google/protobuf/descriptor.pb.h>    // FileDescriptorSet
 #include <google/protobuf/dynamic_message.h>  // DynamicMessageFactory
 #include <google/protobuf/io/tokenizer.h>     // Tokenizer
 #include <google/protobuf/io/zero_copy_stream_impl.h>  // ArrayInputStream
 #include <google/protobuf/message.h>                   // Message
 #include <google/protobuf/util/json_util.h>            // MessageToJsonString, JsonStringToMessage
 
-#include <cstdint>       // uint64_t, int64_t, uint8_t
-#include <memory>        // unique_ptr
-#include <mutex>         // unique_lock
-#include <optional>      // optional
-#include <shared_mutex>  // shared_mutex, shared_lock
-#include <stdexcept>     // runtime_error, out_of_range
-#include <string>        // string
-#include <string_view>   // string_view
-#include <vector>        // vector
+#include <algorithm>      // min, max
+#include <cstdint>        // uint64_t, int64_t, uint8_t
+#include <exception>      // exception_ptr, current_exception, rethrow_exception
+#include <memory>         // unique_ptr
+#include <mutex>          // unique_lock
+#include <optional>       // optional
+#include <shared_mutex>   // shared_mutex, shared_lock
+#include <stdexcept>      // runtime_error, out_of_range, invalid_argument
+#include <string>         // string
+#include <string_view>    // string_view
+#include <thread>         // jthread, hardware_concurrency
+#include <unordered_map>  // unordered_map
+#include <utility>        // as_const, pair
+#include <vector>         // vector
 
 namespace protosaurus {
 
 // Targeted using-declarations instead of using-directives: a `using namespace` in a
 // header leaks every name of those namespaces into whatever includes it.
+using google::protobuf::Arena;
+using google::protobuf::ArenaOptions;
 using google::protobuf::Descriptor;
 using google::protobuf::DescriptorPool;
 using google::protobuf::DynamicMessageFactory;
@@ -30,6 +41,7 @@ using google::protobuf::EnumValueDescriptor;
 using google::protobuf::FieldDescriptor;
 using google::protobuf::FileDescriptor;
 using google::protobuf::FileDescriptorProto;
+using google::protobuf::FileDescriptorSet;
 using google::protobuf::Message;
 using google::protobuf::OneofDescriptor;
 using google::protobuf::compiler::Parser;
@@ -86,6 +98,92 @@ public:
 };
 
 
+// Parses a .proto definition into a FileDescriptorProto named `filename`,
+// without adding it to a pool. Imports are not resolved here, only when the
+// result is added to a context, so it can be parsed once and added to many.
+inline FileDescriptorProto parse_proto(const std::string& filename, const std::string& content) {
+  ParserErrorCollector error_collector;
+
+  ArrayInputStream raw_input(content.c_str(), static_cast<int>(content.size()));
+  Tokenizer input(&raw_input, &error_collector);
+
+  FileDescriptorProto file_descriptor_proto;
+  Parser parser;
+  parser.RecordErrorsTo(&error_collector);
+
+  if (!parser.Parse(&input, &file_descriptor_proto)) {
+    std::string msg = "Could not parse proto";
+    if (error_collector.has_errors()) {
+      msg += ":\n" + error_collector.errors();
+    }
+    throw std::runtime_error(msg);
+  }
+
+  if (!file_descriptor_proto.has_name()) {
+    file_descriptor_proto.set_name(filename);
+  }
+
+  return file_descriptor_proto;
+}
+
+
+// Orders `files` so that each comes after the ones among them that it imports,
+// and otherwise keeps the order given. Imports of files that are not among
+// them are left for the pool to resolve when the files are built. Throws
+// std::runtime_error, naming the files involved, if the imports form a cycle.
+inline std::vector<const FileDescriptorProto*> sort_by_imports(const std::vector<const FileDescriptorProto*>& files) {
+  enum class State { unvisited, visiting, done };
+
+  std::unordered_map<std::string_view, std::size_t> positions;
+
+  for (std::size_t i = 0; i < files.size(); ++i) {
+    positions.emplace(files[i]->name(), i);
+  }
+
+  std::vector<State> states(files.size(), State::unvisited);
+  std::vector<const FileDescriptorProto*> sorted;
+  sorted.reserve(files.size());
+
+  // the imports followed to reach the current file, for the cycle message
+  std::vector<std::string_view> path;
+
+  auto visit = [&](auto& visit, std::size_t i) -> void {
+    if (states[i] == State::done) return;
+
+    if (states[i] == State::visiting) {
+      std::string msg = "Import cycle: ";
+
+      for (auto it = std::find(path.begin(), path.end(), files[i]->name()); it != path.end(); ++it) {
+        msg += std::string(*it) + " -> ";
+      }
+
+      throw std::runtime_error(msg + files[i]->name());
+    }
+
+    states[i] = State::visiting;
+    path.push_back(files[i]->name());
+
+    for (const std::string& dependency : files[i]->dependency()) {
+      const auto position = positions.find(dependency);
+
+      if (position != positions.end()) {
+        visit(visit, position->second);
+      }
+    }
+
+    path.pop_back();
+    states[i] = State::done;
+    sorted.push_back(files[i]);
+  };
+
+  for (std::size_t i = 0; i < files.size(); ++i) {
+    visit(visit, i);
+  }
+
+  return sorted;
+}
+
+
 // protobuf assembles its status messages from fragments and leaves runs of
 // blanks behind ("invalid JSON in  Animal,  near"). Collapse them so the text
 // reads normally when embedded in an exception.
@@ -185,6 +283,42 @@ inline Varint read_varint(std::string_view data, std::size_t offset) {
 }
 
 
+// Reads `count` consecutive varints starting at `offset` -- or, without a
+// count, all of them up to the end of the data -- and appends their raw values
+// to `out`. Returns the position just after the last one. Throws like
+// read_varint, so a count larger than what the data holds is VarintTruncated.
+inline std::size_t read_varints(std::string_view data, std::size_t offset, std::optional<std::size_t> count,
+                                std::vector<std::uint64_t>& out) {
+  if (offset > data.size()) {
+    throw VarintOffsetOutOfRange();
+  }
+
+  // Every varint takes at least one byte, which bounds a count taken from
+  // untrusted input before it is used to size anything.
+  const std::size_t remaining = data.size() - offset;
+  out.reserve(out.size() + (count ? std::min(*count, remaining) : remaining));
+
+  for (std::size_t i = 0; count ? i < *count : offset < data.size(); ++i) {
+    const Varint varint = read_varint(data, offset);
+    out.push_back(varint.value);
+    offset = varint.offset;
+  }
+
+  return offset;
+}
+
+
+// Appends `value` to `out` as a base-128 varint, the inverse of read_varint.
+inline void write_varint(std::string& out, std::uint64_t value) {
+  while (value >= 0x80) {
+    out += static_cast<char>((value & 0x7F) | 0x80);
+    value >>= 7;
+  }
+
+  out += static_cast<char>(value);
+}
+
+
 // Protobuf's sint32/sint64 encoding maps signed values onto unsigned ones so
 // that small magnitudes stay short. Only those two types use it; plain int32,
 // int64, lengths and field tags are not zigzag encoded.
@@ -196,6 +330,159 @@ inline std::int64_t zigzag_decode(std::uint64_t value) {
 }
 
 
+// Looks a field of `descriptor` up by its name or, failing that, its JSON
+// name, the two spellings ProtoJSON accepts. Returns null if neither matches.
+inline const FieldDescriptor* find_field(const Descriptor* descriptor, std::string_view name) {
+  if (const FieldDescriptor* field = descriptor->FindFieldByName(name); field != nullptr) {
+    return field;
+  }
+
+  for (int i = 0; i < descriptor->field_count(); ++i) {
+    if (descriptor->field(i)->json_name() == name) {
+      return descriptor->field(i);
+    }
+  }
+
+  return nullptr;
+}
+
+
+// One field kept by a projection, see Context::to_json. A field is either
+// kept whole or, for a message field, only with the fields of `children`.
+struct ProjectedField {
+  int number;
+  bool whole;
+  // Sorted by number.
+  std::vector<ProjectedField> children;
+};
+
+using Projection = std::vector<ProjectedField>;
+
+
+// Thrown by project_wire for data that is not valid wire format.
+class MalformedWire : public std::runtime_error {
+public:
+  MalformedWire() : std::runtime_error("The data is not valid protobuf wire format") {}
+};
+
+
+// How deeply groups may nest in wire format data that skip_field reads,
+// protobuf's default recursion limit.
+inline constexpr int MAX_GROUP_DEPTH = 100;
+
+
+// Returns the position just after the value of the field whose tag ends at
+// `position`, without decoding the value. `depth` is the number of groups the
+// field is inside of; a group nested deeper than MAX_GROUP_DEPTH throws
+// MalformedWire, so that untrusted data cannot exhaust the stack.
+inline std::size_t skip_field(std::string_view data, std::size_t position, std::uint64_t tag, int depth = 0) {
+  switch (tag & 7) {
+    case 0:  // varint
+      return read_varint(data, position).offset;
+    case 1:  // fixed64
+      if (data.size() - position < 8) throw MalformedWire();
+      return position + 8;
+    case 2: {  // length-delimited
+      const Varint length = read_varint(data, position);
+      if (data.size() - length.offset < length.value) throw MalformedWire();
+      return length.offset + length.value;
+    }
+    case 3:  // start group: skip everything up to the matching end group
+      if (depth >= MAX_GROUP_DEPTH) throw MalformedWire();
+
+      while (true) {
+        const Varint inner = read_varint(data, position);
+
+        if ((inner.value & 7) == 4) {
+          if ((inner.value >> 3) != (tag >> 3)) throw MalformedWire();
+          return inner.offset;
+        }
+
+        position = skip_field(data, inner.offset, inner.value, depth + 1);
+      }
+    case 5:  // fixed32
+      if (data.size() - position < 4) throw MalformedWire();
+      return position + 4;
+    default:
+      throw MalformedWire();
+  }
+}
+
+
+// Reads a little-endian fixed32 or fixed64, of `size` bytes, from the start of
+// `data`.
+inline std::uint64_t read_fixed(std::string_view data, std::size_t size) {
+  if (data.size() < size) throw MalformedWire();
+
+  std::uint64_t value = 0;
+
+  for (std::size_t i = 0; i < size; ++i) {
+    value |= static_cast<std::uint64_t>(static_cast<std::uint8_t>(data[i])) << (8 * i);
+  }
+
+  return value;
+}
+
+
+// The wire type a field of `type` is written with, unless it is packed.
+inline int wire_type_of(FieldDescriptor::Type type) {
+  switch (type) {
+    case FieldDescriptor::TYPE_FIXED64:
+    case FieldDescriptor::TYPE_SFIXED64:
+    case FieldDescriptor::TYPE_DOUBLE:
+      return 1;
+    case FieldDescriptor::TYPE_STRING:
+    case FieldDescriptor::TYPE_BYTES:
+    case FieldDescriptor::TYPE_MESSAGE:
+      return 2;
+    case FieldDescriptor::TYPE_GROUP:
+      return 3;
+    case FieldDescriptor::TYPE_FIXED32:
+    case FieldDescriptor::TYPE_SFIXED32:
+    case FieldDescriptor::TYPE_FLOAT:
+      return 5;
+    default:
+      return 0;
+  }
+}
+
+
+// Appends the fields of the wire format message `data` that `projection`
+// keeps to `out`, as wire format again. Every other field is skipped at the
+// tag level, so only its framing is read. A kept submessage with children is
+// projected in turn; a group is always kept whole. Throws MalformedWire, or
+// one of the varint errors, for data that is not valid wire format.
+inline void project_wire(std::string_view data, const Projection& projection, std::string& out) {
+  std::size_t position = 0;
+
+  while (position < data.size()) {
+    const Varint tag = read_varint(data, position);
+    const std::size_t end = skip_field(data, tag.offset, tag.value);
+
+    const auto number = static_cast<int>(tag.value >> 3);
+    const auto field = std::lower_bound(projection.begin(), projection.end(), number,
+                                        [](const ProjectedField& f, int n) { return f.number < n; });
+
+    if (field != projection.end() && field->number == number) {
+      if (field->whole || (tag.value & 7) != 2) {
+        out.append(data.substr(position, end - position));
+      } else {
+        const Varint length = read_varint(data, tag.offset);
+
+        std::string inner;
+        project_wire(data.substr(length.offset, length.value), field->children, inner);
+
+        out.append(data.substr(position, tag.offset - position));
+        write_varint(out, inner.size());
+        out += inner;
+      }
+    }
+
+    position = end;
+  }
+}
+
+
 // FieldDescriptor::Label has no built-in string form, unlike TypeName() for
 // Type. proto2 is the only syntax that can produce LABEL_REQUIRED; proto3
 // fields are always LABEL_OPTIONAL or LABEL_REPEATED.
@@ -235,6 +522,11 @@ struct JsonOptions {
   // Values that would lose precision stay quoted, so the JSON type of a field
   // depends on its value.
   bool unquote_int64 = false;
+
+  // Print the JSON exactly as Python's json.dumps prints the value json.loads
+  // reads from it, see append_json_dumps; with pretty, as json.dumps does
+  // with indent=2.
+  bool json_dumps_format = false;
 };
 
 
@@ -248,6 +540,21 @@ struct ParseOptions {
 };
 
 
+// One document that Context::from_json_many could not encode.
+struct EncodeError {
+  // Position of the document in the batch.
+  std::size_t index;
+  std::string message;
+};
+
+// messages has one entry per document, in input order; an entry is unset iff
+// its document failed and is listed in errors.
+struct EncodeResult {
+  std::vector<std::optional<std::string>> messages;
+  std::vector<EncodeError> errors;
+};
+
+
 struct EnumValueInfo {
   std::string name;
   int number;
@@ -296,18 +603,157 @@ struct DescribeResult {
 };
 
 
+// Size of the arena block every thread keeps for to_json and from_json unless
+// the context is configured otherwise.
+inline constexpr std::size_t DEFAULT_ARENA_SIZE = 64 * 1024;
+
+// The first block of the arena of every to_json/from_json call on this thread.
+// It outlives the call, so a message that fits into it is decoded without a
+// single heap allocation. Conversions never nest on one thread, so one block
+// per thread is enough. It only ever grows, to the largest arena size of any
+// context used on the thread.
+inline thread_local std::vector<char> t_arena_block;
+
+
+// Batches smaller than this per worker are not worth a thread of their own.
+inline constexpr std::size_t MIN_ITEMS_PER_WORKER = 64;
+
+
+// Splits [0, count) into contiguous ranges, one per worker, and calls
+// work(begin, end) for every range, each on its own thread; the first range
+// runs on the calling thread. `workers` is an upper bound -- 0 means one per
+// hardware thread -- as every range gets at least `min_items` items.
+// Once all ranges are done, the exception of the first range that threw, if
+// any, is rethrown.
+template <typename Work>
+void run_in_parallel(std::size_t count, std::size_t workers, Work&& work,
+                     std::size_t min_items = MIN_ITEMS_PER_WORKER) {
+  if (workers == 0) {
+    workers = std::max(1u, std::thread::hardware_concurrency());
+  }
+
+  workers = std::min(workers, std::max<std::size_t>(1, count / min_items));
+
+  if (workers == 1) {
+    work(std::size_t{0}, count);
+    return;
+  }
+
+  std::vector<std::exception_ptr> errors(workers);
+
+  auto run = [&](std::size_t worker) {
+    try {
+      work(count * worker / workers, count * (worker + 1) / workers);
+    } catch (...) {
+      errors[worker] = std::current_exception();
+    }
+  };
+
+  {
+    // jthread joins on destruction, also when starting a later thread fails.
+    std::vector<std::jthread> threads;
+    threads.reserve(workers - 1);
+
+    for (std::size_t worker = 1; worker < workers; ++worker) {
+      threads.emplace_back(run, worker);
+    }
+
+    run(0);
+  }
+
+  for (const std::exception_ptr& error : errors) {
+    if (error) std::rethrow_exception(error);
+  }
+}
+
+
+class Context;
+
+// A message type resolved once, for converting many messages of that type
+// without looking it up by name on every call. Obtained from
+// Context::message_handle; it refers to the context, which must outlive it.
+class MessageHandle {
+private:
+  Context* m_context;
+  std::string m_message_type;
+  const Message* m_prototype;
+
+  friend class Context;
+
+  MessageHandle(Context& context, std::string message_type, const Message& prototype)
+      : m_context(&context), m_message_type(std::move(message_type)), m_prototype(&prototype) {}
+
+public:
+  const std::string& message_type() const { return m_message_type; }
+
+  std::string to_json(std::string_view data, const JsonOptions& options = {},
+                      const std::optional<std::vector<std::string>>& fields = std::nullopt) const;
+
+  std::string from_json(const std::string& data, const ParseOptions& options = {}) const;
+};
+
+
 class Context {
 private:
   DescriptorPool m_pool;
   DynamicMessageFactory m_factory;
   mutable std::shared_mutex m_mutex;
 
+  // Size of the per-thread arena block, see t_arena_block. 0 disables arenas:
+  // every call then allocates its message on the heap.
+  std::size_t m_arena_size;
+
+  // Prototypes of the message types looked up so far, by name. Resolving a
+  // type costs a hash lookup in the pool and one in the factory, which also
+  // takes a mutex of its own. Files are only ever added to the pool, so an
+  // entry never goes stale and add_proto has nothing to invalidate. The cache
+  // is filled while m_mutex is held shared, hence its own mutex.
+  mutable std::shared_mutex m_prototypes_mutex;
+  std::unordered_map<std::string, const Message*> m_prototypes;
+
+  friend class MessageHandle;
+
   // DescriptorPool cannot enumerate what it holds, so remember which files were
   // built in order to list the available message types in error messages.
   std::vector<std::string> m_filenames;
 
+  // Builds `files` in the order given, under one exclusive lock for all of
+  // them, so that readers are stalled once rather than once per file.
+  void build_files(const std::vector<const FileDescriptorProto*>& files) {
+    std::unique_lock lock(m_mutex);
+
+    for (const FileDescriptorProto* file_descriptor_proto : files) {
+      build_file(*file_descriptor_proto);
+    }
+  }
+
   // All of the helpers below expect m_mutex to be held by the caller.
 
+  // Builds `file_descriptor_proto` into the pool. A file that is already
+  // there is built again only to check that it is identical, and is not
+  // listed twice.
+  void build_file(const FileDescriptorProto& file_descriptor_proto) {
+    const bool known = m_pool.FindFileByName(file_descriptor_proto.name()) != nullptr;
+
+    PoolErrorCollector pool_errors;
+
+    const FileDescriptor* file_desc = m_pool.BuildFileCollectingErrors(file_descriptor_proto, &pool_errors);
+
+    if (file_desc == nullptr) {
+      std::string msg = "Could not build \"" + file_descriptor_proto.name() + "\"";
+
+      if (pool_errors.has_errors()) {
+        msg += ":\n" + pool_errors.errors();
+      }
+
+      throw std::runtime_error(msg);
+    }
+
+    if (!known) {
+      m_filenames.push_back(std::string(file_desc->name()));
+    }
+  }
+
   void collect_message_types(const Descriptor* descriptor, std::vector<std::string>& out) const {
     out.push_back(std::string(descriptor->full_name()));
 
@@ -404,14 +850,31 @@ private:
     return descriptor;
   }
 
-  std::unique_ptr<Message> new_message(const Descriptor* descriptor, const std::string& message_type) {
+  const Message& find_prototype(const std::string& message_type) {
+    {
+      std::shared_lock cache_lock(m_prototypes_mutex);
+
+      if (auto it = m_prototypes.find(message_type); it != m_prototypes.end()) {
+        return *it->second;
+      }
+    }
+
+    const Descriptor* descriptor = find_message_type(message_type);
+
     const Message* prototype = m_factory.GetPrototype(descriptor);
 
     if (prototype == nullptr) {
       throw std::runtime_error("Could not create a prototype for message type \"" + message_type + "\"");
     }
 
-    std::unique_ptr<Message> message(prototype->New());
+    std::unique_lock cache_lock(m_prototypes_mutex);
+    m_prototypes.emplace(message_type, prototype);
+
+    return *prototype;
+  }
+
+  static std::unique_ptr<Message> new_message(const Message& prototype, const std::string& message_type) {
+    std::unique_ptr<Message> message(prototype.New());
 
     if (message == nullptr) {
       throw std::runtime_error("Could not create an empty message of type \"" + message_type + "\"");
@@ -427,6 +890,269 @@ private:
                              "\" is missing required fields: " + message.InitializationErrorString());
   }
 
+  static util::JsonPrintOptions json_print_options(const JsonOptions& options) {
+    util::JsonPrintOptions print_options;
+    print_options.always_print_fields_with_no_presence = options.include_defaults;
+    print_options.add_whitespace = options.pretty;
+    print_options.preserve_proto_field_names = options.proto_field_names;
+    print_options.always_print_enums_as_ints = options.enums_as_ints;
+    print_options.unquote_int64_if_possible = options.unquote_int64;
+    return print_options;
+  }
+
+  // Resolves the dotted field paths of `fields` -- "trainer.name" for the
+  // name of the message in the trainer field -- into the projection of
+  // `descriptor` that keeps them. Every step is a field name or JSON name.
+  static Projection make_projection(const Descriptor* descriptor, const std::vector<std::string>& fields) {
+    Projection projection;
+
+    for (const std::string& path : fields) {
+      const Descriptor* current = descriptor;
+      Projection* level = &projection;
+      std::size_t begin = 0;
+
+      while (true) {
+        const std::size_t dot = path.find('.', begin);
+        const std::string_view name = std::string_view(path).substr(begin, dot - begin);
+
+        const FieldDescriptor* field = find_field(current, name);
+
+        if (field == nullptr) {
+          throw std::runtime_error("Invalid field path \"" + path + "\": message type \"" +
+                                   std::string(current->full_name()) + "\" has no field named \"" + std::string(name) +
+                                   "\"");
+        }
+
+        auto it = std::lower_bound(level->begin(), level->end(), field->number(),
+                                   [](const ProjectedField& f, int n) { return f.number < n; });
+
+        if (it == level->end() || it->number != field->number()) {
+          it = level->insert(it, ProjectedField{field->number(), false, {}});
+        }
+
+        if (dot == std::string::npos) {
+          it->whole = true;
+          it->children.clear();
+          break;
+        }
+
+        if (field->message_type() == nullptr) {
+          throw std::runtime_error("Invalid field path \"" + path + "\": field \"" + std::string(field->full_name()) +
+                                   "\" is not a message");
+        }
+
+        // a path into a field that is kept whole already selects nothing more
+        if (it->whole) break;
+
+        current = field->message_type();
+        level = &it->children;
+        begin = dot + 1;
+      }
+    }
+
+    return projection;
+  }
+
+  static std::optional<Projection> make_projection(const Message& prototype,
+                                                   const std::optional<std::vector<std::string>>& fields) {
+    if (!fields) return std::nullopt;
+
+    return make_projection(prototype.GetDescriptor(), *fields);
+  }
+
+  // include_defaults would print the fields a projection leaves out as if
+  // they held their defaults.
+  static void check_projection_options(const JsonOptions& options, const std::optional<Projection>& projection) {
+    if (projection && options.include_defaults) {
+      throw std::invalid_argument("fields cannot be combined with include_defaults");
+    }
+  }
+
+  // Parse partially first: a plain ParseFromArray also fails on a well-formed
+  // message that merely lacks required fields, and cannot tell the two apart.
+  // ParsePartialFromArray clears the message itself, so one message can be
+  // reused for a whole batch.
+  //
+  // With a projection, only the fields it keeps are parsed, and required
+  // fields are not checked as the projection may leave them out.
+  static void parse_wire(Message& message, std::string_view data, const std::string& message_type,
+                         const std::optional<Projection>& projection = std::nullopt) {
+    const std::size_t size = data.size();
+
+    auto fail = [&]() {
+      throw std::runtime_error("Could not parse " + std::to_string(size) + " bytes as message type \"" + message_type +
+                               "\": the data is not valid protobuf wire format");
+    };
+
+    if (projection) {
+      // kept between calls, like t_arena_block, to parse without allocating
+      thread_local std::string projected;
+      projected.clear();
+
+      try {
+        project_wire(data, *projection, projected);
+      } catch (const std::runtime_error&) {
+        fail();
+      }
+
+      data = projected;
+    }
+
+    if (!message.ParsePartialFromArray(data.data(), static_cast<int>(data.size()))) {
+      fail();
+    }
+
+    if (!projection) {
+      check_initialized(message, message_type);
+    }
+  }
+
+  static std::string print_json(const Message& message, const std::string& message_type,
+                                const util::JsonPrintOptions& print_options) {
+    std::string out;
+
+    absl::Status status = util::MessageToJsonString(message, &out, print_options);
+
+    if (!status.ok()) {
+      throw std::runtime_error("Could not convert message of type \"" + message_type +
+                               "\" to json: " + collapse_spaces(status.message()));
+    }
+
+    return out;
+  }
+
+  // Rewrites `json`, as print_json returned it, for options.json_dumps_format,
+  // with the object members `prefix` written in front of its fields unless it
+  // is empty. Throws std::runtime_error for a prefix when the message does not
+  // print as an object, as for some well-known types.
+  static std::string format_json(std::string json, const JsonOptions& options, std::string_view prefix = {}) {
+    if (!options.json_dumps_format) return json;
+
+    if (!prefix.empty()) {
+      if (json.empty() || json[0] != '{') {
+        throw std::runtime_error("Cannot write a prefix into JSON that is not an object: " + json);
+      }
+
+      const std::size_t first = json.find_first_not_of(" \n", 1);
+      const bool empty = first != std::string::npos && json[first] == '}';
+
+      json = "{" + std::string(prefix) + (empty ? "" : ",") + json.substr(1);
+    }
+
+    std::string out;
+    out.reserve(json.size() + json.size() / 4);
+    append_json_dumps(out, json, options.pretty ? 2 : -1);
+    return out;
+  }
+
+  static util::JsonParseOptions json_parse_options(const ParseOptions& options) {
+    util::JsonParseOptions parse_options;
+    parse_options.ignore_unknown_fields = options.ignore_unknown_fields;
+    return parse_options;
+  }
+
+  static void parse_json(Message& message, std::string_view data, const std::string& message_type,
+                         const util::JsonParseOptions& parse_options) {
+    absl::Status status = util::JsonStringToMessage(data, &message, parse_options);
+
+    if (!status.ok()) {
+      throw std::runtime_error("Could not convert json to message type \"" + message_type +
+                               "\": " + collapse_spaces(status.message()));
+    }
+
+    // Checked before serializing, not after: SerializeToString happily emits a
+    // proto2 message that is missing required fields, which would hand the
+    // caller bytes that to_json then refuses to read back.
+    check_initialized(message, message_type);
+  }
+
+  static std::string serialize(const Message& message, const std::string& message_type) {
+    std::string out;
+
+    if (!message.SerializeToString(&out)) {
+      throw std::runtime_error("Could not serialize message of type \"" + message_type + "\"");
+    }
+
+    return out;
+  }
+
+  // Calls convert(message) on a new, empty message of `prototype`'s type and
+  // returns its result. With arenas enabled, the message and everything it
+  // allocates -- submessages, repeated fields, strings -- lives on an arena
+  // starting with this thread's block, and is freed in one go afterwards
+  // instead of node by node.
+  template <typename Convert>
+  auto with_message(const Message& prototype, const std::string& message_type, Convert&& convert) const {
+    if (m_arena_size == 0) {
+      std::unique_ptr<Message> message = new_message(prototype, message_type);
+      return convert(*message);
+    }
+
+    if (t_arena_block.size() < m_arena_size) {
+      t_arena_block.resize(m_arena_size);
+    }
+
+    ArenaOptions arena_options;
+    arena_options.initial_block = t_arena_block.data();
+    arena_options.initial_block_size = t_arena_block.size();
+
+    Arena arena(arena_options);
+
+    Message* message = prototype.New(&arena);
+
+    if (message == nullptr) {
+      throw std::runtime_error("Could not create an empty message of type \"" + message_type + "\"");
+    }
+
+    return convert(*message);
+  }
+
+  std::string to_json(const Message& prototype, const std::string& message_type, std::string_view data,
+                      const JsonOptions& options, const std::optional<Projection>& projection = std::nullopt) const {
+    check_projection_options(options, projection);
+
+    return with_message(prototype, message_type, [&](Message& message) {
+      // parse data
+
+      parse_wire(message, data, message_type, projection);
+
+      // write json
+
+      return format_json(print_json(message, message_type, json_print_options(options)), options);
+    });
+  }
+
+  std::string from_json(const Message& prototype, const std::string& message_type, const std::string& data,
+                        const ParseOptions& options) const {
+    return with_message(prototype, message_type, [&](Message& message) {
+      // parse json
+
+      parse_json(message, data, message_type, json_parse_options(options));
+
+      // write wire format
+
+      return serialize(message, message_type);
+    });
+  }
+
+  // Parses data[begin] to data[end - 1] into one reused message, calling
+  // visit(index, message) for each; see parse_many.
+  template <typename Visit>
+  static void parse_range(const Message& prototype, const std::string& message_type,
+                          const std::vector<std::string_view>& data, std::size_t begin, std::size_t end,
+                          const std::optional<Projection>& projection, Visit&& visit) {
+    std::unique_ptr<Message> message = new_message(prototype, message_type);
+
+    for (std::size_t i = begin; i < end; ++i) {
+      try {
+        parse_wire(*message, data[i], message_type, projection);
+        visit(i, std::as_const(*message));
+      } catch (const std::runtime_error& e) {
+        throw std::runtime_error("Payload " + std::to_string(i) + ": " + e.what());
+      }
+    }
+  }
+
   FieldInfo describe_field(const FieldDescriptor* field) const {
     FieldInfo info;
     info.name = field->name();
@@ -493,127 +1219,289 @@ private:
   }
 
 public:
-  void add_proto(const std::string& filename, const std::string& content) {
-    ParserErrorCollector error_collector;
+  // `arena_size` is the size in bytes of the arena block each thread keeps for
+  // to_json and from_json. Messages that fit are decoded without touching the
+  // heap; larger ones spill into further arena blocks. 0 turns arenas off.
+  explicit Context(std::size_t arena_size = DEFAULT_ARENA_SIZE) : m_arena_size(arena_size) {}
 
+  void add_proto(const std::string& filename, const std::string& content) {
     // parsing is lock-free (only local variables)
-    ArrayInputStream raw_input(content.c_str(), static_cast<int>(content.size()));
-    Tokenizer input(&raw_input, &error_collector);
+    add_file_descriptor(parse_proto(filename, content));
+  }
 
-    FileDescriptorProto file_descriptor_proto;
-    Parser parser;
-    parser.RecordErrorsTo(&error_collector);
+  // Adds a file that was parsed before, e.g. by parse_proto. Its imports must
+  // have been added already, as for add_proto.
+  void add_file_descriptor(const FileDescriptorProto& file_descriptor_proto) {
+    std::unique_lock lock(m_mutex);
+    build_file(file_descriptor_proto);
+  }
 
-    if (!parser.Parse(&input, &file_descriptor_proto)) {
-      std::string msg = "Could not parse proto";
-      if (error_collector.has_errors()) {
-        msg += ":\n" + error_collector.errors();
-      }
-      throw std::runtime_error(msg);
+  // Parses the (filename, content) pairs of `files` on up to `workers`
+  // threads -- 0 means one per hardware thread -- and adds them in the order
+  // of their imports, under a single exclusive lock. Files imported from
+  // outside `files` must have been added already. If a file does not parse,
+  // none is added; if one does not link, the files built before it stay added.
+  void add_protos(const std::vector<std::pair<std::string, std::string>>& files, std::size_t workers = 0) {
+    std::vector<FileDescriptorProto> parsed(files.size());
+
+    // parsing is lock-free (only local variables), and a file is worth a
+    // thread of its own
+    run_in_parallel(
+        files.size(), workers,
+        [&](std::size_t begin, std::size_t end) {
+          for (std::size_t i = begin; i < end; ++i) {
+            parsed[i] = parse_proto(files[i].first, files[i].second);
+          }
+        },
+        1);
+
+    std::vector<const FileDescriptorProto*> pointers;
+    pointers.reserve(parsed.size());
+
+    for (const FileDescriptorProto& file_descriptor_proto : parsed) {
+      pointers.push_back(&file_descriptor_proto);
     }
 
-    if (!file_descriptor_proto.has_name()) {
-      file_descriptor_proto.set_name(filename);
-    }
+    build_files(sort_by_imports(pointers));
+  }
 
-    std::unique_lock lock(m_mutex);
+  // Adds every file of `file_descriptor_set` under a single exclusive lock,
+  // each after the files of the set it imports. Files imported from outside
+  // the set must have been added already. If a file does not link, the files
+  // built before it stay added.
+  void add_descriptor_set(const FileDescriptorSet& file_descriptor_set) {
+    std::vector<const FileDescriptorProto*> pointers;
+    pointers.reserve(file_descriptor_set.file_size());
 
-    PoolErrorCollector pool_errors;
+    for (const FileDescriptorProto& file_descriptor_proto : file_descriptor_set.file()) {
+      pointers.push_back(&file_descriptor_proto);
+    }
 
-    const FileDescriptor* file_desc = m_pool.BuildFileCollectingErrors(file_descriptor_proto, &pool_errors);
+    build_files(sort_by_imports(pointers));
+  }
 
-    if (file_desc == nullptr) {
-      std::string msg = "Could not build \"" + file_descriptor_proto.name() + "\"";
+  // Every file added so far, in the order added and thus with every file after
+  // the files it imports, so that add_descriptor_set rebuilds the same pool.
+  FileDescriptorSet export_descriptor_set() const {
+    std::shared_lock lock(m_mutex);
 
-      if (pool_errors.has_errors()) {
-        msg += ":\n" + pool_errors.errors();
-      }
+    FileDescriptorSet file_descriptor_set;
 
-      throw std::runtime_error(msg);
+    for (const std::string& filename : m_filenames) {
+      m_pool.FindFileByName(filename)->CopyTo(file_descriptor_set.add_file());
     }
 
-    m_filenames.push_back(std::string(file_desc->name()));
+    return file_descriptor_set;
   }
 
-  std::string to_json(const std::string& message_type, const std::string& data, const JsonOptions& options = {}) {
+  // With `fields`, a list of dotted field paths such as "trainer.name", only
+  // those fields are decoded and printed; the others are skipped in the wire
+  // format without being parsed, which is cheaper the fewer fields are kept.
+  // Skipped fields are not validated beyond their framing, and required
+  // fields are not checked. Throws std::runtime_error for a path that names
+  // no field, and std::invalid_argument together with include_defaults.
+  std::string to_json(const std::string& message_type, std::string_view data, const JsonOptions& options = {},
+                      const std::optional<std::vector<std::string>>& fields = std::nullopt) {
     std::shared_lock lock(m_mutex);
 
-    // get descriptor
+    const Message& prototype = find_prototype(message_type);
 
-    const Descriptor* descriptor = find_message_type(message_type);
+    return to_json(prototype, message_type, data, options, make_projection(prototype, fields));
+  }
 
-    // generate prototype message
+  // Resolves `message_type` the way to_json does, for callers that walk the
+  // descriptor themselves. Descriptors are never removed from the pool, so the
+  // pointer stays valid for the lifetime of the context.
+  const Descriptor* message_descriptor(const std::string& message_type) const {
+    std::shared_lock lock(m_mutex);
+    return find_message_type(message_type);
+  }
 
-    std::unique_ptr<Message> message = new_message(descriptor, message_type);
+  // Parses every item of `data` as `message_type` and calls visit(index,
+  // message) for it, in order. The lock, the descriptor and the prototype are
+  // set up once for the whole batch, and the message is reused between items,
+  // so `visit` must not hold on to it. A payload that does not parse, or a
+  // runtime_error thrown by `visit`, is rethrown with the payload's position
+  // prepended. `fields` projects the messages like it does for to_json.
+  template <typename Visit>
+  void parse_many(const std::string& message_type, const std::vector<std::string_view>& data, Visit&& visit,
+                  const std::optional<std::vector<std::string>>& fields = std::nullopt) {
+    std::shared_lock lock(m_mutex);
 
-    // parse data
-    //
-    // Parse partially first: a plain ParseFromArray also fails on a well-formed
-    // message that merely lacks required fields, and cannot tell the two apart.
+    const Message& prototype = find_prototype(message_type);
 
-    if (!message->ParsePartialFromArray(data.data(), static_cast<int>(data.size()))) {
-      throw std::runtime_error("Could not parse " + std::to_string(data.size()) + " bytes as message type \"" +
-                               message_type + "\": the data is not valid protobuf wire format");
-    }
+    parse_range(prototype, message_type, data, 0, data.size(), make_projection(prototype, fields), visit);
+  }
 
-    check_initialized(*message, message_type);
+  // Parses `data` as `message_type` into a message of its own, for callers
+  // that read the message themselves. Only the parsing holds the lock, so the
+  // caller can read the message without it, e.g. to run Python code. Unlike
+  // to_json this allocates the message on the heap rather than this thread's
+  // arena block. `fields` projects the message like it does for to_json.
+  std::unique_ptr<Message> decode(const std::string& message_type, std::string_view data,
+                                  const std::optional<std::vector<std::string>>& fields = std::nullopt) {
+    std::shared_lock lock(m_mutex);
 
-    // write json
+    const Message& prototype = find_prototype(message_type);
 
-    std::string out;
+    std::unique_ptr<Message> message = new_message(prototype, message_type);
+    parse_wire(*message, data, message_type, make_projection(prototype, fields));
 
-    util::JsonPrintOptions print_options;
-    print_options.always_print_fields_with_no_presence = options.include_defaults;
-    print_options.add_whitespace = options.pretty;
-    print_options.preserve_proto_field_names = options.proto_field_names;
-    print_options.always_print_enums_as_ints = options.enums_as_ints;
-    print_options.unquote_int64_if_possible = options.unquote_int64;
+    return message;
+  }
 
-    absl::Status status = util::MessageToJsonString(*message, &out, print_options);
+  // The counterpart of decode: an empty message of `message_type`, for callers
+  // that fill it themselves without holding the lock and then pass it to
+  // encode.
+  std::unique_ptr<Message> empty_message(const std::string& message_type) {
+    std::shared_lock lock(m_mutex);
 
-    if (!status.ok()) {
-      throw std::runtime_error("Could not convert message of type \"" + message_type +
-                               "\" to json: " + collapse_spaces(status.message()));
+    return new_message(find_prototype(message_type), message_type);
+  }
+
+  // Returns a message filled after empty_message serialized, after checking
+  // for required fields like from_json does.
+  static std::string encode(const Message& message, const std::string& message_type) {
+    check_initialized(message, message_type);
+
+    return serialize(message, message_type);
+  }
+
+  // Same as to_json for every item of `data`, with the per-call setup done once
+  // for the whole batch. Results are returned in the order of `data`. With
+  // more than one worker, the batch is split across threads as
+  // run_in_parallel describes; an invalid payload still reports its position
+  // in `data`, and the first of several is the one thrown. `fields` projects
+  // the messages like it does for to_json, resolving the paths once.
+  //
+  // With `prefixes`, which needs options.json_dumps_format, prefixes[i] holds
+  // JSON object members, such as "\"id\": 1", that are written in front of
+  // the fields of message i and formatted along with them. Throws
+  // std::invalid_argument without json_dumps_format, or if there is not one
+  // prefix per item of `data`.
+  std::vector<std::string> to_json_many(const std::string& message_type, const std::vector<std::string_view>& data,
+                                        const JsonOptions& options = {}, std::size_t workers = 1,
+                                        const std::optional<std::vector<std::string>>& fields = std::nullopt,
+                                        const std::optional<std::vector<std::string>>& prefixes = std::nullopt) {
+    const util::JsonPrintOptions print_options = json_print_options(options);
+
+    if (prefixes && !options.json_dumps_format) {
+      throw std::invalid_argument("prefixes can only be used with json_dumps_format");
+    }
+
+    if (prefixes && prefixes->size() != data.size()) {
+      throw std::invalid_argument("prefixes must have one item per payload, not " + std::to_string(prefixes->size()) +
+                                  " for " + std::to_string(data.size()));
     }
 
+    // Held for the whole call, so the workers need no lock of their own.
+    std::shared_lock lock(m_mutex);
+
+    const Message& prototype = find_prototype(message_type);
+    const std::optional<Projection> projection = make_projection(prototype, fields);
+    check_projection_options(options, projection);
+
+    std::vector<std::string> out(data.size());
+
+    run_in_parallel(data.size(), workers, [&](std::size_t begin, std::size_t end) {
+      parse_range(prototype, message_type, data, begin, end, projection,
+                  [&](std::size_t index, const Message& message) {
+                    out[index] = format_json(print_json(message, message_type, print_options), options,
+                                             prefixes ? std::string_view((*prefixes)[index]) : std::string_view());
+                  });
+    });
+
     return out;
   }
 
   std::string from_json(const std::string& message_type, const std::string& data, const ParseOptions& options = {}) {
     std::shared_lock lock(m_mutex);
 
-    // get descriptor
+    return from_json(find_prototype(message_type), message_type, data, options);
+  }
 
-    const Descriptor* descriptor = find_message_type(message_type);
+  // Resolves `message_type` once and returns a handle that converts messages
+  // of that type without looking it up again. Throws like to_json for an
+  // unknown type.
+  MessageHandle message_handle(const std::string& message_type) {
+    std::shared_lock lock(m_mutex);
 
-    // generate prototype message
+    return MessageHandle(*this, message_type, find_prototype(message_type));
+  }
 
-    std::unique_ptr<Message> message = new_message(descriptor, message_type);
+  // The encoding counterpart of parse_many: calls fill(index, message) for
+  // every index below `count` on a cleared message, then serializes it. The
+  // results are returned in order. A runtime_error thrown by `fill`, or a
+  // message missing required fields, is rethrown with "Row <index>: "
+  // prepended.
+  template <typename Fill>
+  std::vector<std::string> serialize_many(const std::string& message_type, std::size_t count, Fill&& fill) {
+    std::shared_lock lock(m_mutex);
 
-    // parse json
+    std::unique_ptr<Message> message = new_message(find_prototype(message_type), message_type);
 
-    util::JsonParseOptions parse_options;
-    parse_options.ignore_unknown_fields = options.ignore_unknown_fields;
+    std::vector<std::string> out;
+    out.reserve(count);
+
+    for (std::size_t i = 0; i < count; ++i) {
+      try {
+        message->Clear();
+        fill(i, *message);
+        check_initialized(*message, message_type);
+        out.push_back(serialize(*message, message_type));
+      } catch (const std::runtime_error& e) {
+        throw std::runtime_error("Row " + std::to_string(i) + ": " + e.what());
+      }
+    }
 
-    absl::Status status = util::JsonStringToMessage(data, message.get(), parse_options);
+    return out;
+  }
 
-    if (!status.ok()) {
-      throw std::runtime_error("Could not convert json to message type \"" + message_type +
-                               "\": " + collapse_spaces(status.message()));
-    }
+  // Same as from_json for every item of `data`, with the lock, the descriptor
+  // and the prototype set up once for the whole batch. Without
+  // `collect_errors`, the first invalid document throws and the batch is lost;
+  // with it, a failed document leaves its slot in `messages` empty and is
+  // reported in `errors`, and the rest of the batch is still encoded.
+  // `workers` splits the batch across threads like to_json_many does.
+  EncodeResult from_json_many(const std::string& message_type, const std::vector<std::string>& data,
+                              const ParseOptions& options = {}, bool collect_errors = false, std::size_t workers = 1) {
+    const util::JsonParseOptions parse_options = json_parse_options(options);
 
-    // Checked before serializing, not after: SerializeToString happily emits a
-    // proto2 message that is missing required fields, which would hand the
-    // caller bytes that to_json then refuses to read back.
-    check_initialized(*message, message_type);
+    std::shared_lock lock(m_mutex);
 
-    std::string out;
+    const Message& prototype = find_prototype(message_type);
 
-    if (!message->SerializeToString(&out)) {
-      throw std::runtime_error("Could not serialize message of type \"" + message_type + "\"");
+    EncodeResult result;
+    result.messages.resize(data.size());
+
+    // Filled per slot, so the workers can report errors without sharing a list.
+    std::vector<std::string> error_messages(collect_errors ? data.size() : 0);
+
+    run_in_parallel(data.size(), workers, [&](std::size_t begin, std::size_t end) {
+      std::unique_ptr<Message> message = new_message(prototype, message_type);
+
+      for (std::size_t i = begin; i < end; ++i) {
+        try {
+          message->Clear();
+          parse_json(*message, data[i], message_type, parse_options);
+          result.messages[i] = serialize(*message, message_type);
+        } catch (const std::runtime_error& e) {
+          if (!collect_errors) {
+            throw std::runtime_error("Document " + std::to_string(i) + ": " + e.what());
+          }
+
+          error_messages[i] = e.what();
+        }
+      }
+    });
+
+    for (std::size_t i = 0; i < error_messages.size(); ++i) {
+      if (!result.messages[i]) {
+        result.errors.push_back(EncodeError{i, std::move(error_messages[i])});
+      }
     }
 
-    return out;
+    return result;
   }
 
   std::string message_type_from_index(const std::string& filename, const std::vector<int>& message_index) {
@@ -691,4 +1579,23 @@ public:
   }
 };
 
+
+// Defined out of line because they need the complete Context. The context's
+// lock is still taken: the pool may be growing through add_proto meanwhile,
+// and the JSON conversion looks types up in it, e.g. for Any.
+
+inline std::string MessageHandle::to_json(std::string_view data, const JsonOptions& options,
+                                          const std::optional<std::vector<std::string>>& fields) const {
+  std::shared_lock lock(m_context->m_mutex);
+
+  return m_context->to_json(*m_prototype, m_message_type, data, options,
+                            Context::make_projection(*m_prototype, fields));
+}
+
+inline std::string MessageHandle::from_json(const std::string& data, const ParseOptions& options) const {
+  std::shared_lock lock(m_context->m_mutex);
+
+  return m_context->from_json(*m_prototype, m_message_type, data, options);
+}
+
 }  // namespace protosaurus
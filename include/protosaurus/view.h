@@ -0,0 +1,228 @@
+#pragma once
+
+#include <protosaurus/protosaurus.h>
+
+#include <algorithm>    // stable_sort, equal_range
+#include <bit>          // bit_cast
+#include <cstddef>      // size_t
+#include <cstdint>      // int64_t, uint64_t, int32_t, uint32_t
+#include <span>         // span
+#include <stdexcept>    // runtime_error
+#include <string>       // string, to_string
+#include <string_view>  // string_view
+#include <vector>       // vector
+
+// Lazy access to single fields of wire format messages. A WireMessage locates
+// its fields on first access, reading only their tags and lengths, and a
+// field's values are decoded only when they are asked for, straight from the
+// encoded bytes.
+
+namespace protosaurus {
+
+// Where one field of an encoded message is. For a length-delimited field or a
+// group the value is its contents, without the length or the end tag.
+struct WireField {
+  int number;
+  int wire_type;
+  std::size_t begin;
+  std::size_t end;
+};
+
+
+// A message of a known type in its wire format. It refers to the data and to
+// the descriptor, which must outlive it, and is not safe to use from more than
+// one thread at a time.
+class WireMessage {
+public:
+  WireMessage(const Descriptor* descriptor, std::string_view data) : m_descriptor(descriptor), m_data(data) {}
+
+  const Descriptor* descriptor() const { return m_descriptor; }
+
+  std::string_view data() const { return m_data; }
+
+  // The occurrences of field `number`, in wire order. The first call locates
+  // every field of the message and keeps their positions, so later calls are
+  // lookups. Throws std::runtime_error if the data is not valid wire format.
+  std::span<const WireField> find(int number) const {
+    if (!m_indexed) index();
+
+    const auto [first, last] = std::equal_range(m_fields.begin(), m_fields.end(), number, ByNumber{});
+    return {first, last};
+  }
+
+  std::string_view value(const WireField& field) const { return m_data.substr(field.begin, field.end - field.begin); }
+
+  // The contents of the singular message or group field `field`, empty if it
+  // is not set. A message that occurs more than once is the merge of its
+  // occurrences, which in the wire format is their concatenation; that is
+  // built in `scratch`, which the result then points into.
+  std::string_view message(const FieldDescriptor* field, std::string& scratch) const {
+    const int wire_type = wire_type_of(field->type());
+    const WireField* single = nullptr;
+    std::size_t count = 0;
+
+    for (const WireField& occurrence : find(field->number())) {
+      if (occurrence.wire_type != wire_type) continue;
+
+      single = &occurrence;
+      ++count;
+    }
+
+    if (count <= 1) return single == nullptr ? std::string_view() : value(*single);
+
+    scratch.clear();
+
+    for (const WireField& occurrence : find(field->number())) {
+      if (occurrence.wire_type == wire_type) scratch += value(occurrence);
+    }
+
+    return scratch;
+  }
+
+private:
+  struct ByNumber {
+    bool operator()(const WireField& field, int number) const { return field.number < number; }
+    bool operator()(int number, const WireField& field) const { return number < field.number; }
+  };
+
+  const Descriptor* m_descriptor;
+  std::string_view m_data;
+  // Sorted by number, and in wire order for each number.
+  mutable std::vector<WireField> m_fields;
+  mutable bool m_indexed = false;
+
+  void index() const {
+    try {
+      std::size_t position = 0;
+
+      while (position < m_data.size()) {
+        const Varint tag = read_varint(m_data, position);
+        const std::size_t end = skip_field(m_data, tag.offset, tag.value);
+
+        WireField field{static_cast<int>(tag.value >> 3), static_cast<int>(tag.value & 7), tag.offset, end};
+
+        if (field.number == 0) throw MalformedWire();
+
+        if (field.wire_type == 2) {
+          field.begin = read_varint(m_data, tag.offset).offset;
+        } else if (field.wire_type == 3) {
+          // the end tag is the start tag with the wire type 4
+          std::size_t end_tag_size = 1;
+          for (std::uint64_t rest = (tag.value + 1) >> 7; rest != 0; rest >>= 7) ++end_tag_size;
+          field.end = end - end_tag_size;
+        }
+
+        m_fields.push_back(field);
+        position = end;
+      }
+    } catch (const std::exception&) {
+      m_fields.clear();
+      throw std::runtime_error("Could not parse " + std::to_string(m_data.size()) + " bytes as message type \"" +
+                               std::string(m_descriptor->full_name()) +
+                               "\": the data is not valid protobuf wire format");
+    }
+
+    std::stable_sort(m_fields.begin(), m_fields.end(),
+                     [](const WireField& a, const WireField& b) { return a.number < b.number; });
+    m_indexed = true;
+  }
+};
+
+
+// Reads one value of the scalar `type` from the start of `data`, written with
+// the type's own wire type, passes it to visit and returns the position after
+// it. See visit_scalars for the type of the value.
+template <typename Visit>
+std::size_t read_scalar(std::string_view data, FieldDescriptor::Type type, Visit& visit) {
+  switch (type) {
+    case FieldDescriptor::TYPE_DOUBLE:
+      visit(std::bit_cast<double>(read_fixed(data, 8)));
+      return 8;
+    case FieldDescriptor::TYPE_FLOAT:
+      visit(std::bit_cast<float>(static_cast<std::uint32_t>(read_fixed(data, 4))));
+      return 4;
+    case FieldDescriptor::TYPE_FIXED64:
+      visit(read_fixed(data, 8));
+      return 8;
+    case FieldDescriptor::TYPE_SFIXED64:
+      visit(static_cast<std::int64_t>(read_fixed(data, 8)));
+      return 8;
+    case FieldDescriptor::TYPE_FIXED32:
+      visit(static_cast<std::uint32_t>(read_fixed(data, 4)));
+      return 4;
+    case FieldDescriptor::TYPE_SFIXED32:
+      visit(static_cast<std::int32_t>(static_cast<std::uint32_t>(read_fixed(data, 4))));
+      return 4;
+    default:
+      break;
+  }
+
+  const Varint varint = read_varint(data, 0);
+
+  switch (type) {
+    case FieldDescriptor::TYPE_INT32:
+    case FieldDescriptor::TYPE_ENUM:
+      visit(static_cast<std::int32_t>(varint.value));
+      break;
+    case FieldDescriptor::TYPE_SINT32:
+      visit(static_cast<std::int32_t>(zigzag_decode(varint.value)));
+      break;
+    case FieldDescriptor::TYPE_SINT64:
+      visit(zigzag_decode(varint.value));
+      break;
+    case FieldDescriptor::TYPE_UINT32:
+      visit(static_cast<std::uint32_t>(varint.value));
+      break;
+    case FieldDescriptor::TYPE_UINT64:
+      visit(varint.value);
+      break;
+    case FieldDescriptor::TYPE_BOOL:
+      visit(varint.value != 0);
+      break;
+    default:
+      visit(static_cast<std::int64_t>(varint.value));
+  }
+
+  return varint.offset;
+}
+
+
+// Calls visit(value) for every value of the scalar, string or bytes field
+// `field` of `message`, in wire order: one for each occurrence, or a run of
+// them for a packed one. The value has the C++ type of the field -- an enum
+// is its int32_t number, and a string or bytes a std::string_view into the
+// data. An occurrence whose wire type does not fit the field is skipped, as
+// protobuf keeps it as an unknown field. Throws std::runtime_error if a
+// packed run is cut short, and like WireMessage::find.
+template <typename Visit>
+void visit_scalars(const WireMessage& message, const FieldDescriptor* field, Visit&& visit) {
+  const int wire_type = wire_type_of(field->type());
+
+  for (const WireField& occurrence : message.find(field->number())) {
+    std::string_view value = message.value(occurrence);
+
+    if (occurrence.wire_type == wire_type) {
+      // skip_field checked that the value is complete
+      if (wire_type == 2) {
+        visit(value);
+      } else {
+        read_scalar(value, field->type(), visit);
+      }
+    } else if (occurrence.wire_type == 2 && field->is_packable()) {
+      while (!value.empty()) {
+        std::size_t size = 0;
+
+        try {
+          size = read_scalar(value, field->type(), visit);
+        } catch (const std::runtime_error&) {
+          throw std::runtime_error("Could not read field \"" + std::string(field->full_name()) +
+                                   "\": the data is not valid protobuf wire format");
+        }
+
+        value.remove_prefix(size);
+      }
+    }
+  }
+}
+
+}  // namespace protosaurus
@@ -1,6 +1,21 @@
-from protosaurus.protosaurus_ext import Context, read_varint
+from protosaurus.protosaurus_ext import (
+    Context,
+    MessageFilter,
+    MessageHandle,
+    MessageView,
+    parse_proto,
+    read_kcat_records,
+    read_varint,
+    read_varints,
+)
 
 __all__ = [
     "Context",
+    "MessageFilter",
+    "MessageHandle",
+    "MessageView",
+    "parse_proto",
+    "read_kcat_records",
     "read_varint",
+    "read_varints",
 ]
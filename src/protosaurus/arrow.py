@@ -1,3 +1,5 @@
+from collections.abc import Sequence
+
 from protosaurus import Context
 
 try:
@@ -43,6 +45,49 @@ def derive_schema(ctx: Context, type_name: str, *, max_depth: int | None = None)
     return pa.schema(fields)
 
 
+def to_record_batch(
+    ctx: Context, type_name: str, payloads: Sequence[bytes], *, max_depth: int | None = None
+) -> pa.RecordBatch:
+    """
+    Decode the wire-format messages in `payloads` into a pyarrow RecordBatch.
+
+    The schema is `derive_schema(ctx, type_name, max_depth=max_depth)`, and the
+    columns are filled natively, without going through JSON. A field that
+    tracks presence is null when unset; any other field holds its value, which
+    is the default when it is absent from the wire. An enum number without a
+    name in the schema is null.
+    """
+    schema = derive_schema(ctx, type_name, max_depth=max_depth)
+    array = ctx.to_arrow(type_name, payloads, schema)
+    return pa.record_batch(_CapsuleArray(schema, array))
+
+
+def from_record_batch(
+    ctx: Context, type_name: str, batch: pa.RecordBatch, *, delimited: bool = False
+) -> list[bytes] | bytes:
+    """
+    Encode every row of `batch` as a wire-format `type_name` message.
+
+    The columns must use the types `derive_schema` maps their fields to; a
+    column the message does not have is an error, while a field without a
+    column is left unset, as is every field whose slot is null. Returns one
+    bytes object per row, or with `delimited=True` a single buffer holding
+    every row prefixed with its varint length.
+    """
+    return ctx.from_arrow(type_name, batch, delimited=delimited)
+
+
+class _CapsuleArray:
+    # Hands the array capsule from Context.to_arrow and its schema to pyarrow
+    # through the Arrow PyCapsule interface. The capsule can be imported once.
+    def __init__(self, schema: pa.Schema, array: object) -> None:
+        self._schema = schema
+        self._array = array
+
+    def __arrow_c_array__(self, requested_schema: object = None) -> tuple[object, object]:
+        return self._schema.__arrow_c_schema__(), self._array
+
+
 def _struct_fields(
     ctx: Context, type_name: str, path: tuple[str, ...], max_depth: int | None
 ) -> list[pa.Field]:
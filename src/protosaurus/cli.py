@@ -1,16 +1,34 @@
+import hashlib
 import json
-import struct
+import os
+import sys
+import tempfile
+from collections.abc import Collection, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
 from typing import BinaryIO
+from urllib.parse import quote
 
 import click
 import requests
 
-from protosaurus import Context, read_varint
+from protosaurus import Context, MessageFilter, parse_proto, read_varint, read_varints
+from protosaurus.kcat import Record, iter_record_batches
 
 # utility: compile protos from schema-registry
 
+_SchemaKey = tuple[str, int]
+
 _schema_cache: dict[int, Context] = {}
+# Shared by all schema IDs, so that a reference imported by many of them is
+# downloaded once per (subject, version) and parsed once per import name.
+_reference_cache: dict[_SchemaKey, dict] = {}
+_descriptor_cache: dict[tuple[str, int, str], bytes] = {}
 _session: requests.Session | None = None
+# Set by --schema-cache-dir. Registry responses for a schema ID or a subject
+# version never change, so they are kept there across runs, together with the
+# parsed schemas, in a directory per registry.
+_schema_cache_dir: Path | None = None
 
 
 def _get_session(verify_ssl: bool) -> requests.Session:
@@ -21,6 +39,10 @@ def _get_session(verify_ssl: bool) -> requests.Session:
     return _session
 
 
+# References are fetched with this many requests in flight at once.
+_MAX_FETCH_WORKERS = 8
+
+
 def _get_schema_by_id(url: str, id: int, verify_ssl: bool = True) -> Context:
     ctx = _schema_cache.get(id)
 
@@ -29,22 +51,17 @@ def _get_schema_by_id(url: str, id: int, verify_ssl: bool = True) -> Context:
 
     ctx = Context()
 
-    session = _get_session(verify_ssl)
-    response = session.get(f"{url}/schemas/ids/{id}")
-    response.raise_for_status()
-    data = response.json()
+    data = _fetch_json(
+        _get_session(verify_ssl), f"{url}/schemas/ids/{id}", _cache_path(url, "ids", f"{id}.json")
+    )
 
-    for reference in data.get("references", []):
-        _get_schema(
-            url,
-            reference["name"],
-            reference["subject"],
-            reference["version"],
-            ctx,
-            verify_ssl,
-        )
+    references = data.get("references", [])
+    schemas = _fetch_references(url, references, verify_ssl)
+    _add_references(url, ctx, references, schemas, set())
 
-    ctx.add_proto("<<<MAIN>>>", data["schema"])
+    ctx.add_file_descriptor(
+        _parse_proto("<<<MAIN>>>", data["schema"], _cache_path(url, "ids", f"{id}.pb"))
+    )
 
     _schema_cache[id] = ctx
 
@@ -59,30 +76,165 @@ def _get_schema(
     ctx: Context,
     verify_ssl: bool = True,
 ) -> None:
-    session = _get_session(verify_ssl)
-    response = session.get(f"{url}/subjects/{subject}/versions/{version}")
+    references = [{"name": name, "subject": subject, "version": version}]
+    schemas = _fetch_references(url, references, verify_ssl)
+    _add_references(url, ctx, references, schemas, set())
+
+
+# Reads the response from `cache_path` if it is there, and otherwise fetches
+# it and stores it there.
+def _fetch_json(session: requests.Session, url: str, cache_path: Path | None = None) -> dict:
+    if cache_path is not None and cache_path.exists():
+        return json.loads(cache_path.read_bytes())
+
+    response = session.get(url)
     response.raise_for_status()
     data = response.json()
 
-    for reference in data.get("references", []):
-        _get_schema(
-            url,
-            reference["name"],
-            reference["subject"],
-            reference["version"],
-            ctx,
-            verify_ssl,
-        )
+    if cache_path is not None:
+        _write_cache_file(cache_path, json.dumps(data).encode())
+
+    return data
+
+
+# The same for a parsed .proto, stored as a serialized FileDescriptorProto.
+def _parse_proto(name: str, content: str, cache_path: Path | None) -> bytes:
+    if cache_path is not None and cache_path.exists():
+        return cache_path.read_bytes()
+
+    descriptor = parse_proto(name, content)
+
+    if cache_path is not None:
+        _write_cache_file(cache_path, descriptor)
+
+    return descriptor
+
+
+# The path of a cached file of the registry at `url`. Schema IDs and subjects
+# are only unique within one registry, so each has its own directory, named
+# after a hash of its URL.
+def _cache_path(url: str, *parts: str) -> Path | None:
+    if _schema_cache_dir is None:
+        return None
+
+    registry = hashlib.sha256(url.encode()).hexdigest()[:16]
+
+    # subjects and import names may contain slashes
+    return _schema_cache_dir.joinpath(registry, *(quote(part, safe="") for part in parts))
+
+
+# Written to a temporary file that is then renamed, so that concurrent runs
+# sharing the directory never read a partially written file.
+def _write_cache_file(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_name, path)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+# Fetches the whole reference graph below `references`, deduplicated by
+# subject and version and served from _reference_cache where possible. A
+# schema's own references are requested as soon as it arrives, so independent
+# branches are fetched concurrently instead of one round-trip at a time.
+def _fetch_references(url: str, references: list[dict], verify_ssl: bool) -> dict[_SchemaKey, dict]:
+    session = _get_session(verify_ssl)
+    schemas: dict[_SchemaKey, dict] = {}
+    requested: set[_SchemaKey] = set()
+    pending: dict[Future, _SchemaKey] = {}
+
+    with ThreadPoolExecutor(max_workers=_MAX_FETCH_WORKERS) as pool:
+
+        def request(references: list[dict]) -> None:
+            for reference in references:
+                key = (reference["subject"], reference["version"])
+
+                if key in requested:
+                    continue
+
+                requested.add(key)
+
+                cached = _reference_cache.get(key)
+
+                if cached is not None:
+                    schemas[key] = cached
+                    request(cached.get("references", []))
+                    continue
+
+                subject, version = key
+                future = pool.submit(
+                    _fetch_json,
+                    session,
+                    f"{url}/subjects/{subject}/versions/{version}",
+                    _cache_path(url, "subjects", subject, f"{version}.json"),
+                )
+                pending[future] = key
 
-    ctx.add_proto(name, data["schema"])
+        request(references)
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    key = pending.pop(future)
+                    schemas[key] = _reference_cache[key] = future.result()
+                    request(schemas[key].get("references", []))
+        finally:
+            # do not wait for requests that are no longer needed after an error
+            for future in pending:
+                future.cancel()
+
+    return schemas
+
+
+# Adds the schemas fetched from the registry at `url` depth-first, so that
+# every proto is added after the protos it imports. `added` holds the schemas
+# already in `ctx`.
+def _add_references(
+    url: str,
+    ctx: Context,
+    references: list[dict],
+    schemas: dict[_SchemaKey, dict],
+    added: set[_SchemaKey],
+) -> None:
+    for reference in references:
+        key = (reference["subject"], reference["version"])
+
+        if key in added:
+            continue
+
+        added.add(key)
+        data = schemas[key]
+
+        _add_references(url, ctx, data.get("references", []), schemas, added)
+
+        ctx.add_file_descriptor(_parse_reference(url, reference, data))
+
+
+def _parse_reference(url: str, reference: dict, data: dict) -> bytes:
+    subject, version, name = key = (reference["subject"], reference["version"], reference["name"])
+    descriptor = _descriptor_cache.get(key)
+
+    if descriptor is None:
+        cache_path = _cache_path(url, "subjects", subject, str(version), f"{name}.pb")
+        descriptor = _parse_proto(name, data["schema"], cache_path)
+        _descriptor_cache[key] = descriptor
+
+    return descriptor
 
 
 # utility: read message
 
 
-# The message index is a zigzag-encoded varint array, so read_varint is called
-# with zigzag=True here. Returns the index together with the offset just after
-# it, so the caller can slice off the message that follows.
+# The message index is a zigzag-encoded varint array, so it is read with
+# zigzag=True here. Returns the index together with the offset just after it,
+# so the caller can slice off the message that follows.
 def _read_index_array(data: bytes, offset: int) -> tuple[list[int], int]:
     size, offset = read_varint(data, offset, zigzag=True)
 
@@ -92,24 +244,252 @@ def _read_index_array(data: bytes, offset: int) -> tuple[list[int], int]:
     if size == 0:
         return [0], offset
 
-    msg_index: list[int] = []
+    msg_index, offset = read_varints(data, offset, size, zigzag=True)
+
+    return msg_index.tolist(), offset
+
+
+# utility: read records
+
+
+# The framing and the schema registry header are parsed natively, a chunk at a
+# time, and each payload is a view into its chunk. A truncated stream is
+# reported as a usage error: click would turn the EOFError into a bare
+# "Aborted!".
+def _read_record_batches(file: BinaryIO) -> Iterator[list[Record]]:
+    try:
+        yield from iter_record_batches(file)
+    except EOFError as e:
+        raise click.ClickException(str(e)) from e
+
+
+# utility: select records
+
+
+# Decides which records are decoded at all, from their framing and schema
+# registry header alone, and for --where from the fields it compares, which
+# are read from the wire without decoding the records. Only the message type
+# and --where filters need a schema, and they are checked after the schema ID
+# filter, so schemas that the schema ID filter rules out are never fetched.
+# Every Nth record is sampled from those that pass the other filters.
+class _RecordFilter:
+    def __init__(
+        self,
+        schema_registry: str,
+        verify_ssl: bool,
+        from_offset: int | None = None,
+        to_offset: int | None = None,
+        every_nth: int = 1,
+        schema_ids: Collection[int] = (),
+        message_types: Collection[str] = (),
+        where: str | None = None,
+        jobs: int = 1,
+    ) -> None:
+        self._schema_registry = schema_registry
+        self._verify_ssl = verify_ssl
+        self._from_offset = from_offset
+        self._to_offset = to_offset
+        self._every_nth = every_nth
+        self._schema_ids = frozenset(schema_ids)
+        self._message_types = frozenset(message_types)
+        self._where = where
+        self._jobs = jobs
+        self._matches: dict[tuple[int, tuple[int, ...]], bool] = {}
+        self._where_filters: dict[tuple[int, tuple[int, ...]], MessageFilter] = {}
+        self._count = 0
+
+    def select(self, records: list[Record]) -> list[Record]:
+        candidates = []
+
+        for record in records:
+            offset, _, schema_id, message_index, _ = record
+
+            if self._from_offset is not None and offset < self._from_offset:
+                continue
+
+            if self._to_offset is not None and offset > self._to_offset:
+                continue
+
+            if self._schema_ids and schema_id not in self._schema_ids:
+                continue
+
+            if self._message_types and not self._matches_message_type(schema_id, message_index):
+                continue
+
+            candidates.append(record)
 
-    for _ in range(size):
-        value, offset = read_varint(data, offset, zigzag=True)
-        msg_index.append(value)
+        if self._where is not None:
+            candidates = self._select_where(candidates, self._where)
 
-    return msg_index, offset
+        selected = []
+
+        for record in candidates:
+            self._count += 1
+
+            if (self._count - 1) % self._every_nth == 0:
+                selected.append(record)
+
+        return selected
+
+    def _matches_message_type(self, schema_id: int, message_index: list[int]) -> bool:
+        key = (schema_id, tuple(message_index))
+        matches = self._matches.get(key)
+
+        if matches is None:
+            ctx = _get_schema_by_id(self._schema_registry, schema_id, self._verify_ssl)
+            message_type = ctx.message_type_from_index("<<<MAIN>>>", message_index)
+            matches = self._matches[key] = message_type in self._message_types
+
+        return matches
+
+    # The records of one schema ID and message index are tested together with
+    # one filter_many call, like _decode_batch decodes them.
+    def _select_where(self, records: list[Record], where: str) -> list[Record]:
+        groups: dict[tuple[int, tuple[int, ...]], list[int]] = {}
+
+        for i, (_, _, schema_id, message_index, _) in enumerate(records):
+            groups.setdefault((schema_id, tuple(message_index)), []).append(i)
+
+        keep = [False] * len(records)
+
+        for key, indices in groups.items():
+            message_filter = self._where_filter(key, where)
+
+            try:
+                matched = message_filter.filter_many(
+                    [records[i][4] for i in indices], workers=self._jobs
+                )
+            except RuntimeError as e:
+                e.add_note(
+                    f"Payload positions count the {message_filter.message_type} records from "
+                    f"offset {records[indices[0]][0]} on."
+                )
+                raise
+
+            for position in matched:
+                keep[indices[position]] = True
+
+        return [record for record, kept in zip(records, keep, strict=True) if kept]
+
+    def _where_filter(self, key: tuple[int, tuple[int, ...]], where: str) -> MessageFilter:
+        message_filter = self._where_filters.get(key)
+
+        if message_filter is None:
+            schema_id, message_index = key
+            ctx = _get_schema_by_id(self._schema_registry, schema_id, self._verify_ssl)
+            message_type = ctx.message_type_from_index("<<<MAIN>>>", list(message_index))
+
+            try:
+                message_filter = ctx.compile_filter(message_type, where)
+            except RuntimeError as e:
+                raise click.BadParameter(str(e), param_hint="'--where'") from e
+
+            self._where_filters[key] = message_filter
+
+        return message_filter
+
+
+# utility: decode records
+
+
+# Decodes a batch of records and returns the output line of each, in order:
+# the message JSON with @offset and @key in front, printed as json.dumps prints
+# it, with indent=2 if `pretty`. The records of one schema ID and message index
+# are decoded together with one to_json_many call, which splits them across
+# `jobs` native threads and adds @offset and @key itself, so that the JSON is
+# not parsed and printed again here.
+def _decode_batch(
+    records: list[Record],
+    schema_registry: str,
+    verify_ssl: bool,
+    jobs: int,
+    *,
+    pretty: bool = False,
+    include_defaults: bool = False,
+    proto_field_names: bool = False,
+    enums_as_ints: bool = False,
+    unquote_int64: bool = False,
+) -> list[str]:
+    groups: dict[tuple[int, tuple[int, ...]], list[int]] = {}
+
+    for i, (_, _, schema_id, message_index, _) in enumerate(records):
+        groups.setdefault((schema_id, tuple(message_index)), []).append(i)
+
+    messages = [""] * len(records)
+
+    for (schema_id, message_index), indices in groups.items():
+        # compile protos form schema-registry
+
+        proto_ctx = _get_schema_by_id(schema_registry, schema_id, verify_ssl)
+
+        message_type = proto_ctx.message_type_from_index("<<<MAIN>>>", list(message_index))
+
+        try:
+            documents = proto_ctx.to_json_many(
+                message_type,
+                [records[i][4] for i in indices],
+                pretty=pretty,
+                include_defaults=include_defaults,
+                proto_field_names=proto_field_names,
+                enums_as_ints=enums_as_ints,
+                unquote_int64=unquote_int64,
+                json_dumps_format=True,
+                prefixes=[_record_prefix(*records[i][:2]) for i in indices],
+                workers=jobs,
+            )
+        except RuntimeError as e:
+            e.add_note(
+                f"Payload positions count the {message_type} records from offset "
+                f"{records[indices[0]][0]} on."
+            )
+            raise
+
+        for i, document in zip(indices, documents, strict=True):
+            messages[i] = document
+
+    return messages
 
 
 # utility: format output record
 
 
-def _format_record(offset: str, key: str, message_json: str, pretty: bool = False) -> str:
-    record: dict[str, object] = {"@offset": int(offset), "@key": key}
-    record.update(json.loads(message_json))
-    # The record wraps the message in @offset/@key and is re-serialised here, so
-    # indentation has to be applied at this step rather than by to_json.
-    return json.dumps(record, indent=2 if pretty else None)
+# The @offset and @key members that to_json_many puts in front of the message.
+def _record_prefix(offset: int | str, key: str) -> str:
+    return f'"@offset":{int(offset)},"@key":{json.dumps(key)}'
+
+
+# utility: write output
+
+# Output is written in blocks of about this many characters.
+_OUTPUT_BLOCK_SIZE = 1 << 20
+
+
+# Collects the output lines and writes them to `stream` in large blocks, so
+# that a long dump costs one encode and one write per block rather than per
+# record. With `flush_every` set, the lines are also written and flushed after
+# that many records, for output that is read while it is produced.
+class _OutputBuffer:
+    def __init__(self, stream: BinaryIO, flush_every: int = 0) -> None:
+        self._stream = stream
+        self._flush_every = flush_every
+        self._lines: list[str] = []
+        self._size = 0
+
+    def write(self, line: str) -> None:
+        self._lines.append(line)
+        self._size += len(line) + 1
+
+        if self._size >= _OUTPUT_BLOCK_SIZE or len(self._lines) == self._flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._lines:
+            self._lines.append("")
+            self._stream.write("\n".join(self._lines).encode())
+            self._lines.clear()
+            self._size = 0
+
+        self._stream.flush()
 
 
 @click.command()
@@ -133,6 +513,13 @@ def _format_record(offset: str, key: str, message_json: str, pretty: bool = Fals
     help="Print fields that do not track presence even when they hold their default.",
 )
 @click.option("--pretty", is_flag=True, default=False, help="Indent the output.")
+@click.option(
+    "--schema-cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Keep schema-registry responses and parsed schemas in this directory, so that later "
+    "runs skip fetching and parsing them, and work offline once it is warm.",
+)
 @click.option(
     "--proto-field-names",
     is_flag=True,
@@ -151,56 +538,119 @@ def _format_record(offset: str, key: str, message_json: str, pretty: bool = Fals
     default=False,
     help="Print 64-bit integers unquoted when the value fits a double exactly.",
 )
+@click.option(
+    "--flush-every",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Flush the output after every N records, e.g. 1 to see each record as soon as it is "
+    "decoded. 0 flushes only in large blocks, the default unless the output is a terminal.",
+)
+@click.option(
+    "--from-offset",
+    type=int,
+    default=None,
+    help="Skip records with a lower Kafka offset.",
+)
+@click.option(
+    "--to-offset",
+    type=int,
+    default=None,
+    help="Skip records with a higher Kafka offset.",
+)
+@click.option(
+    "--every-nth",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Decode only every Nth of the records that pass the other filters.",
+)
+@click.option(
+    "--schema-id",
+    "schema_ids",
+    type=int,
+    multiple=True,
+    help="Decode only records with this schema ID. Can be given several times.",
+)
+@click.option(
+    "--message-type",
+    "message_types",
+    multiple=True,
+    help="Decode only records of this fully qualified message type. Can be given several times.",
+)
+@click.option(
+    "--where",
+    default=None,
+    help='Decode only records that match this filter, e.g. \'status == "FAILED" and region in '
+    '("eu", "us")\'. The fields it compares are read without decoding the records.',
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="Decode on this many threads; 0 uses one per CPU core. The output stays in input order.",
+)
 def main(
     file: BinaryIO,
     schema_registry: str,
     no_verify: bool,
     defaults: bool,
     pretty: bool,
+    schema_cache_dir: Path | None,
     proto_field_names: bool,
     enums_as_ints: bool,
     unquote_int64: bool,
+    flush_every: int | None,
+    from_offset: int | None,
+    to_offset: int | None,
+    every_nth: int,
+    schema_ids: tuple[int, ...],
+    message_types: tuple[str, ...],
+    where: str | None,
+    jobs: int,
 ) -> None:
-    verify_ssl = not no_verify
-    while True:
-        offset = file.readline().decode("utf-8")[:-1]
-        key = file.readline().decode("utf-8")[:-1]
-
-        raw_length_bytes = file.read(4)
-
-        if len(raw_length_bytes) != 4:
-            if len(raw_length_bytes) != 0:
-                raise Exception("Unexpected EOF")
-            break
-
-        (raw_length,) = struct.unpack(">I", raw_length_bytes)
-        raw = file.read(raw_length)
-
-        # read header
-
-        magic_byte, schema_id = struct.unpack_from(">bI", raw, 0)
-
-        if magic_byte != 0:
-            raise RuntimeError(f"Incorrect magic byte ({magic_byte}).")
+    global _schema_cache_dir
+    _schema_cache_dir = schema_cache_dir
 
-        # Not named `offset`: that already holds the Kafka record offset here.
-        message_index, message_start = _read_index_array(raw, 5)
-
-        # compile protos form schema-registry
-
-        proto_ctx = _get_schema_by_id(schema_registry, schema_id, verify_ssl)
-
-        message_buffer = raw[message_start:]
-
-        message_type = proto_ctx.message_type_from_index("<<<MAIN>>>", message_index)
-
-        message = proto_ctx.to_json(
-            message_type,
-            message_buffer,
-            include_defaults=defaults,
-            proto_field_names=proto_field_names,
-            enums_as_ints=enums_as_ints,
-            unquote_int64=unquote_int64,
-        )
+    verify_ssl = not no_verify
 
-        print(_format_record(offset, key, message, pretty=pretty))
+    stdout = sys.stdout.buffer
+
+    if flush_every is None:
+        flush_every = 1 if stdout.isatty() else 0
+
+    output = _OutputBuffer(stdout, flush_every)
+
+    record_filter = _RecordFilter(
+        schema_registry,
+        verify_ssl,
+        from_offset,
+        to_offset,
+        every_nth,
+        schema_ids,
+        message_types,
+        where,
+        jobs,
+    )
+
+    try:
+        for batch in _read_record_batches(file):
+            # filtered before anything is decoded, or any schema fetched for it
+            records = record_filter.select(batch)
+            messages = _decode_batch(
+                records,
+                schema_registry,
+                verify_ssl,
+                jobs,
+                pretty=pretty,
+                include_defaults=defaults,
+                proto_field_names=proto_field_names,
+                enums_as_ints=enums_as_ints,
+                unquote_int64=unquote_int64,
+            )
+
+            for message in messages:
+                output.write(message)
+    finally:
+        # what was decoded before an error is still written
+        output.flush()
@@ -0,0 +1,90 @@
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from protosaurus import read_kcat_records
+
+# Bytes requested from the file per read, as in protosaurus.stream.
+_CHUNK_SIZE = 1 << 20
+
+Record = tuple[int, str, int, list[int], memoryview]
+
+
+def iter_records(fileobj: BinaryIO, *, chunk_size: int = _CHUNK_SIZE) -> Iterator[Record]:
+    """
+    Yield the records of a kcat output stream written with
+    `-f "%o\\n%k\\n%R%s"`, each as an (offset, key, schema_id, message_index,
+    payload) tuple.
+
+    `fileobj` is read in chunks of up to `chunk_size` bytes, or more when a
+    single record is larger, and every chunk is split into records by one
+    `read_kcat_records` call. The payload -- the message after the schema
+    registry header -- is a memoryview slice of its chunk, so nothing is
+    copied; note that a slice keeps its whole chunk alive for as long as it is
+    referenced.
+
+    Raises EOFError if the stream ends in the middle of a record, and
+    RuntimeError for a record that is not in the schema registry format.
+    """
+    for records in iter_record_batches(fileobj, chunk_size=chunk_size):
+        yield from records
+
+
+def iter_record_batches(
+    fileobj: BinaryIO, *, chunk_size: int = _CHUNK_SIZE
+) -> Iterator[list[Record]]:
+    """
+    Yield the records of a kcat output stream like `iter_records` does, but as
+    one list per chunk read from `fileobj`, for callers that process records
+    in batches. A list is never empty.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f'chunk_size must be positive, not {chunk_size}')
+
+    # read1 returns what is available instead of waiting for a full chunk, so
+    # records from a live `kcat -C` pipe are yielded as they arrive
+    read = getattr(fileobj, 'read1', fileobj.read)
+    pending = b''
+
+    while True:
+        # once the length prefix of the record `pending` starts with has been
+        # read, the rest of the record is read before it is parsed again, and
+        # the chunks are joined once instead of once per chunk
+        size = _record_size(pending)
+        chunks = [pending] if pending else []
+        available = len(pending)
+
+        while True:
+            chunk = read(max(chunk_size, size - available))
+
+            if not chunk:
+                break
+
+            chunks.append(chunk)
+            available += len(chunk)
+
+            if available >= size:
+                break
+
+        if available == len(pending):
+            if pending:
+                raise EOFError(f'Stream ends inside a record, {len(pending)} bytes in.')
+            return
+
+        data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        records, offset = read_kcat_records(data)
+        pending = data[offset:]
+
+        if records:
+            yield records
+
+
+def _record_size(data: bytes) -> int:
+    # The size of the record that `data` starts with, or 0 while its offset,
+    # key or value length is not complete yet.
+    offset_end = data.find(b'\n')
+    key_end = data.find(b'\n', offset_end + 1) if offset_end >= 0 else -1
+
+    if key_end < 0 or len(data) < key_end + 5:
+        return 0
+
+    return key_end + 5 + int.from_bytes(data[key_end + 1 : key_end + 5], 'big')
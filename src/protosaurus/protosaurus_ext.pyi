@@ -1,4 +1,8 @@
-from collections.abc import Sequence
+import array
+from collections.abc import Buffer, Sequence
+from typing import Any, Literal, overload
+
+import numpy
 
 
 class Context:
@@ -10,7 +14,16 @@ class Context:
     a shared one, so a single context can be shared across threads.
     """
 
-    def __init__(self) -> None: ...
+    def __init__(self, *, arena_size: int = 65536) -> None:
+        """
+        Create an empty context.
+
+        to_json and from_json build each message on an arena, starting with a block
+        of `arena_size` bytes that every thread keeps between calls. A message that
+        fits into the block is converted without any heap allocation for the message
+        itself; a larger one spills into further arena blocks, which are freed in one
+        go. Pass arena_size=0 to allocate every message on the heap instead.
+        """
 
     def add_proto(self, filename: str, content: str) -> None:
         """
@@ -24,16 +37,113 @@ class Context:
         parser or linker diagnostics appended.
         """
 
-    def to_json(self, message_type: str, data: bytes, *, include_defaults: bool = False, pretty: bool = False, proto_field_names: bool = False, enums_as_ints: bool = False, unquote_int64: bool = False) -> str:
+    def add_protos(self, files: dict[str, str], *, workers: int = 0) -> None:
+        """
+        Add many .proto files at once, given as a {filename: content} dict.
+
+        The files are parsed in parallel on up to `workers` threads -- 0, the default,
+        uses one thread per CPU core -- and then added in the order of their imports,
+        so the dict can list them in any order. Files imported from outside the dict
+        must have been added already. All files are added under one exclusive lock,
+        so concurrent conversions are held up once rather than once per file.
+
+        Raises RuntimeError if a file does not parse, in which case none is added, if
+        the imports form a cycle, or if a file does not link; the files added before
+        that one stay added.
+        """
+
+    def add_file_descriptor(self, data: Buffer) -> None:
+        """
+        Add a .proto file that was parsed before, given as a serialized
+        FileDescriptorProto -- as parse_proto returns it.
+
+        Use this to parse a file once and add it to many contexts. As with
+        add_proto, the files it imports must have been added already.
+
+        Raises RuntimeError if `data` is not a FileDescriptorProto or the file does
+        not link.
+        """
+
+    def add_descriptor_set(self, data: Buffer) -> None:
+        """
+        Add every file of a serialized FileDescriptorSet, without parsing any .proto
+        text.
+
+        Each file is added after the files of the set it imports, whatever order the
+        set lists them in; files imported from outside the set must have been added
+        already. Sets from export_descriptor_set as well as those written by protoc
+        --descriptor_set_out --include_imports load this way. Files that are already
+        in the context are skipped if they are identical.
+
+        Raises RuntimeError if `data` is not a FileDescriptorSet, if the imports form
+        a cycle, or if a file does not link; the files added before that one stay
+        added.
+        """
+
+    def export_descriptor_set(self) -> bytes:
+        """
+        Return every file added so far as a serialized FileDescriptorSet.
+
+        The files are listed in the order they were added, so each comes after the
+        files it imports, and add_descriptor_set rebuilds the same schemas in another
+        context -- or another process -- far faster than parsing the .proto files
+        again.
+        """
+
+    def to_json(self, message_type: str, data: Buffer, *, include_defaults: bool = False, pretty: bool = False, proto_field_names: bool = False, enums_as_ints: bool = False, unquote_int64: bool = False, fields: Sequence[str] | None = None, json_dumps_format: bool = False) -> str:
         """
         Decode `data` from the protobuf wire format and return it as a JSON string.
 
         `message_type` is the fully qualified name, so "zoo.Animal" for a message in
         `package zoo`. With no options set, the output is plain ProtoJSON.
 
+        `data` is bytes or any other contiguous buffer -- a bytearray, a memoryview
+        slice, an mmap -- and is read in place, without copying it first.
+
+        Pass fields=[...] to decode only some fields, given as field paths such as
+        "name", "trainer.name" for a field of a submessage, or "keepers.name" for
+        that field in every message of a repeated field; names and JSON names both
+        work. All other fields are skipped in the wire format without being parsed,
+        so the fewer fields are asked for, the faster the call. Skipped fields are
+        not validated beyond their framing, and required fields are not checked.
+        fields cannot be combined with include_defaults, which would print the
+        fields left out as if they held their defaults, and raises ValueError.
+
+        With json_dumps_format=True, the JSON is exactly what
+        json.dumps(json.loads(...)) makes of it: ", " and ": " between items,
+        characters outside printable ASCII escaped, and floats as Python prints
+        them. With pretty=True as well, it is laid out as json.dumps does with
+        indent=2.
+
         Raises RuntimeError if the type is unknown -- the message then lists the known
-        types -- if the data is not valid wire format, or if a proto2 message is
-        missing required fields.
+        types -- if the data is not valid wire format, if a proto2 message is
+        missing required fields, or if a field path names no field.
+        """
+
+    def to_json_many(self, message_type: str, payloads: Sequence[Buffer], *, include_defaults: bool = False, pretty: bool = False, proto_field_names: bool = False, enums_as_ints: bool = False, unquote_int64: bool = False, workers: int = 1, fields: Sequence[str] | None = None, json_dumps_format: bool = False, prefixes: Sequence[str] | None = None) -> list[str]:
+        """
+        Decode every item of `payloads` like to_json and return the JSON strings in
+        the same order.
+
+        The type is looked up and the options are applied once for the whole batch,
+        and the GIL is released for all of it, so this is considerably faster than
+        calling to_json in a loop for many small messages. Takes the same options as
+        to_json, including fields.
+
+        prefixes=[...], which needs json_dumps_format=True, holds one string per
+        payload of JSON object members, such as '"id": 1', that are written in front
+        of the fields of its message and formatted along with them. Raises
+        ValueError without json_dumps_format, or if there is not one prefix per
+        payload.
+
+        With workers=N, the batch is split into up to N contiguous parts that are
+        decoded in parallel on native threads; workers=0 uses one thread per CPU
+        core. Small batches use fewer threads, as each gets at least 64 payloads. The
+        results are in order either way.
+
+        Raises RuntimeError as to_json does; for an invalid payload the message starts
+        with its position in `payloads`, and with several invalid payloads it is the
+        first of them.
         """
 
     def from_json(self, message_type: str, json: str, *, ignore_unknown_fields: bool = False) -> bytes:
@@ -49,6 +159,106 @@ class Context:
         schema, or if required fields are missing.
         """
 
+    @overload
+    def from_json_many(self, message_type: str, documents: Sequence[str], *, ignore_unknown_fields: bool = False, on_error: Literal['raise'] = 'raise', workers: int = 1) -> list[bytes]:
+        """
+        Encode every JSON document of `documents` like from_json, in one call.
+
+        The type is looked up once for the whole batch and the GIL is released for
+        all of it. ignore_unknown_fields behaves as for from_json, and workers as for
+        to_json_many.
+
+        With on_error="raise", the default, the list of wire format bytes is
+        returned, and the first document that fails raises RuntimeError with its
+        position at the start of the message. With on_error="collect", a pair
+        (messages, errors) is returned instead: a failed document is None in messages
+        and listed in errors as an (index, error message) pair, and the rest of the
+        batch is still encoded.
+
+        Raises RuntimeError if the type is unknown, in either mode.
+        """
+
+    @overload
+    def from_json_many(self, message_type: str, documents: Sequence[str], *, ignore_unknown_fields: bool = False, on_error: Literal['collect'], workers: int = 1) -> tuple[list[bytes | None], list[tuple[int, str]]]: ...
+
+    def to_dict(self, message_type: str, data: Buffer, *, include_defaults: bool = False, proto_field_names: bool = False, enums_as_ints: bool = False, fields: Sequence[str] | None = None) -> dict[str, Any]:
+        """
+        Decode `data` from the protobuf wire format and return it as a dict.
+
+        The dict has the same keys and nesting as the JSON from to_json, and takes
+        the options of the same name, but holds Python values instead of JSON ones:
+        64-bit integers are ints rather than strings, bytes fields are bytes rather
+        than base64, and map keys keep their type. Enum values are their names, or
+        ints with enums_as_ints=True and for numbers the enum does not define.
+        Well-known types such as google.protobuf.Timestamp are dicts of their fields.
+
+        No JSON is printed or parsed on the way, so this is faster than
+        json.loads(to_json(...)). fields=[...] decodes only the given field paths, as
+        for to_json.
+
+        Raises RuntimeError as to_json does.
+        """
+
+    def from_dict(self, message_type: str, obj: dict[str, Any], *, ignore_unknown_fields: bool = False) -> bytes:
+        """
+        Encode the dict `obj` as a protobuf message and return the wire format bytes.
+
+        This is the reverse of to_dict. Keys are field names or their JSON names, and
+        a value of None leaves its field unset. Integer fields take ints and reject
+        values out of their range, float fields take floats or ints, bytes fields
+        take any bytes-like object, enum fields take a value's name or number,
+        message and map fields take dicts and repeated fields lists or tuples. Pass
+        ignore_unknown_fields=True to skip keys the schema does not define instead of
+        failing on them.
+
+        Raises RuntimeError if the type is unknown, if a value does not match its
+        field -- the message names the field by its path -- or if required fields are
+        missing.
+        """
+
+    def message_handle(self, message_type: str) -> MessageHandle:
+        """
+        Resolve `message_type` once and return a MessageHandle for it.
+
+        The handle converts messages of that type like to_json and from_json do, but
+        without looking the type up by name on every call -- worthwhile on hot paths
+        that convert many messages of a few types. It keeps the context alive and
+        stays valid when more protos are added.
+
+        Raises RuntimeError if the type is unknown, listing the known types.
+        """
+
+    def to_arrow(self, message_type: str, payloads: Sequence[Buffer], schema: object) -> object:
+        """
+        Decode every item of `payloads` into Arrow columns laid out as `schema`.
+
+        This is the building block of protosaurus.arrow.to_record_batch, which is
+        what most callers want. `schema` is a pyarrow Schema -- or anything else that
+        implements __arrow_c_schema__ -- whose fields name fields of the message with
+        matching types, as derive_schema produces it. The result is a PyCapsule
+        holding the record batch as an Arrow C data interface struct array.
+
+        Raises RuntimeError if the type is unknown, if a payload is not valid wire
+        format (naming its position), or if the schema does not fit the message.
+        """
+
+    def from_arrow(self, message_type: str, batch: object, *, delimited: bool = False) -> list[bytes] | bytes:
+        """
+        Encode every row of `batch` as a `message_type` message.
+
+        This is the building block of protosaurus.arrow.from_record_batch, which is
+        what most callers want. `batch` is a pyarrow RecordBatch -- or anything else
+        that implements __arrow_c_array__ -- whose columns name fields of the message
+        with the types derive_schema maps them to. Columns the batch does not have and
+        null slots leave their field unset.
+
+        Returns one bytes object per row, or with delimited=True a single bytes object
+        holding every row prefixed with its length as a varint.
+
+        Raises RuntimeError if the type is unknown, if a column does not fit the
+        message, or if a row cannot be encoded (naming the row).
+        """
+
     def message_type_from_index(self, filename: str, message_index: Sequence[int]) -> str:
         """
         Resolve a Confluent message index to a fully qualified message type.
@@ -61,6 +271,72 @@ class Context:
         the range of messages it addresses.
         """
 
+    def view(self, message_type: str, data: Buffer) -> MessageView:
+        """
+        Return a read-only MessageView of the wire format message `data`.
+
+        Nothing is decoded up front. The first field accessed locates every field of
+        the message, reading only tags and lengths, and keeps their positions; each
+        access then decodes just the field asked for, straight from `data`. This is
+        far cheaper than to_json or to_dict when only a few fields of a message are
+        needed, for routing or keying say:
+
+            animal = ctx.view("zoo.Animal", payload)
+            animal["trainer"]["name"]  # or animal.trainer.name
+
+        The view reads `data` in place and keeps it alive, so a bytearray cannot be
+        resized while the view or any view taken from it exists.
+
+        Raises RuntimeError if the type is unknown, listing the known types.
+        """
+
+    def extract_column(self, message_type: str, payloads: Sequence[Buffer], path: str, *, mask: bool = False, workers: int = 1) -> numpy.ndarray | tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Read the field at `path` from every item of `payloads`, wire format
+        messages of `message_type`, into a 1-D numpy array.
+
+        `path` is a dotted path as for to_json's fields, such as "stats.latency_ms",
+        through singular submessages to a singular number, bool or enum field. The
+        array has the dtype of the field -- int32, int64, uint32, uint64, float32,
+        float64 or bool, and int32 holding the numbers of an enum. Each message is
+        read at the tag level down the path, so nothing but the field is decoded;
+        this is much faster than decoding the messages to pick one value out of
+        each.
+
+        An item that does not set the field gives its default. Pass mask=True to get
+        a (values, mask) tuple instead, where mask is a bool array telling which
+        items hold a value for the field. With workers=N, the batch is split across
+        up to N native threads as for to_json_many; workers=0 uses one thread per
+        CPU core.
+
+        Requires numpy. Raises RuntimeError if the type is unknown or the path does
+        not lead to such a field, and, naming its position, for a payload that is
+        not valid wire format along the path.
+        """
+
+    def compile_filter(self, message_type: str, expression: str) -> MessageFilter:
+        """
+        Compile `expression` into a MessageFilter for messages of `message_type`.
+
+        The expression compares fields with literals and combines the comparisons,
+        for example
+
+            status == "FAILED" and region in ("eu", "us")
+
+        Fields are addressed by paths as for to_json's fields, such as
+        "trainer.name". Literals are strings in double or single quotes, integers,
+        floats, true and false; an enum field compares with the name of a value or
+        its number. The operators are ==, !=, <, <=, >, >=, in (...) and not in (...),
+        combined with and, or, not and parentheses.
+
+        A field that is not set compares as its default. A repeated field, or one
+        reached through a repeated field, matches if any of its values does; != and
+        not in match if none does.
+
+        Raises RuntimeError, naming the position in the expression, if it does not
+        parse or does not fit the message type, and if the type is unknown.
+        """
+
     def describe(self, type_name: str) -> dict:
         """
         Describe a message or enum type's shape.
@@ -79,7 +355,109 @@ class Context:
         known, with a listing of known message and enum types.
         """
 
-def read_varint(data: bytes, offset: int = 0, *, zigzag: bool = False) -> tuple[int, int]:
+class MessageView:
+    """
+    A wire format message whose fields are decoded on access. Obtained from
+    Context.view.
+
+    Fields are looked up by name or JSON name, as view["name"] or view.name;
+    attributes of the view itself, such as message_type, take precedence over
+    fields of the same name. Values are as to_dict gives them -- enums as the name
+    of their value, bytes as bytes, repeated fields as lists and maps as dicts --
+    except that messages are views too, and that a field that is not set gives
+    its default, an empty view for a message. `"name" in view` tells whether the
+    data holds a value for the field.
+
+    Raises RuntimeError on access if the data is not valid protobuf wire format,
+    KeyError or AttributeError for a field the message type does not have.
+    """
+
+    @property
+    def message_type(self) -> str:
+        """The fully qualified name of the message type."""
+
+    def __getitem__(self, name: str, /) -> Any: ...
+
+    def __getattr__(self, name: str, /) -> Any: ...
+
+    def __contains__(self, name: str, /) -> bool: ...
+
+class MessageFilter:
+    """
+    A predicate over wire format messages of one type, evaluated without parsing
+    them. Obtained from Context.compile_filter.
+    """
+
+    @property
+    def message_type(self) -> str:
+        """The fully qualified name of the message type."""
+
+    @property
+    def expression(self) -> str:
+        """The expression the filter was compiled from."""
+
+    def matches(self, data: Buffer) -> bool:
+        """
+        Return whether the wire format message `data` matches the filter.
+
+        Every comparison reads its field straight from the encoded bytes, skipping
+        all other fields after their tag and length, so this is much cheaper than
+        decoding the message. The fields that are skipped are only checked for their
+        framing.
+
+        Raises RuntimeError if the data is not valid wire format.
+        """
+
+    def filter_many(self, payloads: Sequence[Buffer], *, workers: int = 1) -> list[int]:
+        """
+        Return the positions of the items of `payloads` that match the filter, in
+        order.
+
+        The GIL is released for the whole batch, and workers splits it across native
+        threads as for Context.to_json_many. Raises RuntimeError like matches, with
+        the position of the invalid payload at the start of the message.
+        """
+
+class MessageHandle:
+    """
+    A message type of a Context, resolved once. Obtained from
+    Context.message_handle.
+    """
+
+    @property
+    def message_type(self) -> str:
+        """The fully qualified name of the message type."""
+
+    def to_json(self, data: Buffer, *, include_defaults: bool = False, pretty: bool = False, proto_field_names: bool = False, enums_as_ints: bool = False, unquote_int64: bool = False, fields: Sequence[str] | None = None, json_dumps_format: bool = False) -> str:
+        """
+        Decode `data` from the protobuf wire format and return it as a JSON string.
+
+        Same as Context.to_json for this handle's message type, with the same
+        options.
+        """
+
+    def from_json(self, json: str, *, ignore_unknown_fields: bool = False) -> bytes:
+        """
+        Encode the JSON document `json` as a protobuf message and return the wire
+        format bytes.
+
+        Same as Context.from_json for this handle's message type.
+        """
+
+def parse_proto(filename: str, content: str) -> bytes:
+    """
+    Parse a .proto definition and return it as a serialized FileDescriptorProto,
+    without adding it to any context.
+
+    `filename` becomes the name of the file, as for Context.add_proto. Imports are
+    not resolved until the result is passed to Context.add_file_descriptor, so a
+    file can be parsed once and added to any number of contexts.
+
+    Raises RuntimeError if the content does not parse, with the parser
+    diagnostics appended.
+    """
+
+def read_varint(data: Buffer, offset: int = 0, *, zigzag: bool = False) -> tuple[int, int]:
     """
     Read one base-128 varint from `data`, starting at `offset`.
 
@@ -93,3 +471,40 @@ def read_varint(data: bytes, offset: int = 0, *, zigzag: bool = False) -> tuple[
     Raises EOFError if the data ends mid-varint, RuntimeError for a varint longer
     than ten bytes, and IndexError for a negative offset or one past the end.
     """
+
+def read_varints(data: Buffer, offset: int = 0, count: int | None = None, *, zigzag: bool = False) -> tuple[array.array[int], int]:
+    """
+    Read consecutive base-128 varints from `data` in one call, starting at
+    `offset`.
+
+    Reads `count` varints, or all of them up to the end of `data` if count is
+    None. Returns the values as an array.array -- of typecode "Q", or "q" with
+    zigzag=True -- together with the position just after the last one. Much
+    faster than calling read_varint once per value, e.g. for packed repeated
+    fields.
+
+    Raises EOFError if the data ends before `count` varints or mid-varint,
+    RuntimeError for a varint longer than ten bytes, IndexError for a negative
+    offset or one past the end, and ValueError for a negative count.
+    """
+
+def read_kcat_records(data: Buffer, offset: int = 0) -> tuple[list[tuple[int, str, int, list[int], memoryview]], int]:
+    """
+    Read the records that kcat writes with -f "%o\\n%k\\n%R%s" from `data`,
+    starting at `offset`.
+
+    Every record is the Kafka offset and key on a line each, followed by the value
+    prefixed with its 32-bit big-endian length. The value must carry the schema
+    registry header: a zero magic byte, the schema ID and the message index array.
+
+    Returns the complete records as (offset, key, schema_id, message_index,
+    payload) tuples, with the payload -- the message after the header -- as a
+    memoryview slice of `data`, together with the position of the first record
+    that `data` ends inside of, where reading continues once more data is there.
+    protosaurus.kcat.iter_records does that for a file.
+
+    Raises RuntimeError for an offset that is not a number, a wrong magic byte or
+    an implausible message index array, EOFError if a value ends inside its
+    message index array, UnicodeDecodeError for a key that is not UTF-8, and
+    IndexError for a negative offset or one past the end.
+    """
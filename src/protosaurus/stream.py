@@ -0,0 +1,194 @@
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import islice
+from typing import BinaryIO
+
+from protosaurus import Context, read_varint
+
+# Bytes requested from the file per read. Large enough that the per-chunk
+# Python work -- one read, one concatenation, one to_json_many call -- is
+# negligible next to decoding the messages in it.
+_CHUNK_SIZE = 1 << 20
+
+# Documents encoded per from_json_many call by write_delimited.
+_WRITE_BATCH_SIZE = 1024
+
+
+def iter_messages(fileobj: BinaryIO, *, chunk_size: int = _CHUNK_SIZE) -> Iterator[memoryview]:
+    """
+    Yield the messages of a varint length-delimited stream as raw wire format.
+
+    `fileobj` is read in chunks of `chunk_size` bytes, or more when a single
+    message is larger. Every message is a memoryview slice of the chunk it
+    was read with, so nothing is copied; note that a slice keeps its whole
+    chunk alive for as long as it is referenced.
+
+    Raises EOFError if the stream ends in the middle of a message.
+    """
+    for messages in _iter_batches(fileobj, chunk_size):
+        yield from messages
+
+
+def iter_delimited(
+    ctx: Context,
+    type_name: str,
+    fileobj: BinaryIO,
+    *,
+    chunk_size: int = _CHUNK_SIZE,
+    include_defaults: bool = False,
+    pretty: bool = False,
+    proto_field_names: bool = False,
+    enums_as_ints: bool = False,
+    unquote_int64: bool = False,
+    workers: int = 1,
+    fields: Sequence[str] | None = None,
+) -> Iterator[str]:
+    """
+    Yield every `type_name` message of a varint length-delimited stream as JSON.
+
+    The stream is read like `iter_messages` does, and the messages of each
+    chunk are decoded with one `to_json_many` call, which takes the remaining
+    options, including `workers` to decode each chunk on several threads and
+    `fields` to decode only some fields.
+
+    Raises EOFError if the stream ends in the middle of a message, and
+    RuntimeError as `to_json_many` does; the position it names counts from the
+    first message of the chunk, which a note on the error gives.
+    """
+    count = 0
+
+    for messages in _iter_batches(fileobj, chunk_size):
+        try:
+            documents = ctx.to_json_many(
+                type_name,
+                messages,
+                include_defaults=include_defaults,
+                pretty=pretty,
+                proto_field_names=proto_field_names,
+                enums_as_ints=enums_as_ints,
+                unquote_int64=unquote_int64,
+                workers=workers,
+                fields=fields,
+            )
+        except RuntimeError as e:
+            e.add_note(f'Payload positions count from message {count} of the stream.')
+            raise
+
+        count += len(messages)
+        yield from documents
+
+
+def write_messages(fileobj: BinaryIO, messages: Iterable[bytes]) -> int:
+    """
+    Write wire-format `messages` to `fileobj`, each prefixed with its length
+    as a varint, which is what `iter_messages` reads back.
+
+    The output is collected in chunks before it is written. Returns the number
+    of messages written.
+    """
+    count = 0
+    buffer = bytearray()
+
+    for message in messages:
+        buffer += _encode_varint(len(message))
+        buffer += message
+        count += 1
+
+        if len(buffer) >= _CHUNK_SIZE:
+            fileobj.write(buffer)
+            buffer.clear()
+
+    if buffer:
+        fileobj.write(buffer)
+
+    return count
+
+
+def write_delimited(
+    ctx: Context,
+    type_name: str,
+    fileobj: BinaryIO,
+    documents: Iterable[str],
+    *,
+    ignore_unknown_fields: bool = False,
+    workers: int = 1,
+) -> int:
+    """
+    Encode the JSON `documents` as `type_name` messages and write them to
+    `fileobj` as a varint length-delimited stream, the counterpart of
+    `iter_delimited`.
+
+    The documents are encoded in batches with `from_json_many`, on `workers`
+    threads, which raises RuntimeError for a document that does not fit the schema. Returns the
+    number of messages written.
+    """
+    count = 0
+    documents = iter(documents)
+
+    while batch := list(islice(documents, _WRITE_BATCH_SIZE)):
+        try:
+            messages = ctx.from_json_many(
+                type_name, batch, ignore_unknown_fields=ignore_unknown_fields, workers=workers
+            )
+        except RuntimeError as e:
+            e.add_note(f'Document positions count from document {count}.')
+            raise
+
+        count += write_messages(fileobj, messages)
+
+    return count
+
+
+def _iter_batches(fileobj: BinaryIO, chunk_size: int) -> Iterator[list[memoryview]]:
+    if chunk_size <= 0:
+        raise ValueError(f'chunk_size must be positive, not {chunk_size}')
+
+    pending = b''
+    # bytes still missing from the message `pending` ends in, when its length
+    # prefix has been read already
+    missing = 0
+
+    while True:
+        chunk = fileobj.read(max(chunk_size, missing))
+
+        if not chunk:
+            if pending:
+                raise EOFError(f'Stream ends inside a message, {len(pending)} bytes in.')
+            return
+
+        data = pending + chunk if pending else chunk
+        view = memoryview(data)
+        messages = []
+        offset = 0
+        missing = 0
+
+        while offset < len(data):
+            try:
+                size, start = read_varint(view, offset)
+            except EOFError:
+                # the length prefix itself is cut off by the end of the chunk
+                break
+
+            end = start + size
+
+            if end > len(data):
+                missing = end - len(data)
+                break
+
+            messages.append(view[start:end])
+            offset = end
+
+        pending = data[offset:]
+
+        if messages:
+            yield messages
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    out.append(value)
+    return bytes(out)
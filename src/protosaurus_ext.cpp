@@ -1,60 +1,1134 @@
+#include <protosaurus/arrow.h>
+#include <protosaurus/column.h>
+#include <protosaurus/filter.h>
+#include <protosaurus/kcat.h>
 #include <protosaurus/protosaurus.h>
+#include <protosaurus/view.h>
 
 #include <nanobind/nanobind.h>
+#include <nanobind/ndarray.h>
+#include <nanobind/stl/optional.h>
 #include <nanobind/stl/string.h>
 #include <nanobind/stl/vector.h>
 
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+#include <memory>
+#include <optional>
+#include <type_traits>
+#include <unordered_map>
+#include <utility>
+
 namespace nb = nanobind;
 using namespace nb::literals;
 
-using protosaurus::Context;
+using protosaurus::Context;
+using protosaurus::MessageFilter;
+using protosaurus::MessageHandle;
+
+namespace {
+
+// A read-only view of anything that implements the buffer protocol: bytes,
+// bytearray, memoryview, mmap, a numpy array. The buffer stays acquired until
+// the view is destroyed, which keeps the object alive and a bytearray from
+// being resized, so the bytes can be read in place with the GIL released.
+// nanobind destroys argument casters after the call, with the GIL held again.
+class Buffer {
+public:
+  Buffer() = default;
+  Buffer(const Buffer&) = delete;
+  Buffer& operator=(const Buffer&) = delete;
+
+  Buffer(Buffer&& other) noexcept : m_view(other.m_view), m_acquired(std::exchange(other.m_acquired, false)) {}
+
+  Buffer& operator=(Buffer&& other) noexcept {
+    if (this != &other) {
+      release();
+      m_view = other.m_view;
+      m_acquired = std::exchange(other.m_acquired, false);
+    }
+    return *this;
+  }
+
+  ~Buffer() { release(); }
+
+  bool acquire(PyObject* object) noexcept {
+    release();
+
+    if (PyObject_GetBuffer(object, &m_view, PyBUF_SIMPLE) != 0) {
+      PyErr_Clear();
+      return false;
+    }
+
+    m_acquired = true;
+    return true;
+  }
+
+  std::string_view view() const { return {static_cast<const char*>(m_view.buf), static_cast<std::size_t>(m_view.len)}; }
+
+private:
+  void release() noexcept {
+    if (m_acquired) {
+      PyBuffer_Release(&m_view);
+      m_acquired = false;
+    }
+  }
+
+  Py_buffer m_view{};
+  bool m_acquired = false;
+};
+
+}  // namespace
+
+namespace nanobind::detail {
+
+template <>
+struct type_caster<Buffer> {
+  NB_TYPE_CASTER(Buffer, const_name("collections.abc.Buffer"))
+
+  bool from_python(handle src, uint32_t, cleanup_list*) noexcept { return value.acquire(src.ptr()); }
+};
+
+}  // namespace nanobind::detail
+
+namespace {
+
+void add_proto(Context& self, const std::string& filename, const std::string& content) {
+  nb::gil_scoped_release release;
+  self.add_proto(filename, content);
+}
+
+nb::bytes parse_proto(const std::string& filename, const std::string& content) {
+  std::string result;
+  {
+    nb::gil_scoped_release release;
+    result = protosaurus::parse_proto(filename, content).SerializeAsString();
+  }
+
+  return nb::bytes(result.data(), result.size());
+}
+
+void add_file_descriptor(Context& self, const Buffer& data) {
+  const std::string_view view = data.view();
+
+  nb::gil_scoped_release release;
+
+  google::protobuf::FileDescriptorProto file_descriptor_proto;
+
+  if (!file_descriptor_proto.ParseFromArray(view.data(), static_cast<int>(view.size()))) {
+    throw std::runtime_error("Could not parse " + std::to_string(view.size()) +
+                             " bytes as a FileDescriptorProto: the data is not valid protobuf wire format");
+  }
+
+  self.add_file_descriptor(file_descriptor_proto);
+}
+
+void add_protos(Context& self, nb::typed<nb::dict, nb::str, nb::str> files, std::size_t workers) {
+  std::vector<std::pair<std::string, std::string>> contents;
+  contents.reserve(files.size());
+
+  for (auto [filename, content] : files) {
+    if (!nb::isinstance<nb::str>(filename) || !nb::isinstance<nb::str>(content)) {
+      throw nb::type_error("files must map str filenames to str contents");
+    }
+
+    contents.emplace_back(nb::cast<std::string>(filename), nb::cast<std::string>(content));
+  }
+
+  nb::gil_scoped_release release;
+  self.add_protos(contents, workers);
+}
+
+void add_descriptor_set(Context& self, const Buffer& data) {
+  const std::string_view view = data.view();
+
+  nb::gil_scoped_release release;
+
+  google::protobuf::FileDescriptorSet file_descriptor_set;
+
+  if (!file_descriptor_set.ParseFromArray(view.data(), static_cast<int>(view.size()))) {
+    throw std::runtime_error("Could not parse " + std::to_string(view.size()) +
+                             " bytes as a FileDescriptorSet: the data is not valid protobuf wire format");
+  }
+
+  self.add_descriptor_set(file_descriptor_set);
+}
+
+nb::bytes export_descriptor_set(const Context& self) {
+  std::string result;
+  {
+    nb::gil_scoped_release release;
+    result = self.export_descriptor_set().SerializeAsString();
+  }
+
+  return nb::bytes(result.data(), result.size());
+}
+
+protosaurus::JsonOptions json_options(bool include_defaults, bool pretty, bool proto_field_names, bool enums_as_ints,
+                                      bool unquote_int64, bool json_dumps_format) {
+  protosaurus::JsonOptions options;
+  options.include_defaults = include_defaults;
+  options.pretty = pretty;
+  options.proto_field_names = proto_field_names;
+  options.enums_as_ints = enums_as_ints;
+  options.unquote_int64 = unquote_int64;
+  options.json_dumps_format = json_dumps_format;
+  return options;
+}
+
+std::string to_json(Context& self, const std::string& message_type, const Buffer& data, bool include_defaults,
+                    bool pretty, bool proto_field_names, bool enums_as_ints, bool unquote_int64,
+                    const std::optional<std::vector<std::string>>& fields, bool json_dumps_format) {
+  const protosaurus::JsonOptions options =
+      json_options(include_defaults, pretty, proto_field_names, enums_as_ints, unquote_int64, json_dumps_format);
+
+  nb::gil_scoped_release release;
+  return self.to_json(message_type, data.view(), options, fields);
+}
+
+// `payloads` holds every buffer until the call returns, so the views into them
+// stay valid while the GIL is released -- no copies needed.
+std::vector<std::string> to_json_many(Context& self, const std::string& message_type,
+                                      const std::vector<Buffer>& payloads, bool include_defaults, bool pretty,
+                                      bool proto_field_names, bool enums_as_ints, bool unquote_int64,
+                                      std::size_t workers, const std::optional<std::vector<std::string>>& fields,
+                                      bool json_dumps_format, const std::optional<std::vector<std::string>>& prefixes) {
+  std::vector<std::string_view> views;
+  views.reserve(payloads.size());
+
+  for (const Buffer& payload : payloads) {
+    views.push_back(payload.view());
+  }
+
+  const protosaurus::JsonOptions options =
+      json_options(include_defaults, pretty, proto_field_names, enums_as_ints, unquote_int64, json_dumps_format);
+
+  nb::gil_scoped_release release;
+  return self.to_json_many(message_type, views, options, workers, fields, prefixes);
+}
+
+nb::bytes from_json(Context& self, const std::string& message_type, const std::string& json,
+                    bool ignore_unknown_fields) {
+  protosaurus::ParseOptions options;
+  options.ignore_unknown_fields = ignore_unknown_fields;
+
+  std::string result;
+  {
+    nb::gil_scoped_release release;
+    result = self.from_json(message_type, json, options);
+  }
+  // GIL re-acquired, safe to create nb::bytes
+  return nb::bytes(result.data(), result.size());
+}
+
+MessageFilter compile_filter(Context& self, const std::string& message_type, const std::string& expression) {
+  nb::gil_scoped_release release;
+  return protosaurus::compile_filter(self, message_type, expression);
+}
+
+bool filter_matches(const MessageFilter& self, const Buffer& data) {
+  nb::gil_scoped_release release;
+  return self.matches(data.view());
+}
+
+std::vector<std::size_t> filter_many(const MessageFilter& self, const std::vector<Buffer>& payloads,
+                                     std::size_t workers) {
+  std::vector<std::string_view> views;
+  views.reserve(payloads.size());
+
+  for (const Buffer& payload : payloads) {
+    views.push_back(payload.view());
+  }
+
+  nb::gil_scoped_release release;
+  return self.filter_many(views, workers);
+}
+
+MessageHandle message_handle(Context& self, const std::string& message_type) {
+  nb::gil_scoped_release release;
+  return self.message_handle(message_type);
+}
+
+std::string handle_to_json(const MessageHandle& self, const Buffer& data, bool include_defaults, bool pretty,
+                           bool proto_field_names, bool enums_as_ints, bool unquote_int64,
+                           const std::optional<std::vector<std::string>>& fields, bool json_dumps_format) {
+  const protosaurus::JsonOptions options =
+      json_options(include_defaults, pretty, proto_field_names, enums_as_ints, unquote_int64, json_dumps_format);
+
+  nb::gil_scoped_release release;
+  return self.to_json(data.view(), options, fields);
+}
+
+nb::bytes handle_from_json(const MessageHandle& self, const std::string& json, bool ignore_unknown_fields) {
+  protosaurus::ParseOptions options;
+  options.ignore_unknown_fields = ignore_unknown_fields;
+
+  std::string result;
+  {
+    nb::gil_scoped_release release;
+    result = self.from_json(json, options);
+  }
+
+  return nb::bytes(result.data(), result.size());
+}
+
+// In "raise" mode returns the list of wire-format bytes. In "collect" mode
+// returns (messages, errors), where a failed document is None in messages and
+// reported as an (index, message) pair in errors.
+nb::object from_json_many(Context& self, const std::string& message_type, const std::vector<std::string>& documents,
+                          bool ignore_unknown_fields, const std::string& on_error, std::size_t workers) {
+  if (on_error != "raise" && on_error != "collect") {
+    throw nb::value_error(("on_error must be \"raise\" or \"collect\", not \"" + on_error + "\"").c_str());
+  }
+
+  const bool collect_errors = on_error == "collect";
+
+  protosaurus::ParseOptions options;
+  options.ignore_unknown_fields = ignore_unknown_fields;
+
+  protosaurus::EncodeResult result;
+  {
+    nb::gil_scoped_release release;
+    result = self.from_json_many(message_type, documents, options, collect_errors, workers);
+  }
+
+  nb::list messages;
+  for (const auto& message : result.messages) {
+    if (message) {
+      messages.append(nb::bytes(message->data(), message->size()));
+    } else {
+      messages.append(nb::none());
+    }
+  }
+
+  if (!collect_errors) {
+    return messages;
+  }
+
+  nb::list errors;
+  for (const auto& error : result.errors) {
+    errors.append(nb::make_tuple(error.index, error.message));
+  }
+
+  return nb::make_tuple(messages, errors);
+}
+
+// `schema` is anything that exports an ArrowSchema through the PyCapsule
+// interface, so a pyarrow Schema. The result is an "arrow_array" capsule that
+// pyarrow imports without copying; whoever does not import it releases the
+// array when the capsule is collected.
+nb::capsule to_arrow(Context& self, const std::string& message_type, const std::vector<Buffer>& payloads,
+                     nb::object schema) {
+  nb::object schema_capsule = schema.attr("__arrow_c_schema__")();
+
+  const auto* arrow_schema =
+      static_cast<const ArrowSchema*>(PyCapsule_GetPointer(schema_capsule.ptr(), "arrow_schema"));
+
+  if (arrow_schema == nullptr) {
+    throw nb::python_error();
+  }
+
+  std::vector<std::string_view> views;
+  views.reserve(payloads.size());
+
+  for (const Buffer& payload : payloads) {
+    views.push_back(payload.view());
+  }
+
+  auto array = std::make_unique<ArrowArray>();
+  array->release = nullptr;
+
+  {
+    nb::gil_scoped_release release;
+    protosaurus::arrow::to_arrow(self, message_type, views, *arrow_schema, array.get());
+  }
+
+  return nb::capsule(array.release(), "arrow_array", [](void* pointer) noexcept {
+    auto* array = static_cast<ArrowArray*>(pointer);
+    if (array->release != nullptr) array->release(array);
+    delete array;
+  });
+}
+
+// `batch` is anything that exports a struct array through the PyCapsule
+// interface, so a pyarrow RecordBatch. Returns one bytes object per row, or
+// with `delimited` all rows in one buffer, each prefixed with its length as a
+// varint.
+nb::object from_arrow(Context& self, const std::string& message_type, nb::object batch, bool delimited) {
+  nb::tuple capsules = nb::borrow<nb::tuple>(batch.attr("__arrow_c_array__")());
+
+  const auto* arrow_schema = static_cast<const ArrowSchema*>(PyCapsule_GetPointer(capsules[0].ptr(), "arrow_schema"));
+  const auto* arrow_array = static_cast<const ArrowArray*>(PyCapsule_GetPointer(capsules[1].ptr(), "arrow_array"));
+
+  if (arrow_schema == nullptr || arrow_array == nullptr) {
+    throw nb::python_error();
+  }
+
+  std::vector<std::string> messages;
+  std::string buffer;
+  {
+    nb::gil_scoped_release release;
+    messages = protosaurus::arrow::from_arrow(self, message_type, *arrow_schema, *arrow_array);
+
+    if (delimited) {
+      for (const std::string& message : messages) {
+        protosaurus::write_varint(buffer, message.size());
+        buffer += message;
+      }
+    }
+  }
+
+  if (delimited) {
+    return nb::bytes(buffer.data(), buffer.size());
+  }
+
+  nb::list out;
+  for (const std::string& message : messages) {
+    out.append(nb::bytes(message.data(), message.size()));
+  }
+
+  return out;
+}
+
+// to_dict and from_dict walk the message by reflection and build or read the
+// Python objects directly, so both hold the GIL throughout.
+
+struct DictOptions {
+  bool include_defaults = false;
+  bool proto_field_names = false;
+  bool enums_as_ints = false;
+};
+
+nb::dict message_to_dict(const google::protobuf::Message& message, const DictOptions& options);
+
+nb::str utf8_to_str(std::string_view value) {
+  PyObject* str = PyUnicode_DecodeUTF8(value.data(), static_cast<Py_ssize_t>(value.size()), "strict");
+
+  if (str == nullptr) {
+    throw nb::python_error();
+  }
+
+  return nb::steal<nb::str>(str);
+}
+
+// The value of a singular field, or with `index` set, of one element of a
+// repeated field.
+nb::object field_to_python(const google::protobuf::Message& message, const google::protobuf::FieldDescriptor* field,
+                           std::optional<int> index, const DictOptions& options) {
+  using google::protobuf::FieldDescriptor;
+
+  const google::protobuf::Reflection* reflection = message.GetReflection();
+
+  switch (field->cpp_type()) {
+    case FieldDescriptor::CPPTYPE_INT32:
+      return nb::int_(index ? reflection->GetRepeatedInt32(message, field, *index)
+                            : reflection->GetInt32(message, field));
+    case FieldDescriptor::CPPTYPE_INT64:
+      return nb::int_(index ? reflection->GetRepeatedInt64(message, field, *index)
+                            : reflection->GetInt64(message, field));
+    case FieldDescriptor::CPPTYPE_UINT32:
+      return nb::int_(index ? reflection->GetRepeatedUInt32(message, field, *index)
+                            : reflection->GetUInt32(message, field));
+    case FieldDescriptor::CPPTYPE_UINT64:
+      return nb::int_(index ? reflection->GetRepeatedUInt64(message, field, *index)
+                            : reflection->GetUInt64(message, field));
+    case FieldDescriptor::CPPTYPE_DOUBLE:
+      return nb::float_(index ? reflection->GetRepeatedDouble(message, field, *index)
+                              : reflection->GetDouble(message, field));
+    case FieldDescriptor::CPPTYPE_FLOAT:
+      return nb::float_(index ? reflection->GetRepeatedFloat(message, field, *index)
+                              : reflection->GetFloat(message, field));
+    case FieldDescriptor::CPPTYPE_BOOL:
+      return nb::bool_(index ? reflection->GetRepeatedBool(message, field, *index)
+                             : reflection->GetBool(message, field));
+    case FieldDescriptor::CPPTYPE_ENUM: {
+      const int number =
+          index ? reflection->GetRepeatedEnumValue(message, field, *index) : reflection->GetEnumValue(message, field);
+
+      // an open enum can hold numbers it has no name for
+      if (!options.enums_as_ints) {
+        if (const auto* value = field->enum_type()->FindValueByNumber(number); value != nullptr) {
+          return utf8_to_str(value->name());
+        }
+      }
+
+      return nb::int_(number);
+    }
+    case FieldDescriptor::CPPTYPE_STRING: {
+      std::string scratch;
+      const std::string& value = index ? reflection->GetRepeatedStringReference(message, field, *index, &scratch)
+                                       : reflection->GetStringReference(message, field, &scratch);
+
+      if (field->type() == FieldDescriptor::TYPE_BYTES) {
+        return nb::bytes(value.data(), value.size());
+      }
+
+      return utf8_to_str(value);
+    }
+    case FieldDescriptor::CPPTYPE_MESSAGE:
+      return message_to_dict(
+          index ? reflection->GetRepeatedMessage(message, field, *index) : reflection->GetMessage(message, field),
+          options);
+  }
+
+  throw std::runtime_error("Field \"" + std::string(field->full_name()) + "\" has an unsupported type");
+}
+
+nb::dict message_to_dict(const google::protobuf::Message& message, const DictOptions& options) {
+  using google::protobuf::FieldDescriptor;
+
+  const google::protobuf::Reflection* reflection = message.GetReflection();
+
+  // the fields that are set, by number, as to_json prints them
+  std::vector<const FieldDescriptor*> fields;
+  reflection->ListFields(message, &fields);
+
+  if (options.include_defaults) {
+    const google::protobuf::Descriptor* descriptor = message.GetDescriptor();
+
+    for (int i = 0; i < descriptor->field_count(); ++i) {
+      if (!descriptor->field(i)->has_presence()) {
+        fields.push_back(descriptor->field(i));
+      }
+    }
+
+    auto by_number = [](const FieldDescriptor* a, const FieldDescriptor* b) { return a->number() < b->number(); };
+    std::stable_sort(fields.begin(), fields.end(), by_number);
+    fields.erase(std::unique(fields.begin(), fields.end()), fields.end());
+  }
+
+  nb::dict out;
+
+  for (const FieldDescriptor* field : fields) {
+    std::string key;
+
+    if (field->is_extension()) {
+      key = "[" + std::string(field->full_name()) + "]";
+    } else if (options.proto_field_names) {
+      key = std::string(field->name());
+    } else {
+      key = std::string(field->json_name());
+    }
+
+    if (field->is_map()) {
+      const FieldDescriptor* key_field = field->message_type()->map_key();
+      const FieldDescriptor* value_field = field->message_type()->map_value();
+
+      nb::dict map;
+
+      for (int i = 0; i < reflection->FieldSize(message, field); ++i) {
+        const google::protobuf::Message& entry = reflection->GetRepeatedMessage(message, field, i);
+        map[field_to_python(entry, key_field, std::nullopt, options)] =
+            field_to_python(entry, value_field, std::nullopt, options);
+      }
+
+      out[key.c_str()] = std::move(map);
+    } else if (field->is_repeated()) {
+      nb::list list;
+
+      for (int i = 0; i < reflection->FieldSize(message, field); ++i) {
+        list.append(field_to_python(message, field, i, options));
+      }
+
+      out[key.c_str()] = std::move(list);
+    } else {
+      out[key.c_str()] = field_to_python(message, field, std::nullopt, options);
+    }
+  }
+
+  return out;
+}
+
+nb::dict to_dict(Context& self, const std::string& message_type, const Buffer& data, bool include_defaults,
+                 bool proto_field_names, bool enums_as_ints, const std::optional<std::vector<std::string>>& fields) {
+  if (fields && include_defaults) {
+    throw nb::value_error("fields cannot be combined with include_defaults");
+  }
+
+  const DictOptions options{include_defaults, proto_field_names, enums_as_ints};
+
+  // The context's lock is only taken with the GIL released, and the dict is
+  // built after it is released again: waiting for the lock while holding the
+  // GIL, or running Python code while holding the lock, can deadlock with a
+  // thread that adds a file meanwhile.
+  std::unique_ptr<google::protobuf::Message> message;
+  {
+    nb::gil_scoped_release release;
+    message = self.decode(message_type, data.view(), fields);
+  }
+
+  return message_to_dict(*message, options);
+}
+
+// Fills a message from a dict, keeping track of the field path for errors.
+class DictReader {
+public:
+  DictReader(const std::string& message_type, bool ignore_unknown_fields)
+      : m_message_type(message_type), m_ignore_unknown_fields(ignore_unknown_fields) {}
+
+  void read_message(nb::handle object, google::protobuf::Message& message) {
+    using google::protobuf::FieldDescriptor;
+
+    if (!nb::isinstance<nb::dict>(object)) {
+      fail("expected dict, got " + type_name(object));
+    }
+
+    const google::protobuf::Descriptor* descriptor = message.GetDescriptor();
+    for (auto [key, value] : nb::borrow<nb::dict>(object)) {
+      if (!nb::isinstance<nb::str>(key)) {
+        fail("expected str keys, got " + type_name(key));
+      }
+
+      const std::string name = nb::cast<std::string>(key);
+
+      // both spellings are accepted, as by from_json
+      const FieldDescriptor* field = protosaurus::find_field(descriptor, name);
+
+      if (field == nullptr) {
+        if (m_ignore_unknown_fields) continue;
+        fail("message type \"" + std::string(descriptor->full_name()) + "\" has no field named \"" + name + "\"");
+      }
+
+      // None leaves the field unset, like null in JSON
+      if (value.is_none()) continue;
+
+      const std::size_t path_size = m_path.size();
+      m_path += (m_path.empty() ? "" : ".") + name;
+
+      if (field->is_map()) {
+        read_map(value, message, field);
+      } else if (field->is_repeated()) {
+        if (!nb::isinstance<nb::list>(value) && !nb::isinstance<nb::tuple>(value)) {
+          fail("expected list, got " + type_name(value));
+        }
+
+        for (nb::handle item : value) {
+          read_value(item, message, field, true);
+        }
+      } else {
+        read_value(value, message, field, false);
+      }
+
+      m_path.resize(path_size);
+    }
+  }
+
+private:
+  const std::string& m_message_type;
+  bool m_ignore_unknown_fields;
+  std::string m_path;
+
+  static std::string type_name(nb::handle object) { return nb::inst_name(object).c_str(); }
+
+  [[noreturn]] void fail(const std::string& reason) const {
+    std::string msg = "Could not convert dict to message type \"" + m_message_type + "\": ";
+
+    if (!m_path.empty()) {
+      msg += "field \"" + m_path + "\": ";
+    }
+
+    throw std::runtime_error(msg + reason);
+  }
+
+  void read_map(nb::handle value, google::protobuf::Message& message, const google::protobuf::FieldDescriptor* field) {
+    if (!nb::isinstance<nb::dict>(value)) {
+      fail("expected dict, got " + type_name(value));
+    }
+
+    const google::protobuf::FieldDescriptor* key_field = field->message_type()->map_key();
+    const google::protobuf::FieldDescriptor* value_field = field->message_type()->map_value();
+
+    for (auto [map_key, map_value] : nb::borrow<nb::dict>(value)) {
+      google::protobuf::Message* entry = message.GetReflection()->AddMessage(&message, field);
+      read_value(map_key, *entry, key_field, false);
+      read_value(map_value, *entry, value_field, false);
+    }
+  }
+
+  template <typename T>
+  T read_integer(nb::handle value) {
+    if (!PyLong_Check(value.ptr()) || PyBool_Check(value.ptr())) {
+      fail("expected int, got " + type_name(value));
+    }
+
+    int overflow = 0;
+
+    if constexpr (std::is_signed_v<T>) {
+      const long long result = PyLong_AsLongLongAndOverflow(value.ptr(), &overflow);
+
+      if (overflow == 0 && result >= std::numeric_limits<T>::min() && result <= std::numeric_limits<T>::max()) {
+        return static_cast<T>(result);
+      }
+    } else {
+      const unsigned long long result = PyLong_AsUnsignedLongLong(value.ptr());
+
+      if (PyErr_Occurred()) {
+        PyErr_Clear();
+      } else if (result <= std::numeric_limits<T>::max()) {
+        return static_cast<T>(result);
+      }
+    }
+
+    fail(nb::cast<std::string>(nb::str(value)) + " is out of range");
+  }
+
+  double read_float(nb::handle value) {
+    if ((!PyFloat_Check(value.ptr()) && !PyLong_Check(value.ptr())) || PyBool_Check(value.ptr())) {
+      fail("expected float, got " + type_name(value));
+    }
+
+    const double result = PyFloat_AsDouble(value.ptr());
+
+    if (PyErr_Occurred()) {
+      throw nb::python_error();
+    }
+
+    return result;
+  }
+
+  // Sets a singular field, or with `add`, appends to a repeated one.
+  void read_value(nb::handle value, google::protobuf::Message& message, const google::protobuf::FieldDescriptor* field,
+                  bool add) {
+    using google::protobuf::FieldDescriptor;
+
+    const google::protobuf::Reflection* reflection = message.GetReflection();
+
+    switch (field->cpp_type()) {
+      case FieldDescriptor::CPPTYPE_INT32: {
+        const auto result = read_integer<std::int32_t>(value);
+        add ? reflection->AddInt32(&message, field, result) : reflection->SetInt32(&message, field, result);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_INT64: {
+        const auto result = read_integer<std::int64_t>(value);
+        add ? reflection->AddInt64(&message, field, result) : reflection->SetInt64(&message, field, result);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_UINT32: {
+        const auto result = read_integer<std::uint32_t>(value);
+        add ? reflection->AddUInt32(&message, field, result) : reflection->SetUInt32(&message, field, result);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_UINT64: {
+        const auto result = read_integer<std::uint64_t>(value);
+        add ? reflection->AddUInt64(&message, field, result) : reflection->SetUInt64(&message, field, result);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_DOUBLE: {
+        const double result = read_float(value);
+        add ? reflection->AddDouble(&message, field, result) : reflection->SetDouble(&message, field, result);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_FLOAT: {
+        const auto result = static_cast<float>(read_float(value));
+        add ? reflection->AddFloat(&message, field, result) : reflection->SetFloat(&message, field, result);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_BOOL: {
+        if (!PyBool_Check(value.ptr())) {
+          fail("expected bool, got " + type_name(value));
+        }
+
+        const bool result = value.ptr() == Py_True;
+        add ? reflection->AddBool(&message, field, result) : reflection->SetBool(&message, field, result);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_ENUM: {
+        const google::protobuf::EnumDescriptor* enum_type = field->enum_type();
+        int number = 0;
+
+        if (nb::isinstance<nb::str>(value)) {
+          const std::string name = nb::cast<std::string>(value);
+          const google::protobuf::EnumValueDescriptor* enum_value = enum_type->FindValueByName(name);
+
+          if (enum_value == nullptr) {
+            fail("\"" + name + "\" is not a value of enum \"" + std::string(enum_type->full_name()) + "\"");
+          }
+
+          number = enum_value->number();
+        } else {
+          number = read_integer<std::int32_t>(value);
+
+          // a closed enum, as in proto2, holds no numbers it has no name for
+          if (enum_type->is_closed() && enum_type->FindValueByNumber(number) == nullptr) {
+            fail(std::to_string(number) + " is not a value of enum \"" + std::string(enum_type->full_name()) + "\"");
+          }
+        }
+
+        add ? reflection->AddEnumValue(&message, field, number) : reflection->SetEnumValue(&message, field, number);
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_STRING: {
+        std::string result;
+
+        if (field->type() == FieldDescriptor::TYPE_BYTES) {
+          Buffer buffer;
+
+          if (nb::isinstance<nb::str>(value) || !buffer.acquire(value.ptr())) {
+            fail("expected bytes, got " + type_name(value));
+          }
+
+          result = buffer.view();
+        } else {
+          if (!nb::isinstance<nb::str>(value)) {
+            fail("expected str, got " + type_name(value));
+          }
+
+          result = nb::cast<std::string>(value);
+        }
+
+        add ? reflection->AddString(&message, field, std::move(result))
+            : reflection->SetString(&message, field, std::move(result));
+        return;
+      }
+      case FieldDescriptor::CPPTYPE_MESSAGE:
+        read_message(value,
+                     add ? *reflection->AddMessage(&message, field) : *reflection->MutableMessage(&message, field));
+        return;
+    }
+
+    fail("unsupported field type");
+  }
+};
+
+nb::bytes from_dict(Context& self, const std::string& message_type, nb::handle object, bool ignore_unknown_fields) {
+  // As for to_dict, the message is filled from the dict outside the context's
+  // lock, which is only taken with the GIL released.
+  std::unique_ptr<google::protobuf::Message> message;
+  {
+    nb::gil_scoped_release release;
+    message = self.empty_message(message_type);
+  }
+
+  DictReader(message_type, ignore_unknown_fields).read_message(object, *message);
+
+  std::string result;
+  {
+    nb::gil_scoped_release release;
+    result = Context::encode(*message, message_type);
+  }
+
+  return nb::bytes(result.data(), result.size());
+}
+
+// Context.view hands out MessageViews: a WireMessage together with what keeps
+// its bytes and its descriptor alive. Like to_dict, a view builds Python
+// objects and so holds the GIL while it reads the message, without the
+// context's lock: a descriptor never changes once built.
+class MessageView {
+public:
+  MessageView(nb::object context, std::shared_ptr<const void> owner, const google::protobuf::Descriptor* descriptor,
+              std::string_view data)
+      : m_context(std::move(context)), m_owner(std::move(owner)), m_message(descriptor, data) {}
+
+  std::string message_type() const { return std::string(m_message.descriptor()->full_name()); }
+
+  const google::protobuf::FieldDescriptor* find_field(const std::string& name) const {
+    return protosaurus::find_field(m_message.descriptor(), name);
+  }
+
+  // Whether the data holds a value for `field`.
+  bool has(const google::protobuf::FieldDescriptor* field) const {
+    const int wire_type = protosaurus::wire_type_of(field->type());
+
+    for (const protosaurus::WireField& occurrence : m_message.find(field->number())) {
+      if (occurrence.wire_type == wire_type || (occurrence.wire_type == 2 && field->is_packable())) return true;
+    }
+
+    return false;
+  }
+
+  // The value of `field` as to_dict gives it, except that messages are views
+  // of their own and that a field that is not set gives its default.
+  nb::object get(const google::protobuf::FieldDescriptor* field) {
+    if (field->is_map()) {
+      return map_value(m_message, field);
+    }
+
+    if (field->cpp_type() == google::protobuf::FieldDescriptor::CPPTYPE_MESSAGE) {
+      if (field->is_repeated()) {
+        nb::list out;
+        const int wire_type = protosaurus::wire_type_of(field->type());
+
+        for (const protosaurus::WireField& occurrence : m_message.find(field->number())) {
+          if (occurrence.wire_type == wire_type) {
+            out.append(make_view(field->message_type(), m_message.value(occurrence), {}));
+          }
+        }
+
+        return out;
+      }
+
+      // kept, so that the submessage locates its fields only once
+      auto [child, inserted] = m_children.try_emplace(field->number());
+
+      if (inserted) {
+        std::string scratch;
+        const std::string_view data = m_message.message(field, scratch);
+        child->second = make_view(field->message_type(), data, std::move(scratch));
+      }
+
+      return child->second;
+    }
+
+    if (field->is_repeated()) {
+      nb::list out;
+      protosaurus::visit_scalars(m_message, field, [&](auto value) { out.append(scalar_to_python(field, value)); });
+      return out;
+    }
 
-namespace {
+    return scalar_value(m_message, field);
+  }
 
-void add_proto(Context& self, const std::string& filename, const std::string& content) {
-  nb::gil_scoped_release release;
-  self.add_proto(filename, content);
+private:
+  nb::object m_context;
+  // Keeps the bytes of m_message alive: the Buffer the view was created from,
+  // or the merged occurrences of a submessage.
+  std::shared_ptr<const void> m_owner;
+  protosaurus::WireMessage m_message;
+  std::unordered_map<int, nb::object> m_children;
+
+  // A view of `data`, a message of `descriptor` in this view's bytes or, if
+  // it is not empty, in `merged`, which the new view then keeps.
+  nb::object make_view(const google::protobuf::Descriptor* descriptor, std::string_view data, std::string merged) {
+    std::shared_ptr<const void> owner = m_owner;
+
+    if (!merged.empty()) {
+      auto owned = std::make_shared<const std::string>(std::move(merged));
+      data = *owned;
+      owner = std::move(owned);
+    }
+
+    return nb::cast(MessageView(m_context, std::move(owner), descriptor, data));
+  }
+
+  template <typename T>
+  static nb::object scalar_to_python(const google::protobuf::FieldDescriptor* field, T value) {
+    using google::protobuf::FieldDescriptor;
+
+    if constexpr (std::is_same_v<T, std::string_view>) {
+      if (field->type() == FieldDescriptor::TYPE_BYTES) {
+        return nb::bytes(value.data(), value.size());
+      }
+
+      return utf8_to_str(value);
+    } else if constexpr (std::is_same_v<T, bool>) {
+      return nb::bool_(value);
+    } else if constexpr (std::is_floating_point_v<T>) {
+      return nb::float_(value);
+    } else {
+      // an open enum can hold numbers it has no name for
+      if (field->type() == FieldDescriptor::TYPE_ENUM) {
+        if (const auto* enum_value = field->enum_type()->FindValueByNumber(static_cast<int>(value));
+            enum_value != nullptr) {
+          return utf8_to_str(enum_value->name());
+        }
+      }
+
+      return nb::int_(value);
+    }
+  }
+
+  // The value of the singular scalar `field` of `message`: the last one in
+  // the data, as when protobuf parses it, or the field's default.
+  static nb::object scalar_value(const protosaurus::WireMessage& message,
+                                 const google::protobuf::FieldDescriptor* field) {
+    using google::protobuf::FieldDescriptor;
+
+    std::optional<protosaurus::WireField> last;
+
+    for (const protosaurus::WireField& occurrence : message.find(field->number())) {
+      if (occurrence.wire_type == protosaurus::wire_type_of(field->type())) last = occurrence;
+    }
+
+    if (last) {
+      nb::object out;
+      auto visit = [&](auto value) { out = scalar_to_python(field, value); };
+
+      if (last->wire_type == 2) {
+        visit(message.value(*last));
+      } else {
+        protosaurus::read_scalar(message.value(*last), field->type(), visit);
+      }
+
+      return out;
+    }
+
+    switch (field->cpp_type()) {
+      case FieldDescriptor::CPPTYPE_INT32:
+        return nb::int_(field->default_value_int32());
+      case FieldDescriptor::CPPTYPE_INT64:
+        return nb::int_(field->default_value_int64());
+      case FieldDescriptor::CPPTYPE_UINT32:
+        return nb::int_(field->default_value_uint32());
+      case FieldDescriptor::CPPTYPE_UINT64:
+        return nb::int_(field->default_value_uint64());
+      case FieldDescriptor::CPPTYPE_DOUBLE:
+        return nb::float_(field->default_value_double());
+      case FieldDescriptor::CPPTYPE_FLOAT:
+        return nb::float_(field->default_value_float());
+      case FieldDescriptor::CPPTYPE_BOOL:
+        return nb::bool_(field->default_value_bool());
+      case FieldDescriptor::CPPTYPE_ENUM:
+        return utf8_to_str(field->default_value_enum()->name());
+      case FieldDescriptor::CPPTYPE_STRING:
+        return scalar_to_python(field, std::string_view(field->default_value_string()));
+      case FieldDescriptor::CPPTYPE_MESSAGE:
+        break;
+    }
+
+    throw std::runtime_error("Field \"" + std::string(field->full_name()) + "\" has an unsupported type");
+  }
+
+  nb::dict map_value(const protosaurus::WireMessage& message, const google::protobuf::FieldDescriptor* field) {
+    const google::protobuf::Descriptor* entry_type = field->message_type();
+    const google::protobuf::FieldDescriptor* key_field = entry_type->map_key();
+    const google::protobuf::FieldDescriptor* value_field = entry_type->map_value();
+
+    nb::dict out;
+
+    for (const protosaurus::WireField& occurrence : message.find(field->number())) {
+      if (occurrence.wire_type != 2) continue;
+
+      const protosaurus::WireMessage entry(entry_type, message.value(occurrence));
+      nb::object key = scalar_value(entry, key_field);
+
+      if (value_field->cpp_type() == google::protobuf::FieldDescriptor::CPPTYPE_MESSAGE) {
+        std::string scratch;
+        const std::string_view data = entry.message(value_field, scratch);
+        out[key] = make_view(value_field->message_type(), data, std::move(scratch));
+      } else {
+        out[key] = scalar_value(entry, value_field);
+      }
+    }
+
+    return out;
+  }
+};
+
+MessageView view(Context& self, const std::string& message_type, Buffer data) {
+  // the context's lock is only taken with the GIL released, as for to_dict
+  const google::protobuf::Descriptor* descriptor;
+  {
+    nb::gil_scoped_release release;
+    descriptor = self.message_descriptor(message_type);
+  }
+  const std::string_view bytes = data.view();
+
+  return MessageView(nb::find(&self), std::make_shared<const Buffer>(std::move(data)), descriptor, bytes);
 }
 
-std::string to_json(Context& self, const std::string& message_type, nb::bytes data, bool include_defaults, bool pretty,
-                    bool proto_field_names, bool enums_as_ints, bool unquote_int64) {
-  // copy Python bytes to std::string while the GIL is held
-  std::string data_copy(data.c_str(), data.size());
+nb::object view_getitem(MessageView& self, const std::string& name) {
+  const google::protobuf::FieldDescriptor* field = self.find_field(name);
 
-  protosaurus::JsonOptions options;
-  options.include_defaults = include_defaults;
-  options.pretty = pretty;
-  options.proto_field_names = proto_field_names;
-  options.enums_as_ints = enums_as_ints;
-  options.unquote_int64 = unquote_int64;
+  if (field == nullptr) {
+    throw nb::key_error(("message type \"" + self.message_type() + "\" has no field named \"" + name + "\"").c_str());
+  }
 
-  nb::gil_scoped_release release;
-  return self.to_json(message_type, data_copy, options);
+  return self.get(field);
 }
 
-nb::bytes from_json(Context& self, const std::string& message_type, const std::string& json,
-                    bool ignore_unknown_fields) {
-  protosaurus::ParseOptions options;
-  options.ignore_unknown_fields = ignore_unknown_fields;
+nb::object view_getattr(MessageView& self, const std::string& name) {
+  const google::protobuf::FieldDescriptor* field = self.find_field(name);
+
+  if (field == nullptr) {
+    throw nb::attribute_error(
+        ("message type \"" + self.message_type() + "\" has no field named \"" + name + "\"").c_str());
+  }
+
+  return self.get(field);
+}
+
+bool view_contains(const MessageView& self, const std::string& name) {
+  const google::protobuf::FieldDescriptor* field = self.find_field(name);
+  return field != nullptr && self.has(field);
+}
+
+// extract_column reads into arrays it allocates itself and hands them to numpy
+// without copying: each array is owned by a capsule that frees it, and the
+// capsule is the base of the numpy array.
+template <typename T>
+nb::object column_array(std::unique_ptr<T[]> data, std::size_t size) {
+  nb::capsule owner(data.get(), [](void* pointer) noexcept { delete[] static_cast<T*>(pointer); });
+  T* pointer = data.release();
+
+  return nb::cast(nb::ndarray<nb::numpy, T, nb::ndim<1>>(pointer, {size}, owner));
+}
+
+template <typename T>
+nb::object read_column(const protosaurus::ColumnPath& column, const std::vector<std::string_view>& views, bool mask,
+                       std::size_t workers) {
+  auto values = std::make_unique_for_overwrite<T[]>(views.size());
+  auto present = mask ? std::make_unique_for_overwrite<bool[]>(views.size()) : nullptr;
 
-  std::string result;
   {
     nb::gil_scoped_release release;
-    result = self.from_json(message_type, json, options);
+    protosaurus::read_column(column, views, values.get(), present.get(), workers);
   }
-  // GIL re-acquired, safe to create nb::bytes
-  return nb::bytes(result.data(), result.size());
+
+  nb::object array = column_array(std::move(values), views.size());
+
+  if (!mask) {
+    return array;
+  }
+
+  return nb::make_tuple(array, column_array(std::move(present), views.size()));
+}
+
+nb::object extract_column(Context& self, const std::string& message_type, const std::vector<Buffer>& payloads,
+                          const std::string& path, bool mask, std::size_t workers) {
+  using google::protobuf::FieldDescriptor;
+
+  // fail before doing the work if the result cannot be returned
+  nb::module_::import_("numpy");
+
+  protosaurus::ColumnPath column;
+  {
+    nb::gil_scoped_release release;
+    column = protosaurus::resolve_column(self.message_descriptor(message_type), path);
+  }
+
+  std::vector<std::string_view> views;
+  views.reserve(payloads.size());
+
+  for (const Buffer& payload : payloads) {
+    views.push_back(payload.view());
+  }
+
+  switch (column.field->cpp_type()) {
+    case FieldDescriptor::CPPTYPE_INT32:
+    case FieldDescriptor::CPPTYPE_ENUM:
+      return read_column<std::int32_t>(column, views, mask, workers);
+    case FieldDescriptor::CPPTYPE_INT64:
+      return read_column<std::int64_t>(column, views, mask, workers);
+    case FieldDescriptor::CPPTYPE_UINT32:
+      return read_column<std::uint32_t>(column, views, mask, workers);
+    case FieldDescriptor::CPPTYPE_UINT64:
+      return read_column<std::uint64_t>(column, views, mask, workers);
+    case FieldDescriptor::CPPTYPE_FLOAT:
+      return read_column<float>(column, views, mask, workers);
+    case FieldDescriptor::CPPTYPE_DOUBLE:
+      return read_column<double>(column, views, mask, workers);
+    case FieldDescriptor::CPPTYPE_BOOL:
+      return read_column<bool>(column, views, mask, workers);
+    default:
+      break;
+  }
+
+  // resolve_column accepts no other types
+  throw std::runtime_error("Field \"" + std::string(column.field->full_name()) + "\" has an unsupported type");
 }
 
 // Returns (value, offset). The GIL is deliberately held: decoding a varint is a
 // handful of byte reads, so releasing it would cost more than it saves, and
 // raising EOFError below needs it anyway.
-nb::object read_varint(nb::bytes data, Py_ssize_t offset, bool zigzag) {
+nb::object read_varint(const Buffer& data, Py_ssize_t offset, bool zigzag) {
   if (offset < 0) {
     throw nb::index_error("offset must not be negative");
   }
 
-  const std::string_view view(data.c_str(), data.size());
+  const std::string_view view = data.view();
 
   protosaurus::Varint result;
 
@@ -76,6 +1150,105 @@ nb::object read_varint(nb::bytes data, Py_ssize_t offset, bool zigzag) {
   return nb::make_tuple(result.value, result.offset);
 }
 
+// Returns (values, offset), with values an array.array of "Q", or of "q" for
+// zigzag. Unlike read_varint this releases the GIL, as a run can be long.
+nb::object read_varints(const Buffer& data, Py_ssize_t offset, std::optional<Py_ssize_t> count, bool zigzag) {
+  if (offset < 0) {
+    throw nb::index_error("offset must not be negative");
+  }
+
+  if (count && *count < 0) {
+    throw nb::value_error("count must not be negative");
+  }
+
+  std::vector<std::uint64_t> values;
+  std::size_t end = 0;
+
+  try {
+    nb::gil_scoped_release release;
+
+    std::optional<std::size_t> varint_count;
+    if (count) varint_count = static_cast<std::size_t>(*count);
+
+    end = protosaurus::read_varints(data.view(), static_cast<std::size_t>(offset), varint_count, values);
+
+    if (zigzag) {
+      for (std::uint64_t& value : values) {
+        value = static_cast<std::uint64_t>(protosaurus::zigzag_decode(value));
+      }
+    }
+  } catch (const protosaurus::VarintOffsetOutOfRange& e) {
+    throw nb::index_error(e.what());
+  } catch (const protosaurus::VarintTruncated& e) {
+    PyErr_SetString(PyExc_EOFError, e.what());
+    throw nb::python_error();
+  }
+
+  nb::object array = nb::module_::import_("array").attr("array")(zigzag ? "q" : "Q");
+  array.attr("frombytes")(nb::bytes(values.data(), values.size() * sizeof(std::uint64_t)));
+
+  return nb::make_tuple(array, end);
+}
+
+// Returns (records, offset). The records are parsed with the GIL released; the
+// payloads are then handed out as slices of one memoryview of `data`, so they
+// are not copied.
+nb::object read_kcat_records(nb::handle data, Py_ssize_t offset) {
+  if (offset < 0) {
+    throw nb::index_error("offset must not be negative");
+  }
+
+  Buffer buffer;
+
+  if (!buffer.acquire(data.ptr())) {
+    throw nb::type_error("data must support the buffer protocol");
+  }
+
+  const std::string_view view = buffer.view();
+
+  if (static_cast<std::size_t>(offset) > view.size()) {
+    throw nb::index_error("offset is past the end of the data");
+  }
+
+  std::vector<protosaurus::kcat::Record> records;
+  std::size_t end = 0;
+
+  try {
+    nb::gil_scoped_release release;
+    end = protosaurus::kcat::read_records(
+        view, static_cast<std::size_t>(offset),
+        [&](protosaurus::kcat::Record&& record) { records.push_back(std::move(record)); });
+  } catch (const protosaurus::VarintTruncated& e) {
+    PyErr_SetString(PyExc_EOFError, e.what());
+    throw nb::python_error();
+  }
+
+  // Sliced bytewise whatever the format of `data`, like the Buffer is read.
+  nb::object memory = nb::steal(PyMemoryView_FromObject(data.ptr()));
+  if (!memory.is_valid()) {
+    throw nb::python_error();
+  }
+  memory = memory.attr("cast")("B");
+
+  nb::list out;
+
+  for (const protosaurus::kcat::Record& record : records) {
+    nb::object key =
+        nb::steal(PyUnicode_DecodeUTF8(record.key.data(), static_cast<Py_ssize_t>(record.key.size()), "strict"));
+    if (!key.is_valid()) {
+      throw nb::python_error();
+    }
+
+    const auto payload_begin = static_cast<Py_ssize_t>(record.payload.data() - view.data());
+    const auto payload_end = payload_begin + static_cast<Py_ssize_t>(record.payload.size());
+
+    out.append(nb::make_tuple(record.offset, key, record.schema_id, nb::cast(record.message_index),
+                              memory[nb::slice(payload_begin, payload_end)]));
+  }
+
+  return nb::make_tuple(out, end);
+}
+
 std::string message_type_from_index(Context& self, const std::string& filename, const std::vector<int>& message_index) {
   nb::gil_scoped_release release;
   return self.message_type_from_index(filename, message_index);
@@ -166,6 +1339,16 @@ The pool is thread-safe: add_proto takes an exclusive lock and the conversions
 a shared one, so a single context can be shared across threads.
 )doc";
 
+constexpr const char* INIT_DOC = R"doc(
+Create an empty context.
+
+to_json and from_json build each message on an arena, starting with a block
+of `arena_size` bytes that every thread keeps between calls. A message that
+fits into the block is converted without any heap allocation for the message
+itself; a larger one spills into further arena blocks, which are freed in one
+go. Pass arena_size=0 to allocate every message on the heap instead.
+)doc";
+
 constexpr const char* ADD_PROTO_DOC = R"doc(
 Parse a .proto definition and add it to the pool.
 
@@ -177,15 +1360,107 @@ Raises RuntimeError if the content does not parse or does not link, with the
 parser or linker diagnostics appended.
 )doc";
 
+constexpr const char* ADD_FILE_DESCRIPTOR_DOC = R"doc(
+Add a .proto file that was parsed before, given as a serialized
+FileDescriptorProto -- as parse_proto returns it.
+
+Use this to parse a file once and add it to many contexts. As with
+add_proto, the files it imports must have been added already.
+
+Raises RuntimeError if `data` is not a FileDescriptorProto or the file does
+not link.
+)doc";
+
+constexpr const char* ADD_PROTOS_DOC = R"doc(
+Add many .proto files at once, given as a {filename: content} dict.
+
+The files are parsed in parallel on up to `workers` threads -- 0, the default,
+uses one thread per CPU core -- and then added in the order of their imports,
+so the dict can list them in any order. Files imported from outside the dict
+must have been added already. All files are added under one exclusive lock,
+so concurrent conversions are held up once rather than once per file.
+
+Raises RuntimeError if a file does not parse, in which case none is added, if
+the imports form a cycle, or if a file does not link; the files added before
+that one stay added.
+)doc";
+
+constexpr const char* ADD_DESCRIPTOR_SET_DOC = R"doc(
+Add every file of a serialized FileDescriptorSet, without parsing any .proto
+text.
+
+Each file is added after the files of the set it imports, whatever order the
+set lists them in; files imported from outside the set must have been added
+already. Sets from export_descriptor_set as well as those written by protoc
+--descriptor_set_out --include_imports load this way. Files that are already
+in the context are skipped if they are identical.
+
+Raises RuntimeError if `data` is not a FileDescriptorSet, if the imports form
+a cycle, or if a file does not link; the files added before that one stay
+added.
+)doc";
+
+constexpr const char* EXPORT_DESCRIPTOR_SET_DOC = R"doc(
+Return every file added so far as a serialized FileDescriptorSet.
+
+The files are listed in the order they were added, so each comes after the
+files it imports, and add_descriptor_set rebuilds the same schemas in another
+context -- or another process -- far faster than parsing the .proto files
+again.
+)doc";
+
 constexpr const char* TO_JSON_DOC = R"doc(
 Decode `data` from the protobuf wire format and return it as a JSON string.
 
 `message_type` is the fully qualified name, so "zoo.Animal" for a message in
 `package zoo`. With no options set, the output is plain ProtoJSON.
 
+`data` is bytes or any other contiguous buffer -- a bytearray, a memoryview
+slice, an mmap -- and is read in place, without copying it first.
+
+Pass fields=[...] to decode only some fields, given as field paths such as
+"name", "trainer.name" for a field of a submessage, or "keepers.name" for
+that field in every message of a repeated field; names and JSON names both
+work. All other fields are skipped in the wire format without being parsed,
+so the fewer fields are asked for, the faster the call. Skipped fields are
+not validated beyond their framing, and required fields are not checked.
+fields cannot be combined with include_defaults, which would print the
+fields left out as if they held their defaults, and raises ValueError.
+
+With json_dumps_format=True, the JSON is exactly what
+json.dumps(json.loads(...)) makes of it: ", " and ": " between items,
+characters outside printable ASCII escaped, and floats as Python prints
+them. With pretty=True as well, it is laid out as json.dumps does with
+indent=2.
+
 Raises RuntimeError if the type is unknown -- the message then lists the known
-types -- if the data is not valid wire format, or if a proto2 message is
-missing required fields.
+types -- if the data is not valid wire format, if a proto2 message is
+missing required fields, or if a field path names no field.
+)doc";
+
+constexpr const char* TO_JSON_MANY_DOC = R"doc(
+Decode every item of `payloads` like to_json and return the JSON strings in
+the same order.
+
+The type is looked up and the options are applied once for the whole batch,
+and the GIL is released for all of it, so this is considerably faster than
+calling to_json in a loop for many small messages. Takes the same options as
+to_json, including fields.
+
+prefixes=[...], which needs json_dumps_format=True, holds one string per
+payload of JSON object members, such as '"id": 1', that are written in front
+of the fields of its message and formatted along with them. Raises
+ValueError without json_dumps_format, or if there is not one prefix per
+payload.
+
+With workers=N, the batch is split into up to N contiguous parts that are
+decoded in parallel on native threads; workers=0 uses one thread per CPU
+core. Small batches use fewer threads, as each gets at least 64 payloads. The
+results are in order either way.
+
+Raises RuntimeError as to_json does; for an invalid payload the message starts
+with its position in `payloads`, and with several invalid payloads it is the
+first of them.
 )doc";
 
 constexpr const char* FROM_JSON_DOC = R"doc(
@@ -200,6 +1475,219 @@ Raises RuntimeError if the type is unknown, if the JSON does not match the
 schema, or if required fields are missing.
 )doc";
 
+constexpr const char* FROM_JSON_MANY_DOC = R"doc(
+Encode every JSON document of `documents` like from_json, in one call.
+
+The type is looked up once for the whole batch and the GIL is released for
+all of it. ignore_unknown_fields behaves as for from_json, and workers as for
+to_json_many.
+
+With on_error="raise", the default, the list of wire format bytes is
+returned, and the first document that fails raises RuntimeError with its
+position at the start of the message. With on_error="collect", a pair
+(messages, errors) is returned instead: a failed document is None in messages
+and listed in errors as an (index, error message) pair, and the rest of the
+batch is still encoded.
+
+Raises RuntimeError if the type is unknown, in either mode.
+)doc";
+
+constexpr const char* TO_DICT_DOC = R"doc(
+Decode `data` from the protobuf wire format and return it as a dict.
+
+The dict has the same keys and nesting as the JSON from to_json, and takes
+the options of the same name, but holds Python values instead of JSON ones:
+64-bit integers are ints rather than strings, bytes fields are bytes rather
+than base64, and map keys keep their type. Enum values are their names, or
+ints with enums_as_ints=True and for numbers the enum does not define.
+Well-known types such as google.protobuf.Timestamp are dicts of their fields.
+
+No JSON is printed or parsed on the way, so this is faster than
+json.loads(to_json(...)). fields=[...] decodes only the given field paths, as
+for to_json.
+
+Raises RuntimeError as to_json does.
+)doc";
+
+constexpr const char* FROM_DICT_DOC = R"doc(
+Encode the dict `obj` as a protobuf message and return the wire format bytes.
+
+This is the reverse of to_dict. Keys are field names or their JSON names, and
+a value of None leaves its field unset. Integer fields take ints and reject
+values out of their range, float fields take floats or ints, bytes fields
+take any bytes-like object, enum fields take a value's name or number,
+message and map fields take dicts and repeated fields lists or tuples. Pass
+ignore_unknown_fields=True to skip keys the schema does not define instead of
+failing on them.
+
+Raises RuntimeError if the type is unknown, if a value does not match its
+field -- the message names the field by its path -- or if required fields are
+missing.
+)doc";
+
+constexpr const char* MESSAGE_HANDLE_DOC = R"doc(
+Resolve `message_type` once and return a MessageHandle for it.
+
+The handle converts messages of that type like to_json and from_json do, but
+without looking the type up by name on every call -- worthwhile on hot paths
+that convert many messages of a few types. It keeps the context alive and
+stays valid when more protos are added.
+
+Raises RuntimeError if the type is unknown, listing the known types.
+)doc";
+
+constexpr const char* HANDLE_DOC = R"doc(
+A message type of a Context, resolved once. Obtained from
+Context.message_handle.
+)doc";
+
+constexpr const char* HANDLE_TO_JSON_DOC = R"doc(
+Decode `data` from the protobuf wire format and return it as a JSON string.
+
+Same as Context.to_json for this handle's message type, with the same
+options.
+)doc";
+
+constexpr const char* HANDLE_FROM_JSON_DOC = R"doc(
+Encode the JSON document `json` as a protobuf message and return the wire
+format bytes.
+
+Same as Context.from_json for this handle's message type.
+)doc";
+
+constexpr const char* VIEW_DOC = R"doc(
+Return a read-only MessageView of the wire format message `data`.
+
+Nothing is decoded up front. The first field accessed locates every field of
+the message, reading only tags and lengths, and keeps their positions; each
+access then decodes just the field asked for, straight from `data`. This is
+far cheaper than to_json or to_dict when only a few fields of a message are
+needed, for routing or keying say:
+
+    animal = ctx.view("zoo.Animal", payload)
+    animal["trainer"]["name"]  # or animal.trainer.name
+
+The view reads `data` in place and keeps it alive, so a bytearray cannot be
+resized while the view or any view taken from it exists.
+
+Raises RuntimeError if the type is unknown, listing the known types.
+)doc";
+
+constexpr const char* MESSAGE_VIEW_DOC = R"doc(
+A wire format message whose fields are decoded on access. Obtained from
+Context.view.
+
+Fields are looked up by name or JSON name, as view["name"] or view.name;
+attributes of the view itself, such as message_type, take precedence over
+fields of the same name. Values are as to_dict gives them -- enums as the name
+of their value, bytes as bytes, repeated fields as lists and maps as dicts --
+except that messages are views too, and that a field that is not set gives
+its default, an empty view for a message. `"name" in view` tells whether the
+data holds a value for the field.
+
+Raises RuntimeError on access if the data is not valid protobuf wire format,
+KeyError or AttributeError for a field the message type does not have.
+)doc";
+
+constexpr const char* EXTRACT_COLUMN_DOC = R"doc(
+Read the field at `path` from every item of `payloads`, wire format
+messages of `message_type`, into a 1-D numpy array.
+
+`path` is a dotted path as for to_json's fields, such as "stats.latency_ms",
+through singular submessages to a singular number, bool or enum field. The
+array has the dtype of the field -- int32, int64, uint32, uint64, float32,
+float64 or bool, and int32 holding the numbers of an enum. Each message is
+read at the tag level down the path, so nothing but the field is decoded;
+this is much faster than decoding the messages to pick one value out of
+each.
+
+An item that does not set the field gives its default. Pass mask=True to get
+a (values, mask) tuple instead, where mask is a bool array telling which
+items hold a value for the field. With workers=N, the batch is split across
+up to N native threads as for to_json_many; workers=0 uses one thread per
+CPU core.
+
+Requires numpy. Raises RuntimeError if the type is unknown or the path does
+not lead to such a field, and, naming its position, for a payload that is
+not valid wire format along the path.
+)doc";
+
+constexpr const char* COMPILE_FILTER_DOC = R"doc(
+Compile `expression` into a MessageFilter for messages of `message_type`.
+
+The expression compares fields with literals and combines the comparisons,
+for example
+
+    status == "FAILED" and region in ("eu", "us")
+
+Fields are addressed by paths as for to_json's fields, such as
+"trainer.name". Literals are strings in double or single quotes, integers,
+floats, true and false; an enum field compares with the name of a value or
+its number. The operators are ==, !=, <, <=, >, >=, in (...) and not in (...),
+combined with and, or, not and parentheses.
+
+A field that is not set compares as its default. A repeated field, or one
+reached through a repeated field, matches if any of its values does; != and
+not in match if none does.
+
+Raises RuntimeError, naming the position in the expression, if it does not
+parse or does not fit the message type, and if the type is unknown.
+)doc";
+
+constexpr const char* FILTER_DOC = R"doc(
+A predicate over wire format messages of one type, evaluated without parsing
+them. Obtained from Context.compile_filter.
+)doc";
+
+constexpr const char* FILTER_MATCHES_DOC = R"doc(
+Return whether the wire format message `data` matches the filter.
+
+Every comparison reads its field straight from the encoded bytes, skipping
+all other fields after their tag and length, so this is much cheaper than
+decoding the message. The fields that are skipped are only checked for their
+framing.
+
+Raises RuntimeError if the data is not valid wire format.
+)doc";
+
+constexpr const char* FILTER_MANY_DOC = R"doc(
+Return the positions of the items of `payloads` that match the filter, in
+order.
+
+The GIL is released for the whole batch, and workers splits it across native
+threads as for Context.to_json_many. Raises RuntimeError like matches, with
+the position of the invalid payload at the start of the message.
+)doc";
+
+constexpr const char* TO_ARROW_DOC = R"doc(
+Decode every item of `payloads` into Arrow columns laid out as `schema`.
+
+This is the building block of protosaurus.arrow.to_record_batch, which is
+what most callers want. `schema` is a pyarrow Schema -- or anything else that
+implements __arrow_c_schema__ -- whose fields name fields of the message with
+matching types, as derive_schema produces it. The result is a PyCapsule
+holding the record batch as an Arrow C data interface struct array.
+
+Raises RuntimeError if the type is unknown, if a payload is not valid wire
+format (naming its position), or if the schema does not fit the message.
+)doc";
+
+constexpr const char* FROM_ARROW_DOC = R"doc(
+Encode every row of `batch` as a `message_type` message.
+
+This is the building block of protosaurus.arrow.from_record_batch, which is
+what most callers want. `batch` is a pyarrow RecordBatch -- or anything else
+that implements __arrow_c_array__ -- whose columns name fields of the message
+with the types derive_schema maps them to. Columns the batch does not have and
+null slots leave their field unset.
+
+Returns one bytes object per row, or with delimited=True a single bytes object
+holding every row prefixed with its length as a varint.
+
+Raises RuntimeError if the type is unknown, if a column does not fit the
+message, or if a row cannot be encoded (naming the row).
+)doc";
+
 constexpr const char* MESSAGE_TYPE_FROM_INDEX_DOC = R"doc(
 Resolve a Confluent message index to a fully qualified message type.
 
@@ -228,6 +1716,18 @@ Raises RuntimeError if neither a message nor an enum type of that name is
 known, with a listing of known message and enum types.
 )doc";
 
+constexpr const char* PARSE_PROTO_DOC = R"doc(
+Parse a .proto definition and return it as a serialized FileDescriptorProto,
+without adding it to any context.
+
+`filename` becomes the name of the file, as for Context.add_proto. Imports are
+not resolved until the result is passed to Context.add_file_descriptor, so a
+file can be parsed once and added to any number of contexts.
+
+Raises RuntimeError if the content does not parse, with the parser
+diagnostics appended.
+)doc";
+
 constexpr const char* READ_VARINT_DOC = R"doc(
 Read one base-128 varint from `data`, starting at `offset`.
 
@@ -242,25 +1742,142 @@ Raises EOFError if the data ends mid-varint, RuntimeError for a varint longer
 than ten bytes, and IndexError for a negative offset or one past the end.
 )doc";
 
+constexpr const char* READ_VARINTS_DOC = R"doc(
+Read consecutive base-128 varints from `data` in one call, starting at
+`offset`.
+
+Reads `count` varints, or all of them up to the end of `data` if count is
+None. Returns the values as an array.array -- of typecode "Q", or "q" with
+zigzag=True -- together with the position just after the last one. Much
+faster than calling read_varint once per value, e.g. for packed repeated
+fields.
+
+Raises EOFError if the data ends before `count` varints or mid-varint,
+RuntimeError for a varint longer than ten bytes, IndexError for a negative
+offset or one past the end, and ValueError for a negative count.
+)doc";
+
+constexpr const char* READ_KCAT_RECORDS_DOC = R"doc(
+Read the records that kcat writes with -f "%o\n%k\n%R%s" from `data`,
+starting at `offset`.
+
+Every record is the Kafka offset and key on a line each, followed by the value
+prefixed with its 32-bit big-endian length. The value must carry the schema
+registry header: a zero magic byte, the schema ID and the message index array.
+
+Returns the complete records as (offset, key, schema_id, message_index,
+payload) tuples, with the payload -- the message after the header -- as a
+memoryview slice of `data`, together with the position of the first record
+that `data` ends inside of, where reading continues once more data is there.
+protosaurus.kcat.iter_records does that for a file.
+
+Raises RuntimeError for an offset that is not a number, a wrong magic byte or
+an implausible message index array, EOFError if a value ends inside its
+message index array, UnicodeDecodeError for a key that is not UTF-8, and
+IndexError for a negative offset or one past the end.
+)doc";
+
 }  // namespace
 
 NB_MODULE(protosaurus_ext, m) {
   nb::class_<Context>(m, "Context", CONTEXT_DOC)
-      .def(nb::init<>())
+      .def(nb::init<std::size_t>(), nb::kw_only(), "arena_size"_a = protosaurus::DEFAULT_ARENA_SIZE, INIT_DOC)
       .def("add_proto", &add_proto, "filename"_a, "content"_a, ADD_PROTO_DOC)
+      .def("add_protos", &add_protos, "files"_a, nb::kw_only(), "workers"_a = 0, ADD_PROTOS_DOC)
+      .def("add_file_descriptor", &add_file_descriptor, "data"_a, ADD_FILE_DESCRIPTOR_DOC)
+      .def("add_descriptor_set", &add_descriptor_set, "data"_a, ADD_DESCRIPTOR_SET_DOC)
+      .def("export_descriptor_set", &export_descriptor_set, EXPORT_DESCRIPTOR_SET_DOC)
       .def("to_json", &to_json, "message_type"_a, "data"_a, nb::kw_only(), "include_defaults"_a = false,
            "pretty"_a = false, "proto_field_names"_a = false, "enums_as_ints"_a = false, "unquote_int64"_a = false,
-           TO_JSON_DOC)
+           "fields"_a = nb::none(), "json_dumps_format"_a = false, TO_JSON_DOC)
+      .def("to_json_many", &to_json_many, "message_type"_a, "payloads"_a, nb::kw_only(), "include_defaults"_a = false,
+           "pretty"_a = false, "proto_field_names"_a = false, "enums_as_ints"_a = false, "unquote_int64"_a = false,
+           "workers"_a = 1, "fields"_a = nb::none(), "json_dumps_format"_a = false, "prefixes"_a = nb::none(),
+           TO_JSON_MANY_DOC)
       .def("from_json", &from_json, "message_type"_a, "json"_a, nb::kw_only(), "ignore_unknown_fields"_a = false,
            FROM_JSON_DOC)
+      // Two signatures, so that the result type follows from on_error. The
+      // first takes every call, since on_error is a plain string for it.
+      .def("from_json_many", &from_json_many, "message_type"_a, "documents"_a, nb::kw_only(),
+           "ignore_unknown_fields"_a = false, "on_error"_a = "raise", "workers"_a = 1,
+           nb::sig("def from_json_many(self, message_type: str, documents: collections.abc.Sequence[str], *, "
+                   "ignore_unknown_fields: bool = False, on_error: typing.Literal['raise'] = 'raise', "
+                   "workers: int = 1) -> list[bytes]"),
+           FROM_JSON_MANY_DOC)
+      .def("from_json_many", &from_json_many, "message_type"_a, "documents"_a, nb::kw_only(),
+           "ignore_unknown_fields"_a = false, "on_error"_a, "workers"_a = 1,
+           nb::sig("def from_json_many(self, message_type: str, documents: collections.abc.Sequence[str], *, "
+                   "ignore_unknown_fields: bool = False, on_error: typing.Literal['collect'], "
+                   "workers: int = 1) -> tuple[list[bytes | None], list[tuple[int, str]]]"))
+      .def("to_dict", &to_dict, "message_type"_a, "data"_a, nb::kw_only(), "include_defaults"_a = false,
+           "proto_field_names"_a = false, "enums_as_ints"_a = false, "fields"_a = nb::none(),
+           nb::sig("def to_dict(self, message_type: str, data: collections.abc.Buffer, *, "
+                   "include_defaults: bool = False, proto_field_names: bool = False, enums_as_ints: bool = False, "
+                   "fields: collections.abc.Sequence[str] | None = None) -> dict[str, typing.Any]"),
+           TO_DICT_DOC)
+      .def("from_dict", &from_dict, "message_type"_a, "obj"_a, nb::kw_only(), "ignore_unknown_fields"_a = false,
+           nb::sig("def from_dict(self, message_type: str, obj: dict[str, typing.Any], *, "
+                   "ignore_unknown_fields: bool = False) -> bytes"),
+           FROM_DICT_DOC)
+      .def("message_handle", &message_handle, "message_type"_a, nb::keep_alive<0, 1>(), MESSAGE_HANDLE_DOC)
+      .def("to_arrow", &to_arrow, "message_type"_a, "payloads"_a, "schema"_a,
+           nb::sig("def to_arrow(self, message_type: str, payloads: collections.abc.Sequence[collections.abc.Buffer], "
+                   "schema: object) "
+                   "-> object"),
+           TO_ARROW_DOC)
+      .def("from_arrow", &from_arrow, "message_type"_a, "batch"_a, nb::kw_only(), "delimited"_a = false,
+           nb::sig("def from_arrow(self, message_type: str, batch: object, *, delimited: bool = False) -> "
+                   "list[bytes] | bytes"),
+           FROM_ARROW_DOC)
       .def("message_type_from_index", &message_type_from_index, "filename"_a, "message_index"_a,
            MESSAGE_TYPE_FROM_INDEX_DOC)
+      .def("view", &view, "message_type"_a, "data"_a, VIEW_DOC)
+      .def("extract_column", &extract_column, "message_type"_a, "payloads"_a, "path"_a, nb::kw_only(), "mask"_a = false,
+           "workers"_a = 1,
+           nb::sig("def extract_column(self, message_type: str, "
+                   "payloads: collections.abc.Sequence[collections.abc.Buffer], path: str, *, mask: bool = False, "
+                   "workers: int = 1) -> numpy.ndarray | tuple[numpy.ndarray, numpy.ndarray]"),
+           EXTRACT_COLUMN_DOC)
+      .def("compile_filter", &compile_filter, "message_type"_a, "expression"_a, COMPILE_FILTER_DOC)
       .def("describe", &describe, "type_name"_a, DESCRIBE_DOC);
 
+  nb::class_<MessageView>(m, "MessageView", MESSAGE_VIEW_DOC)
+      .def_prop_ro("message_type", &MessageView::message_type, "The fully qualified name of the message type.")
+      .def("__getitem__", &view_getitem, "name"_a, nb::sig("def __getitem__(self, name: str, /) -> typing.Any"))
+      .def("__getattr__", &view_getattr, "name"_a, nb::sig("def __getattr__(self, name: str, /) -> typing.Any"))
+      .def("__contains__", &view_contains, "name"_a, nb::sig("def __contains__(self, name: str, /) -> bool"));
+
+  nb::class_<MessageFilter>(m, "MessageFilter", FILTER_DOC)
+      .def_prop_ro("message_type", &MessageFilter::message_type, "The fully qualified name of the message type.")
+      .def_prop_ro("expression", &MessageFilter::expression, "The expression the filter was compiled from.")
+      .def("matches", &filter_matches, "data"_a, FILTER_MATCHES_DOC)
+      .def("filter_many", &filter_many, "payloads"_a, nb::kw_only(), "workers"_a = 1, FILTER_MANY_DOC);
+
+  nb::class_<MessageHandle>(m, "MessageHandle", HANDLE_DOC)
+      .def_prop_ro("message_type", &MessageHandle::message_type, "The fully qualified name of the message type.")
+      .def("to_json", &handle_to_json, "data"_a, nb::kw_only(), "include_defaults"_a = false, "pretty"_a = false,
+           "proto_field_names"_a = false, "enums_as_ints"_a = false, "unquote_int64"_a = false, "fields"_a = nb::none(),
+           "json_dumps_format"_a = false, HANDLE_TO_JSON_DOC)
+      .def("from_json", &handle_from_json, "json"_a, nb::kw_only(), "ignore_unknown_fields"_a = false,
+           HANDLE_FROM_JSON_DOC);
+
+  m.def("parse_proto", &parse_proto, "filename"_a, "content"_a, PARSE_PROTO_DOC);
+
   // The return type is built dynamically, so nanobind would infer a bare
   // `object`. Spell the signature out instead, for the stub and the docstring.
   m.def("read_varint", &read_varint, "data"_a, "offset"_a = 0, nb::kw_only(), "zigzag"_a = false,
-        nb::sig("def read_varint(data: bytes, offset: int = 0, *, zigzag: bool = False) -> "
+        nb::sig("def read_varint(data: collections.abc.Buffer, offset: int = 0, *, zigzag: bool = False) -> "
                 "tuple[int, int]"),
         READ_VARINT_DOC);
+
+  m.def("read_varints", &read_varints, "data"_a, "offset"_a = 0, "count"_a = nb::none(), nb::kw_only(),
+        "zigzag"_a = false,
+        nb::sig("def read_varints(data: collections.abc.Buffer, offset: int = 0, count: int | None = None, *, "
+                "zigzag: bool = False) -> tuple[array.array[int], int]"),
+        READ_VARINTS_DOC);
+
+  m.def("read_kcat_records", &read_kcat_records, "data"_a, "offset"_a = 0,
+        nb::sig("def read_kcat_records(data: collections.abc.Buffer, offset: int = 0) -> "
+                "tuple[list[tuple[int, str, int, list[int], memoryview]], int]"),
+        READ_KCAT_RECORDS_DOC);
 }
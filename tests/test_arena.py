@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from protosaurus import Context
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_TREE_PROTO = """
+    syntax = "proto3";
+    message Leaf {
+        string label = 1;
+        int64 value = 2;
+    }
+    message Node {
+        string name = 1;
+        repeated Leaf leaves = 2;
+        map<string, Leaf> named = 3;
+    }
+    message Tree {
+        repeated Node nodes = 1;
+    }
+    """
+
+_TREE = {
+    "nodes": [
+        {
+            "name": f"node-{i}",
+            "leaves": [{"label": "x" * i, "value": str(j)} for j in range(1, 11)],
+            "named": {f"k{j}": {"value": str(j)} for j in range(1, 4)},
+        }
+        for i in range(1, 30)
+    ]
+}
+
+
+# 0 disables arenas, 64 is smaller than any real block so every message
+# spills into further arena blocks, the default fits the whole tree.
+@pytest.mark.parametrize("arena_size", [0, 64, None], ids=["heap", "tiny", "default"])
+def test_arena_size_does_not_change_results(arena_size):
+    ctx = Context() if arena_size is None else Context(arena_size=arena_size)
+    ctx.add_proto("tree", _TREE_PROTO)
+
+    data = ctx.from_json("Tree", json.dumps(_TREE))
+
+    # repeated calls reuse the thread's arena block
+    for _ in range(3):
+        assert json.loads(ctx.to_json("Tree", data)) == _TREE
+
+
+def test_contexts_with_different_arena_sizes_share_a_thread():
+    small = Context(arena_size=64)
+    large = Context(arena_size=1 << 20)
+
+    for ctx in (small, large):
+        ctx.add_proto("tree", _TREE_PROTO)
+
+    data = small.from_json("Tree", json.dumps(_TREE))
+
+    for ctx in (large, small, large):
+        assert json.loads(ctx.to_json("Tree", data)) == _TREE
+
+
+def test_arena_size_is_keyword_only():
+    with pytest.raises(TypeError):
+        Context(0)
+
+
+def test_negative_arena_size_is_rejected():
+    with pytest.raises(TypeError):
+        Context(arena_size=-1)
@@ -1,4 +1,5 @@
 import importlib
+import json
 import sys
 
 import pytest
@@ -7,7 +8,8 @@ pytest.importorskip('pyarrow')
 
 import pyarrow as pa
 
-from protosaurus.arrow import derive_schema
+from protosaurus import read_varint
+from protosaurus.arrow import derive_schema, from_record_batch, to_record_batch
 
 _SCALAR_PROTO = """
     syntax = "proto3";
@@ -262,3 +264,271 @@ def test_real_oneof_members_are_independent_nullable_fields(full_zoo_ctx):
     assert arrow_field(schema, 'cage_id').nullable is True
     assert arrow_field(schema, 'zone_id').type == pa.int32()
     assert arrow_field(schema, 'zone_id').nullable is True
+
+
+# --- to_record_batch ---
+
+
+def encode_animal(ctx, data):
+    return ctx.from_json('fullzoo.Animal', json.dumps(data))
+
+
+def test_to_record_batch_uses_the_derived_schema(full_zoo_ctx):
+    batch = to_record_batch(full_zoo_ctx, 'fullzoo.Animal', [])
+
+    assert batch.schema == derive_schema(full_zoo_ctx, 'fullzoo.Animal')
+    assert batch.num_rows == 0
+
+
+def test_to_record_batch_decodes_every_column(full_zoo_ctx):
+    payload = encode_animal(full_zoo_ctx, {
+        'name': 'Rex',
+        'diet': 'HERBIVOROUS',
+        'tags': ['big', 'loud'],
+        'attributes': {'colour': 'green'},
+        'friends': {'best': {'name': 'Bob'}},
+        'zoneId': 4,
+    })
+
+    batch = to_record_batch(full_zoo_ctx, 'fullzoo.Animal', [payload])
+
+    batch.validate(full=True)
+    assert batch.to_pylist() == [{
+        'name': 'Rex',
+        'diet': 'HERBIVOROUS',
+        'tags': ['big', 'loud'],
+        'attributes': [('colour', 'green')],
+        'friends': [('best', {'name': 'Bob'})],
+        'cage_id': None,
+        'zone_id': 4,
+    }]
+
+
+def test_to_record_batch_keeps_payload_order(full_zoo_ctx):
+    payloads = [encode_animal(full_zoo_ctx, {'name': f'dino-{i}'}) for i in range(100)]
+
+    batch = to_record_batch(full_zoo_ctx, 'fullzoo.Animal', payloads)
+
+    assert batch.column('name').to_pylist() == [f'dino-{i}' for i in range(100)]
+
+
+def test_to_record_batch_fields_without_presence_hold_their_default(full_zoo_ctx):
+    batch = to_record_batch(full_zoo_ctx, 'fullzoo.Animal', [b''])
+
+    row = batch.to_pylist()[0]
+
+    assert row['name'] == ''
+    assert row['diet'] == 'CARNIVOROUS'
+    assert row['tags'] == []
+
+
+def test_to_record_batch_unset_fields_with_presence_are_null(zoo_ctx):
+    batch = to_record_batch(zoo_ctx, 'zoo.Animal', [b''])
+
+    assert batch.column('trainer').to_pylist() == [None]
+
+
+def test_to_record_batch_nested_message(zoo_ctx):
+    payload = zoo_ctx.from_json('zoo.Animal', json.dumps({'trainer': {'name': 'Alan'}}))
+
+    batch = to_record_batch(zoo_ctx, 'zoo.Animal', [payload])
+
+    assert batch.column('trainer').to_pylist() == [{'name': 'Alan'}]
+
+
+def test_to_record_batch_unknown_enum_number_is_null(full_zoo_ctx):
+    # field 2 (diet) as varint 5, which the enum does not declare
+    batch = to_record_batch(full_zoo_ctx, 'fullzoo.Animal', [b'\x10\x05'])
+
+    assert batch.column('diet').to_pylist() == [None]
+
+
+@pytest.mark.parametrize('field_name,json_value,expected', [
+    ('f_double', 7.5, 7.5),
+    ('f_float', 7.5, 7.5),
+    ('f_int32', -7, -7),
+    ('f_int64', str(-(2**40)), -(2**40)),
+    ('f_uint32', 2**32 - 1, 2**32 - 1),
+    ('f_uint64', str(2**64 - 1), 2**64 - 1),
+    ('f_sint32', -7, -7),
+    ('f_sint64', str(-(2**40)), -(2**40)),
+    ('f_fixed32', 7, 7),
+    ('f_fixed64', str(2**64 - 1), 2**64 - 1),
+    ('f_sfixed32', -7, -7),
+    ('f_sfixed64', str(-(2**40)), -(2**40)),
+    ('f_bool', True, True),
+    ('f_string', 'value', 'value'),
+    ('f_bytes', 'AAE=', b'\x00\x01'),
+])
+def test_to_record_batch_scalar_values(scalars_ctx, field_name, json_value, expected):
+    payload = scalars_ctx.from_json('Scalars', json.dumps({field_name: json_value}))
+
+    batch = to_record_batch(scalars_ctx, 'Scalars', [payload])
+
+    assert batch.column(field_name).to_pylist() == [expected]
+
+
+def test_to_record_batch_reports_position_of_invalid_payload(zoo_ctx):
+    with pytest.raises(RuntimeError, match=r'^Payload 1: '):
+        to_record_batch(zoo_ctx, 'zoo.Animal', [b'', b'\xff'])
+
+
+def test_to_record_batch_passes_max_depth_through(ctx):
+    ctx.add_proto('tree', """
+        syntax = "proto3";
+        package tree;
+        message Node {
+            string label = 1;
+            Node child = 2;
+        }
+        """)
+    payload = ctx.from_json('tree.Node', json.dumps({'label': 'a', 'child': {'label': 'b'}}))
+
+    batch = to_record_batch(ctx, 'tree.Node', [payload], max_depth=1)
+
+    assert batch.to_pylist() == [{'label': 'a', 'child': {'label': 'b'}}]
+
+
+def test_to_arrow_skips_fields_the_schema_leaves_out(zoo_ctx):
+    # name is Rex, and the trainer holds a string that is not valid UTF-8,
+    # which only a full parse would reject
+    payload = b'\x0a\x03Rex' + b'\x12\x03\x0a\x01\xff'
+    schema = pa.schema([pa.field('name', pa.string())])
+
+    array = zoo_ctx.to_arrow('zoo.Animal', [payload], schema)
+    batch = pa.RecordBatch._import_from_c_capsule(schema.__arrow_c_schema__(), array)
+
+    assert batch.to_pylist() == [{'name': 'Rex'}]
+
+
+def test_to_arrow_rejects_a_field_the_message_does_not_have(zoo_ctx):
+    schema = pa.schema([pa.field('nope', pa.string())])
+
+    with pytest.raises(RuntimeError, match='"nope" has no counterpart in message type'):
+        zoo_ctx.to_arrow('zoo.Animal', [], schema)
+
+
+def test_to_arrow_rejects_a_mismatching_type(zoo_ctx):
+    schema = pa.schema([pa.field('name', pa.int64())])
+
+    with pytest.raises(RuntimeError, match='Arrow field "name" has format "l"'):
+        zoo_ctx.to_arrow('zoo.Animal', [], schema)
+
+
+# --- from_record_batch ---
+
+
+def test_from_record_batch_round_trips_to_record_batch(full_zoo_ctx):
+    payloads = [
+        encode_animal(full_zoo_ctx, {
+            'name': 'Rex',
+            'diet': 'HERBIVOROUS',
+            'tags': ['big', 'loud'],
+            'attributes': {'colour': 'green'},
+            'friends': {'best': {'name': 'Bob'}},
+            'cageId': 3,
+        }),
+        encode_animal(full_zoo_ctx, {}),
+    ]
+
+    batch = to_record_batch(full_zoo_ctx, 'fullzoo.Animal', payloads)
+
+    assert from_record_batch(full_zoo_ctx, 'fullzoo.Animal', batch) == payloads
+
+
+def test_from_record_batch_from_python_rows(full_zoo_ctx):
+    schema = derive_schema(full_zoo_ctx, 'fullzoo.Animal')
+    batch = pa.RecordBatch.from_pylist(
+        [{
+            'name': 'Rex',
+            'diet': 'HERBIVOROUS',
+            'tags': ['a'],
+            'friends': [('best', {'name': 'Bob'})],
+        }],
+        schema=schema,
+    )
+
+    (payload,) = from_record_batch(full_zoo_ctx, 'fullzoo.Animal', batch)
+
+    assert json.loads(full_zoo_ctx.to_json('fullzoo.Animal', payload)) == {
+        'name': 'Rex',
+        'diet': 'HERBIVOROUS',
+        'tags': ['a'],
+        'friends': {'best': {'name': 'Bob'}},
+    }
+
+
+def test_from_record_batch_leaves_null_and_missing_columns_unset(zoo_ctx):
+    batch = pa.RecordBatch.from_pylist([{'name': None}], schema=pa.schema([('name', pa.string())]))
+
+    assert from_record_batch(zoo_ctx, 'zoo.Animal', batch) == [b'']
+
+
+def test_from_record_batch_reads_sliced_batches(full_zoo_ctx):
+    payloads = [
+        encode_animal(full_zoo_ctx, {'name': f'dino-{i}', 'tags': [str(i)]}) for i in range(10)
+    ]
+    batch = to_record_batch(full_zoo_ctx, 'fullzoo.Animal', payloads)
+
+    assert from_record_batch(full_zoo_ctx, 'fullzoo.Animal', batch.slice(3, 4)) == payloads[3:7]
+
+
+@pytest.mark.parametrize('field_name,json_value', [
+    ('f_double', 7.5),
+    ('f_float', 7.5),
+    ('f_int32', -7),
+    ('f_int64', str(-(2**40))),
+    ('f_uint32', 2**32 - 1),
+    ('f_uint64', str(2**64 - 1)),
+    ('f_sint32', -7),
+    ('f_sint64', str(-(2**40))),
+    ('f_fixed32', 7),
+    ('f_fixed64', str(2**64 - 1)),
+    ('f_sfixed32', -7),
+    ('f_sfixed64', str(-(2**40))),
+    ('f_bool', True),
+    ('f_string', 'value'),
+    ('f_bytes', 'AAE='),
+])
+def test_from_record_batch_scalar_values(scalars_ctx, field_name, json_value):
+    payload = scalars_ctx.from_json('Scalars', json.dumps({field_name: json_value}))
+    batch = to_record_batch(scalars_ctx, 'Scalars', [payload])
+
+    assert from_record_batch(scalars_ctx, 'Scalars', batch) == [payload]
+
+
+def test_from_record_batch_delimited(zoo_ctx):
+    payloads = [zoo_ctx.from_json('zoo.Animal', json.dumps({'name': name})) for name in ('a', 'bc')]
+    batch = to_record_batch(zoo_ctx, 'zoo.Animal', payloads)
+
+    buffer = from_record_batch(zoo_ctx, 'zoo.Animal', batch, delimited=True)
+
+    messages, offset = [], 0
+    while offset < len(buffer):
+        size, offset = read_varint(buffer, offset)
+        messages.append(buffer[offset:offset + size])
+        offset += size
+
+    assert messages == payloads
+
+
+def test_from_record_batch_unknown_enum_name_names_the_row(full_zoo_ctx):
+    schema = pa.schema([pa.field('diet', pa.dictionary(pa.int32(), pa.string()))])
+    batch = pa.RecordBatch.from_pylist([{'diet': 'CARNIVOROUS'}, {'diet': 'VEGAN'}], schema=schema)
+
+    with pytest.raises(RuntimeError, match=r'^Row 1: "VEGAN" is not a value of enum'):
+        from_record_batch(full_zoo_ctx, 'fullzoo.Animal', batch)
+
+
+def test_from_record_batch_rejects_a_mismatching_type(zoo_ctx):
+    batch = pa.RecordBatch.from_pylist([{'name': 1}], schema=pa.schema([('name', pa.int64())]))
+
+    with pytest.raises(RuntimeError, match='Arrow field "name" has format "l"'):
+        from_record_batch(zoo_ctx, 'zoo.Animal', batch)
+
+
+def test_from_record_batch_rejects_a_column_the_message_does_not_have(zoo_ctx):
+    batch = pa.RecordBatch.from_pylist([{'nope': 'x'}])
+
+    with pytest.raises(RuntimeError, match='"nope" has no counterpart in message type'):
+        from_record_batch(zoo_ctx, 'zoo.Animal', batch)
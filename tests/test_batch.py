@@ -0,0 +1,236 @@
+import json
+
+import pytest
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_ANIMAL_PROTO = """
+    syntax = "proto3";
+    package zoo;
+    message Animal {
+        string name = 1;
+        int64 weight = 2;
+    }
+    """
+
+
+@pytest.fixture
+def zoo(ctx):
+    ctx.add_proto("zoo", _ANIMAL_PROTO)
+    return ctx
+
+
+def encode(ctx, data):
+    return ctx.from_json("zoo.Animal", json.dumps(data))
+
+
+# --- to_json_many ---
+
+
+def test_to_json_many_matches_to_json(zoo):
+    payloads = [encode(zoo, {"name": name}) for name in ("Rex", "Iguanodon", "Diplodocus")]
+
+    actual = zoo.to_json_many("zoo.Animal", payloads)
+
+    assert actual == [zoo.to_json("zoo.Animal", payload) for payload in payloads]
+
+
+def test_to_json_many_keeps_order(zoo):
+    payloads = [encode(zoo, {"name": f"dino-{i}"}) for i in range(100)]
+
+    actual = [json.loads(doc)["name"] for doc in zoo.to_json_many("zoo.Animal", payloads)]
+
+    assert actual == [f"dino-{i}" for i in range(100)]
+
+
+def test_to_json_many_empty_batch(zoo):
+    assert zoo.to_json_many("zoo.Animal", []) == []
+
+
+def test_to_json_many_accepts_a_tuple(zoo):
+    payload = encode(zoo, {"name": "Rex"})
+
+    assert zoo.to_json_many("zoo.Animal", (payload,)) == [zoo.to_json("zoo.Animal", payload)]
+
+
+def test_to_json_many_does_not_leak_fields_between_items(zoo):
+    # the message is reused across the batch, so a field set by one payload
+    # must not show up in the next one
+    payloads = [encode(zoo, {"name": "Rex", "weight": "7"}), encode(zoo, {"name": "Tiny"})]
+
+    actual = [json.loads(doc) for doc in zoo.to_json_many("zoo.Animal", payloads)]
+
+    assert actual == [{"name": "Rex", "weight": "7"}, {"name": "Tiny"}]
+
+
+def test_to_json_many_applies_options(zoo):
+    payloads = [encode(zoo, {"weight": "7"})]
+
+    (actual,) = zoo.to_json_many("zoo.Animal", payloads, include_defaults=True, unquote_int64=True)
+
+    assert json.loads(actual) == {"name": "", "weight": 7}
+
+
+def test_to_json_many_options_are_keyword_only(zoo):
+    with pytest.raises(TypeError):
+        zoo.to_json_many("zoo.Animal", [], True)
+
+
+def test_to_json_many_reports_position_of_invalid_payload(zoo):
+    payloads = [encode(zoo, {"name": "Rex"}), b"\xff"]
+
+    with pytest.raises(RuntimeError, match=r"^Payload 1: Could not parse 1 bytes"):
+        zoo.to_json_many("zoo.Animal", payloads)
+
+
+def test_to_json_many_unknown_type(zoo):
+    with pytest.raises(RuntimeError, match='Could not find message type "Nope"'):
+        zoo.to_json_many("Nope", [])
+
+
+def test_to_json_many_rejects_non_bytes(zoo):
+    with pytest.raises(TypeError):
+        zoo.to_json_many("zoo.Animal", ["not bytes"])
+
+
+# --- from_json_many ---
+
+
+def test_from_json_many_matches_from_json(zoo):
+    documents = [json.dumps({"name": name}) for name in ("Rex", "Iguanodon")]
+
+    actual = zoo.from_json_many("zoo.Animal", documents)
+
+    assert actual == [zoo.from_json("zoo.Animal", document) for document in documents]
+
+
+def test_from_json_many_round_trips_through_to_json_many(zoo):
+    documents = [json.dumps({"name": f"dino-{i}", "weight": str(i)}) for i in range(1, 51)]
+
+    actual = zoo.to_json_many("zoo.Animal", zoo.from_json_many("zoo.Animal", documents))
+
+    assert [json.loads(doc) for doc in actual] == [json.loads(doc) for doc in documents]
+
+
+def test_from_json_many_does_not_leak_fields_between_items(zoo):
+    documents = [json.dumps({"name": "Rex", "weight": "7"}), json.dumps({"name": "Tiny"})]
+
+    actual = zoo.from_json_many("zoo.Animal", documents)
+
+    assert actual[1] == zoo.from_json("zoo.Animal", documents[1])
+
+
+def test_from_json_many_raise_reports_position(zoo):
+    documents = [json.dumps({"name": "Rex"}), "{not json"]
+
+    with pytest.raises(RuntimeError, match=r"^Document 1: Could not convert json"):
+        zoo.from_json_many("zoo.Animal", documents)
+
+
+def test_from_json_many_collect_keeps_the_good_documents(zoo):
+    documents = [json.dumps({"name": "Rex"}), "{not json", json.dumps({"name": "Tiny"})]
+
+    messages, errors = zoo.from_json_many("zoo.Animal", documents, on_error="collect")
+
+    assert messages[0] == zoo.from_json("zoo.Animal", documents[0])
+    assert messages[1] is None
+    assert messages[2] == zoo.from_json("zoo.Animal", documents[2])
+    assert [index for index, _ in errors] == [1]
+    assert errors[0][1].startswith("Could not convert json")
+
+
+def test_from_json_many_collect_without_errors(zoo):
+    messages, errors = zoo.from_json_many(
+        "zoo.Animal", [json.dumps({"name": "Rex"})], on_error="collect"
+    )
+
+    assert len(messages) == 1
+    assert errors == []
+
+
+def test_from_json_many_ignore_unknown_fields(zoo):
+    documents = [json.dumps({"name": "Rex", "nope": 1})]
+
+    (actual,) = zoo.from_json_many("zoo.Animal", documents, ignore_unknown_fields=True)
+
+    assert json.loads(zoo.to_json("zoo.Animal", actual)) == {"name": "Rex"}
+
+
+def test_from_json_many_rejects_unknown_on_error(zoo):
+    with pytest.raises(ValueError, match="on_error"):
+        zoo.from_json_many("zoo.Animal", [], on_error="ignore")
+
+
+def test_from_json_many_unknown_type_raises_even_when_collecting(zoo):
+    with pytest.raises(RuntimeError, match='Could not find message type "Nope"'):
+        zoo.from_json_many("Nope", ["{}"], on_error="collect")
+
+
+def test_to_json_many_accepts_buffers(zoo):
+    payload = encode(zoo, {"name": "Rex"})
+    expected = zoo.to_json("zoo.Animal", payload)
+
+    actual = zoo.to_json_many("zoo.Animal", [bytearray(payload), memoryview(b"xx" + payload)[2:]])
+
+    assert actual == [expected, expected]
+
+
+# --- workers ---
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2, 8])
+def test_to_json_many_workers_keep_order(zoo, workers):
+    payloads = [encode(zoo, {"name": f"dino-{i}"}) for i in range(1000)]
+
+    actual = zoo.to_json_many("zoo.Animal", payloads, workers=workers)
+
+    assert actual == zoo.to_json_many("zoo.Animal", payloads)
+
+
+def test_to_json_many_workers_report_first_invalid_payload(zoo):
+    payloads = [encode(zoo, {"name": "Rex"})] * 1000
+    payloads[700] = b"\xff"
+    payloads[300] = b"\xff"
+
+    with pytest.raises(RuntimeError, match=r"^Payload 300: "):
+        zoo.to_json_many("zoo.Animal", payloads, workers=8)
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2, 8])
+def test_from_json_many_workers_keep_order(zoo, workers):
+    documents = [json.dumps({"name": f"dino-{i}"}) for i in range(1000)]
+
+    actual = zoo.from_json_many("zoo.Animal", documents, workers=workers)
+
+    assert actual == zoo.from_json_many("zoo.Animal", documents)
+
+
+def test_from_json_many_workers_collect_errors_in_order(zoo):
+    documents = [json.dumps({"name": "Rex"})] * 1000
+    documents[900] = "{not json"
+    documents[100] = "{not json"
+
+    messages, errors = zoo.from_json_many(
+        "zoo.Animal", documents, on_error="collect", workers=8
+    )
+
+    assert [index for index, _ in errors] == [100, 900]
+    assert messages[100] is None
+    assert messages[900] is None
+    assert sum(message is not None for message in messages) == 998
+
+
+def test_from_json_many_workers_raise_first_invalid_document(zoo):
+    documents = [json.dumps({"name": "Rex"})] * 1000
+    documents[999] = "{not json"
+    documents[500] = "{not json"
+
+    with pytest.raises(RuntimeError, match=r"^Document 500: "):
+        zoo.from_json_many("zoo.Animal", documents, workers=8)
+
+
+def test_workers_must_not_be_negative(zoo):
+    with pytest.raises(TypeError):
+        zoo.to_json_many("zoo.Animal", [], workers=-1)
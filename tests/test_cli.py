@@ -1,11 +1,18 @@
+import io
 import json
 import struct
 
 import pytest
 from click.testing import CliRunner
 
-from protosaurus import cli
-from protosaurus.cli import _format_record, _read_index_array, main
+from protosaurus import Context, cli
+from protosaurus.cli import (
+    _decode_batch,
+    _OutputBuffer,
+    _read_index_array,
+    _RecordFilter,
+    main,
+)
 
 if __name__ == "__main__":
     pytest.main()
@@ -71,11 +78,31 @@ def test_read_index_array_truncated_raises_eof():
         _read_index_array(b"\x06\x00", 0)
 
 
-# --- _format_record ---
+# --- _decode_batch ---
 
 
-def test_format_record_plain():
-    result = _format_record("42", "user-1", '{"name":"Iguanodon","length":10}')
+@pytest.fixture
+def decode_record(monkeypatch, ctx):
+    """Decode one record through _decode_batch and return its output line."""
+    ctx.add_proto(
+        "<<<MAIN>>>",
+        'syntax = "proto3"; message Dino { string name = 1; double length = 2; '
+        "string habitat = 3; int32 z = 4; }",
+    )
+    monkeypatch.setattr(cli, "_get_schema_by_id", lambda url, id, verify_ssl=True: ctx)
+
+    def decode(offset, key, message, pretty=False):
+        payload = ctx.from_json("Dino", json.dumps(message))
+        [line] = _decode_batch(
+            [(offset, key, 1, [0], payload)], "http://registry", True, 1, pretty=pretty
+        )
+        return line
+
+    return decode
+
+
+def test_decode_batch_plain(decode_record):
+    result = decode_record(42, "user-1", {"name": "Iguanodon", "length": 10})
     assert json.loads(result) == {
         "@offset": 42,
         "@key": "user-1",
@@ -84,37 +111,194 @@ def test_format_record_plain():
     }
 
 
-def test_format_record_escapes_quotes_in_key():
-    result = _format_record("7", 'he said "hi"', '{"name":"Rex"}')
+def test_decode_batch_escapes_quotes_in_key(decode_record):
+    result = decode_record(7, 'he said "hi"', {"name": "Rex"})
     assert json.loads(result) == {"@offset": 7, "@key": 'he said "hi"', "name": "Rex"}
 
 
-def test_format_record_escapes_newline_and_backslash_in_key():
-    result = _format_record("7", "a\\b\nc", '{"name":"Rex"}')
+def test_decode_batch_escapes_newline_and_backslash_in_key(decode_record):
+    result = decode_record(7, "a\\b\nc", {"name": "Rex"})
     assert json.loads(result) == {"@offset": 7, "@key": "a\\b\nc", "name": "Rex"}
 
 
-def test_format_record_offset_is_numeric():
-    result = _format_record("123", "k", "{}")
+def test_decode_batch_offset_is_numeric(decode_record):
+    result = decode_record(123, "k", {})
     assert json.loads(result)["@offset"] == 123
 
 
-def test_format_record_preserves_key_order():
-    result = _format_record("1", "k", '{"z":1}')
+def test_decode_batch_preserves_key_order(decode_record):
+    result = decode_record(1, "k", {"z": 1})
     assert list(json.loads(result).keys()) == ["@offset", "@key", "z"]
 
 
-def test_format_record_is_single_line_by_default():
-    result = _format_record("1", "k", '{"z":1}')
+def test_decode_batch_is_single_line_by_default(decode_record):
+    result = decode_record(1, "k", {"z": 1})
     assert "\n" not in result
 
 
-def test_format_record_pretty_indents_output():
-    result = _format_record("1", "k", '{"z":1}', pretty=True)
+@pytest.mark.parametrize("pretty", [False, True])
+def test_decode_batch_matches_json_dumps(decode_record, pretty):
+    message = {"name": "Tyrannosaurus 🦖", "length": 1e16, "habitat": "Laramidia — Nordamerika"}
+    result = decode_record(42, "schlüssel-ключ", message, pretty=pretty)
+    record = {"@offset": 42, "@key": "schlüssel-ключ", **message}
+    assert result == json.dumps(record, indent=2 if pretty else None)
+
+
+def test_decode_batch_pretty_indents_output(decode_record):
+    result = decode_record(1, "k", {"z": 1}, pretty=True)
     assert "\n" in result
     assert json.loads(result) == {"@offset": 1, "@key": "k", "z": 1}
 
 
+# --- _RecordFilter ---
+
+
+def _records(*schema_ids, start=0):
+    return [(start + i, "k", schema_id, [0], b"") for i, schema_id in enumerate(schema_ids)]
+
+
+def _offsets(records):
+    return [record[0] for record in records]
+
+
+def test_record_filter_selects_everything_by_default():
+    records = _records(1, 2, 3)
+
+    assert _RecordFilter("http://registry", True).select(records) == records
+
+
+def test_record_filter_offset_range_is_inclusive():
+    record_filter = _RecordFilter("http://registry", True, from_offset=2, to_offset=4)
+
+    assert _offsets(record_filter.select(_records(*[1] * 10))) == [2, 3, 4]
+
+
+def test_record_filter_every_nth_counts_across_batches():
+    record_filter = _RecordFilter("http://registry", True, every_nth=3)
+
+    first = record_filter.select(_records(*[1] * 4))
+    second = record_filter.select(_records(*[1] * 4, start=4))
+
+    assert _offsets(first + second) == [0, 3, 6]
+
+
+def test_record_filter_every_nth_samples_the_matching_records():
+    record_filter = _RecordFilter("http://registry", True, every_nth=2, schema_ids=[2])
+
+    assert _offsets(record_filter.select(_records(1, 2, 1, 2, 1, 2))) == [1, 5]
+
+
+def test_record_filter_schema_ids_do_not_fetch_schemas(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("no schema should be fetched")
+
+    monkeypatch.setattr(cli, "_get_schema_by_id", fail)
+    record_filter = _RecordFilter("http://registry", True, schema_ids=[2, 3])
+
+    assert _offsets(record_filter.select(_records(1, 2, 3, 4))) == [1, 2]
+
+
+def test_record_filter_message_types_resolve_each_schema_once(monkeypatch, ctx):
+    ctx.add_proto("<<<MAIN>>>", 'syntax = "proto3"; package shop; message A {} message B {}')
+    fetched = []
+
+    def get_schema_by_id(url, id, verify_ssl=True):
+        fetched.append(id)
+        return ctx
+
+    monkeypatch.setattr(cli, "_get_schema_by_id", get_schema_by_id)
+    record_filter = _RecordFilter("http://registry", True, message_types=["shop.B"])
+    records = [(i, "k", 1, [i % 2], b"") for i in range(6)]
+
+    assert _offsets(record_filter.select(records)) == [1, 3, 5]
+    assert fetched == [1, 1]
+
+
+def test_record_filter_message_types_skip_schemas_ruled_out_by_id(monkeypatch, ctx):
+    ctx.add_proto("<<<MAIN>>>", 'syntax = "proto3"; message A {}')
+    fetched = []
+
+    def get_schema_by_id(url, id, verify_ssl=True):
+        fetched.append(id)
+        return ctx
+
+    monkeypatch.setattr(cli, "_get_schema_by_id", get_schema_by_id)
+    record_filter = _RecordFilter("http://registry", True, schema_ids=[1], message_types=["A"])
+
+    assert _offsets(record_filter.select(_records(1, 2, 1, 2))) == [0, 2]
+    assert fetched == [1]
+
+
+def test_record_filter_where_reads_the_payloads(monkeypatch, ctx):
+    ctx.add_proto("<<<MAIN>>>", 'syntax = "proto3"; message A { int32 n = 1; }')
+    monkeypatch.setattr(cli, "_get_schema_by_id", lambda url, id, verify_ssl=True: ctx)
+    record_filter = _RecordFilter("http://registry", True, where="n >= 2", jobs=2)
+    records = [(i, "k", 1, [0], ctx.from_json("A", json.dumps({"n": i}))) for i in range(4)]
+
+    assert _offsets(record_filter.select(records)) == [2, 3]
+
+
+# --- _OutputBuffer ---
+
+
+class _CountingStream(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+def test_output_buffer_writes_lines_in_one_block():
+    stream = _CountingStream()
+    output = _OutputBuffer(stream)
+
+    for i in range(100):
+        output.write(f"line {i}")
+
+    assert stream.writes == 0
+
+    output.flush()
+
+    assert stream.writes == 1
+    assert stream.getvalue().decode().splitlines() == [f"line {i}" for i in range(100)]
+
+
+def test_output_buffer_writes_full_blocks(monkeypatch):
+    monkeypatch.setattr(cli, "_OUTPUT_BLOCK_SIZE", 10)
+    stream = _CountingStream()
+    output = _OutputBuffer(stream)
+
+    for _ in range(3):
+        output.write("0123456789")
+
+    assert stream.writes == 3
+    assert stream.getvalue() == b"0123456789\n" * 3
+
+
+def test_output_buffer_flush_every():
+    stream = _CountingStream()
+    output = _OutputBuffer(stream, flush_every=2)
+
+    output.write("a")
+    assert stream.getvalue() == b""
+
+    output.write("b")
+    assert stream.getvalue() == b"a\nb\n"
+
+
+def test_output_buffer_encodes_utf8():
+    stream = io.BytesIO()
+    output = _OutputBuffer(stream)
+
+    output.write("Ä")
+    output.flush()
+
+    assert stream.getvalue() == "Ä\n".encode()
+
+
 # --- CLI json output options ---
 
 _ORDER_PROTO = """
@@ -134,9 +318,9 @@ _ORDER_PROTO = """
 _SCHEMA_ID = 7
 
 
-def _frame(offset, key, payload):
+def _frame(offset, key, payload, schema_id=_SCHEMA_ID):
     """Build one record in the format main() reads."""
-    raw = struct.pack(">bI", 0, _SCHEMA_ID) + b"\x00" + payload
+    raw = struct.pack(">bI", 0, schema_id) + b"\x00" + payload
     return f"{offset}\n{key}\n".encode() + struct.pack(">I", len(raw)) + raw
 
 
@@ -144,6 +328,7 @@ def _frame(offset, key, payload):
 def order_cli(tmp_path, monkeypatch, ctx):
     """Wire the CLI to a fixed schema and return a runner for a single record."""
     monkeypatch.setattr(cli, "_schema_cache", {})
+    monkeypatch.setattr(cli, "_schema_cache_dir", None)
     monkeypatch.setattr(cli, "_session", None)
 
     ctx.add_proto("<<<MAIN>>>", _ORDER_PROTO)
@@ -214,6 +399,229 @@ def test_cli_record_metadata_survives_options(order_cli):
     assert record["@key"] == "user-1"
 
 
+def test_cli_schema_cache_dir_option(order_cli, tmp_path):
+    record = json.loads(order_cli({"orderId": "7"}, "--schema-cache-dir", str(tmp_path / "cache")))
+
+    assert record["orderId"] == "7"
+    assert cli._schema_cache_dir == tmp_path / "cache"
+
+
+def test_cli_reads_every_record(order_cli, ctx, tmp_path):
+    path = tmp_path / "many.bin"
+    payloads = [ctx.from_json("Order", json.dumps({"orderId": offset})) for offset in range(3)]
+    path.write_bytes(b"".join(_frame(i, f"user-{i}", p) for i, p in enumerate(payloads)))
+
+    result = CliRunner().invoke(main, [str(path), "--schema-registry", "http://registry"])
+
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [record["@offset"] for record in records] == [0, 1, 2]
+    assert [record["@key"] for record in records] == ["user-0", "user-1", "user-2"]
+
+
+def test_cli_rejects_a_truncated_stream(order_cli, ctx, tmp_path):
+    path = tmp_path / "truncated.bin"
+    path.write_bytes(_frame(0, "user-0", ctx.from_json("Order", '{"orderId": 1}'))[:-1])
+
+    result = CliRunner().invoke(main, [str(path), "--schema-registry", "http://registry"])
+
+    assert result.exit_code == 1
+    assert "Stream ends inside a record" in result.output
+
+
+def test_cli_writes_the_records_before_an_error(order_cli, ctx, tmp_path):
+    path = tmp_path / "truncated.bin"
+    complete = _frame(0, "user-0", ctx.from_json("Order", '{"orderId": 1}'))
+    path.write_bytes(complete + complete[:-1])
+
+    result = CliRunner().invoke(main, [str(path), "--schema-registry", "http://registry"])
+
+    assert result.exit_code == 1
+    assert json.loads(result.output.splitlines()[0])["@key"] == "user-0"
+
+
+@pytest.mark.parametrize("flush_every", ["0", "1", "2"])
+def test_cli_flush_every_option(order_cli, flush_every):
+    record = json.loads(order_cli({"orderId": "7"}, "--flush-every", flush_every))
+
+    assert record["orderId"] == "7"
+
+
+def test_cli_flush_every_rejects_negative_values(order_cli, tmp_path):
+    path = tmp_path / "records.bin"
+    path.write_bytes(b"")
+
+    result = CliRunner().invoke(
+        main, [str(path), "--schema-registry", "http://registry", "--flush-every", "-1"]
+    )
+
+    assert result.exit_code == 2
+
+
+# --- --jobs ---
+
+
+@pytest.mark.parametrize("jobs", ["1", "4", "0"])
+def test_cli_jobs_keep_the_input_order(order_cli, ctx, tmp_path, jobs):
+    path = tmp_path / "many.bin"
+    payloads = [ctx.from_json("Order", json.dumps({"orderId": i + 1})) for i in range(500)]
+    path.write_bytes(b"".join(_frame(i, f"user-{i}", p) for i, p in enumerate(payloads)))
+
+    result = CliRunner().invoke(
+        main, [str(path), "--schema-registry", "http://registry", "--jobs", jobs]
+    )
+
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [record["@offset"] for record in records] == list(range(500))
+    assert [record["orderId"] for record in records] == [str(i + 1) for i in range(500)]
+
+
+def test_cli_interleaved_schemas_keep_the_input_order(monkeypatch, tmp_path, ctx):
+    other = Context()
+    other.add_proto("<<<MAIN>>>", 'syntax = "proto3"; message Refund { int64 amount = 1; }')
+    ctx.add_proto("<<<MAIN>>>", _ORDER_PROTO)
+    contexts = {7: ctx, 8: other}
+    monkeypatch.setattr(cli, "_get_schema_by_id", lambda url, id, verify_ssl=True: contexts[id])
+
+    path = tmp_path / "mixed.bin"
+    path.write_bytes(
+        b"".join(
+            _frame(i, "k", ctx.from_json("Order", json.dumps({"orderId": i + 1})))
+            if i % 3
+            else _frame(i, "k", other.from_json("Refund", json.dumps({"amount": i + 1})), 8)
+            for i in range(100)
+        )
+    )
+
+    result = CliRunner().invoke(
+        main, [str(path), "--schema-registry", "http://registry", "--jobs", "2"]
+    )
+
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [record["@offset"] for record in records] == list(range(100))
+    assert [("amount" in record) for record in records] == [i % 3 == 0 for i in range(100)]
+
+
+def test_cli_invalid_payload_names_its_schema_and_offset(order_cli, ctx, tmp_path):
+    path = tmp_path / "invalid.bin"
+    valid = ctx.from_json("Order", '{"orderId": 1}')
+    path.write_bytes(_frame(10, "a", valid) + _frame(11, "b", b"\xff\xff\xff"))
+
+    result = CliRunner().invoke(main, [str(path), "--schema-registry", "http://registry"])
+
+    assert isinstance(result.exception, RuntimeError)
+    assert "Payload 1" in str(result.exception)
+    assert "Order records from offset 10 on" in result.exception.__notes__[0]
+
+
+# --- filters ---
+
+
+def test_cli_filters_skip_records_before_decoding(order_cli, ctx, tmp_path):
+    path = tmp_path / "many.bin"
+    valid = ctx.from_json("Order", '{"orderId": 1}')
+    # only the records that are filtered out are invalid
+    path.write_bytes(
+        b"".join(_frame(i, f"user-{i}", valid if i in (4, 6) else b"\xff") for i in range(10))
+    )
+
+    result = CliRunner().invoke(
+        main,
+        [
+            str(path),
+            "--schema-registry",
+            "http://registry",
+            "--from-offset",
+            "4",
+            "--to-offset",
+            "7",
+            "--every-nth",
+            "2",
+            "--schema-id",
+            str(_SCHEMA_ID),
+            "--message-type",
+            "Order",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line)["@offset"] for line in result.output.splitlines()] == [4, 6]
+
+
+def _order_records(ctx, tmp_path, orders):
+    path = tmp_path / "orders.bin"
+    payloads = [ctx.from_json("Order", json.dumps(order)) for order in orders]
+    path.write_bytes(b"".join(_frame(i, f"user-{i}", p) for i, p in enumerate(payloads)))
+    return path
+
+
+def test_cli_where_selects_matching_records(order_cli, ctx, tmp_path):
+    orders = [
+        {"orderId": i + 1, "status": "STATUS_SHIPPED" if i % 3 == 0 else "STATUS_UNKNOWN"}
+        for i in range(10)
+    ]
+    path = _order_records(ctx, tmp_path, orders)
+
+    result = CliRunner().invoke(
+        main,
+        [
+            str(path),
+            "--schema-registry",
+            "http://registry",
+            "--where",
+            'status == "STATUS_SHIPPED" and order_id != 7',
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line)["@offset"] for line in result.output.splitlines()] == [0, 3, 9]
+
+
+def test_cli_every_nth_samples_the_records_matching_where(order_cli, ctx, tmp_path):
+    path = _order_records(ctx, tmp_path, [{"orderId": i + 1} for i in range(10)])
+
+    result = CliRunner().invoke(
+        main,
+        [
+            str(path),
+            "--schema-registry",
+            "http://registry",
+            "--where",
+            "order_id > 4",
+            "--every-nth",
+            "2",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line)["@offset"] for line in result.output.splitlines()] == [4, 6, 8]
+
+
+def test_cli_where_that_does_not_fit_the_schema(order_cli, ctx, tmp_path):
+    path = _order_records(ctx, tmp_path, [{"orderId": 1}])
+
+    result = CliRunner().invoke(
+        main, [str(path), "--schema-registry", "http://registry", "--where", "colour == 'red'"]
+    )
+
+    assert result.exit_code == 2
+    assert "--where" in result.output
+    assert 'has no field named "colour"' in result.output
+
+
+def test_cli_every_nth_must_be_positive(order_cli, tmp_path):
+    path = tmp_path / "records.bin"
+    path.write_bytes(b"")
+
+    result = CliRunner().invoke(
+        main, [str(path), "--schema-registry", "http://registry", "--every-nth", "0"]
+    )
+
+    assert result.exit_code == 2
+
+
 def test_cli_without_schema_registry_reports_the_missing_option(tmp_path):
     path = tmp_path / "records.bin"
     path.write_bytes(b"")
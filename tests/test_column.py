@@ -0,0 +1,252 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_METRICS_PROTO = """
+    syntax = "proto3";
+    package metrics;
+    enum Outcome {
+        OUTCOME_UNKNOWN = 0;
+        OK = 1;
+        FAILED = 2;
+    }
+    message Timing {
+        double latency_ms = 1;
+        optional uint32 retries = 2;
+    }
+    message Request {
+        Timing timing = 1;
+        int32 status = 2;
+        int64 bytes_sent = 3;
+        uint64 trace_id = 4;
+        float score = 5;
+        bool cached = 6;
+        Outcome outcome = 7;
+        sint32 delta = 8;
+        fixed64 checksum = 9;
+        sfixed32 shift = 10;
+        string path = 11;
+        repeated int32 codes = 12;
+        repeated Timing attempts = 13;
+    }
+    """
+
+_LEGACY_PROTO = """
+    syntax = "proto2";
+    package legacy;
+    message Crate {
+        optional int32 size = 1 [default = 4];
+        optional group Lid = 2 {
+            optional int32 width = 3;
+        }
+    }
+    """
+
+_TREE_PROTO = """
+    syntax = "proto3";
+    message Node {
+        Node child = 1;
+        int32 value = 2;
+    }
+    """
+
+_REQUESTS = [
+    {
+        "timing": {"latencyMs": 12.5, "retries": 2},
+        "status": 200,
+        "bytesSent": "9007199254740993",
+        "traceId": "18446744073709551615",
+        "score": 0.25,
+        "cached": True,
+        "outcome": "OK",
+        "delta": -3,
+        "checksum": "42",
+        "shift": -7,
+    },
+    {"timing": {"latencyMs": 3.0}, "status": 404, "outcome": "FAILED"},
+    {},
+]
+
+
+@pytest.fixture
+def metrics_ctx(ctx):
+    ctx.add_proto("metrics.proto", _METRICS_PROTO)
+    return ctx
+
+
+@pytest.fixture
+def requests(metrics_ctx):
+    return [metrics_ctx.from_json("metrics.Request", json.dumps(r)) for r in _REQUESTS]
+
+
+def extract(ctx, payloads, path, **kwargs):
+    return ctx.extract_column("metrics.Request", payloads, path, **kwargs)
+
+
+# --- values ---
+
+
+@pytest.mark.parametrize(
+    ("path", "dtype", "expected"),
+    [
+        ("timing.latency_ms", np.float64, [12.5, 3.0, 0.0]),
+        ("status", np.int32, [200, 404, 0]),
+        ("bytes_sent", np.int64, [9007199254740993, 0, 0]),
+        ("trace_id", np.uint64, [18446744073709551615, 0, 0]),
+        ("score", np.float32, [0.25, 0.0, 0.0]),
+        ("cached", np.bool_, [True, False, False]),
+        ("outcome", np.int32, [1, 2, 0]),
+        ("delta", np.int32, [-3, 0, 0]),
+        ("checksum", np.uint64, [42, 0, 0]),
+        ("shift", np.int32, [-7, 0, 0]),
+        ("timing.retries", np.uint32, [2, 0, 0]),
+    ],
+)
+def test_dtypes_and_values(metrics_ctx, requests, path, dtype, expected):
+    actual = extract(metrics_ctx, requests, path)
+
+    assert actual.dtype == dtype
+    assert actual.shape == (3,)
+    assert actual.tolist() == expected
+
+
+def test_json_names(metrics_ctx, requests):
+    assert extract(metrics_ctx, requests, "timing.latencyMs").tolist() == [12.5, 3.0, 0.0]
+
+
+def test_mask(metrics_ctx, requests):
+    values, mask = extract(metrics_ctx, requests, "timing.retries", mask=True)
+
+    assert values.tolist() == [2, 0, 0]
+    assert mask.dtype == np.bool_
+    assert mask.tolist() == [True, False, False]
+
+
+def test_mask_counts_values_written_as_the_default(metrics_ctx):
+    # status 0, written explicitly
+    _, mask = extract(metrics_ctx, [b"\x10\x00", b""], "status", mask=True)
+
+    assert mask.tolist() == [True, False]
+
+
+def test_no_payloads(metrics_ctx):
+    values, mask = extract(metrics_ctx, [], "status", mask=True)
+
+    assert values.shape == (0,)
+    assert values.dtype == np.int32
+    assert mask.shape == (0,)
+
+
+def test_proto2_defaults(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+
+    assert ctx.extract_column("legacy.Crate", [b"", b"\x08\x07"], "size").tolist() == [4, 7]
+
+
+# --- wire format ---
+
+
+def test_the_last_value_wins(metrics_ctx):
+    # status 1, then status 2
+    assert extract(metrics_ctx, [b"\x10\x01\x10\x02"], "status").tolist() == [2]
+
+
+def test_occurrences_of_a_submessage_merge(metrics_ctx):
+    # timing with retries 1, then timing without retries, then status 5
+    data = b"\x0a\x02\x10\x01" + b"\x0a\x00" + b"\x10\x05"
+
+    values, mask = extract(metrics_ctx, [data], "timing.retries", mask=True)
+
+    assert values.tolist() == [1]
+    assert mask.tolist() == [True]
+
+
+def test_mismatched_wire_types_are_unknown_fields(metrics_ctx):
+    # status written as a fixed32
+    values, mask = extract(metrics_ctx, [b"\x15\x01\x00\x00\x00"], "status", mask=True)
+
+    assert values.tolist() == [0]
+    assert mask.tolist() == [False]
+
+
+def test_groups_nested_too_deeply(metrics_ctx, requests):
+    # groups of field 14 inside each other, never closed
+    data = b"\x73" * 2_000_000
+
+    with pytest.raises(RuntimeError, match=r"^Payload 1: .*not valid protobuf wire format"):
+        extract(metrics_ctx, [requests[0], data], "timing.latency_ms")
+
+
+def test_reads_buffers_in_place(metrics_ctx, requests):
+    payloads = [memoryview(bytearray(r)) for r in requests]
+
+    assert extract(metrics_ctx, payloads, "status").tolist() == [200, 404, 0]
+
+
+@pytest.mark.parametrize("workers", [1, 4, 0])
+def test_workers(metrics_ctx, requests, workers):
+    actual = extract(metrics_ctx, requests * 200, "timing.latency_ms", workers=workers)
+
+    assert actual.tolist() == [12.5, 3.0, 0.0] * 200
+
+
+def test_arrays_are_writable_and_outlive_the_payloads(metrics_ctx, requests):
+    values = extract(metrics_ctx, [bytes(r) for r in requests], "status")
+    values += 1
+
+    assert values.tolist() == [201, 405, 1]
+
+
+# --- errors ---
+
+
+@pytest.mark.parametrize(
+    ("path", "message"),
+    [
+        ("colour", 'message type "metrics.Request" has no field named "colour"'),
+        ("timing.colour", 'message type "metrics.Timing" has no field named "colour"'),
+        ("status.code", 'field "metrics.Request.status" is not a message'),
+        ("timing", 'field "metrics.Request.timing" is of type message'),
+        ("path", 'field "metrics.Request.path" is of type string'),
+        ("codes", 'field "metrics.Request.codes" is repeated'),
+        ("attempts.latency_ms", 'field "metrics.Request.attempts" is repeated'),
+        ("", 'message type "metrics.Request" has no field named ""'),
+    ],
+)
+def test_invalid_paths(metrics_ctx, path, message):
+    with pytest.raises(RuntimeError, match=f'Invalid column path "{path}"') as info:
+        extract(metrics_ctx, [], path)
+
+    assert message in str(info.value)
+
+
+def test_paths_deeper_than_protobuf_parses(ctx):
+    ctx.add_proto("tree.proto", _TREE_PROTO)
+
+    assert ctx.extract_column("Node", [b""], "child." * 99 + "value").tolist() == [0]
+
+    with pytest.raises(RuntimeError, match="is more than 100 fields deep"):
+        ctx.extract_column("Node", [b""], "child." * 100 + "value")
+
+
+def test_groups_are_rejected(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+
+    with pytest.raises(RuntimeError, match="is a group"):
+        ctx.extract_column("legacy.Crate", [], "lid.width")
+
+
+def test_unknown_message_type(metrics_ctx):
+    with pytest.raises(RuntimeError, match='Could not find message type "metrics.Missing"'):
+        metrics_ctx.extract_column("metrics.Missing", [], "status")
+
+
+def test_invalid_payload(metrics_ctx, requests):
+    with pytest.raises(RuntimeError, match=r"^Payload 1: .*not valid protobuf wire format"):
+        extract(metrics_ctx, [requests[0], b"\x0a\x05"], "status")
@@ -97,3 +97,43 @@ def test_concurrent_round_trip():
         results = list(pool.map(work, range(1000)))
 
     assert results == [f"dino-{i}" for i in range(1000)]
+
+
+def test_python_code_run_by_from_dict_can_add_protos():
+    """from_dict fills the message outside the lock that add_proto waits for."""
+    ctx = Context()
+    ctx.add_proto("animal.proto", ANIMAL_PROTO)
+
+    class Diet(int):
+        def __str__(self):
+            ctx.add_proto("late.proto", _generate_proto(0))
+            return "diet"
+
+    # the error message for a value out of range calls __str__
+    with pytest.raises(RuntimeError, match="diet is out of range"):
+        ctx.from_dict("Animal", {"diet": Diet(1 << 40)})
+
+    assert ctx.message_type_from_index("late.proto", [0]) == "M0_0"
+
+
+def test_concurrent_writers_and_dict_readers():
+    """to_dict, from_dict and view while other threads add files."""
+    ctx = Context()
+    ctx.add_proto("base.proto", ANIMAL_PROTO)
+    payload = ctx.from_json("Animal", json.dumps({"name": "T-Rex"}))
+
+    def task(i):
+        if i % 4 == 0:
+            ctx.add_proto(f"generated{i}.proto", _generate_proto(i))
+            return ctx.message_type_from_index(f"generated{i}.proto", [0])
+        if i % 4 == 1:
+            return ctx.to_dict("Animal", payload)["name"]
+        if i % 4 == 2:
+            return ctx.to_dict("Animal", ctx.from_dict("Animal", {"name": "T-Rex"}))["name"]
+        return ctx.view("Animal", payload)["name"]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(task, range(800)))
+
+    expected = [f"M{i}_0" if i % 4 == 0 else "T-Rex" for i in range(800)]
+    assert results == expected
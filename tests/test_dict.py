@@ -0,0 +1,262 @@
+import json
+
+import pytest
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_TRAINER_PROTO = """
+    syntax = "proto3";
+    package zoo;
+    enum Diet {
+        DIET_UNKNOWN = 0;
+        DIET_HERBIVORE = 1;
+        DIET_CARNIVORE = 2;
+    }
+    message Trainer {
+        string name = 1;
+        uint32 years = 2;
+    }
+    message Animal {
+        int64 animal_id = 1;
+        string name = 2;
+        Diet diet = 3;
+        repeated string tags = 4;
+        Trainer trainer = 5;
+        map<int32, string> feedings = 6;
+        bytes photo = 7;
+        double weight = 8;
+        bool tame = 9;
+        repeated Trainer keepers = 10;
+        optional string note = 11;
+        oneof home {
+            string enclosure = 12;
+            int32 pool = 13;
+        }
+    }
+    """
+
+_LEGACY_PROTO = """
+    syntax = "proto2";
+    package legacy;
+    enum Size {
+        SMALL = 1;
+        LARGE = 2;
+    }
+    message Crate {
+        required int32 number = 1;
+        optional Size size = 2;
+    }
+    """
+
+
+@pytest.fixture
+def zoo_ctx(ctx):
+    ctx.add_proto("zoo.proto", _TRAINER_PROTO)
+    return ctx
+
+
+_ANIMAL = {
+    "animalId": "9007199254740993",
+    "name": "Rex",
+    "diet": "DIET_CARNIVORE",
+    "tags": ["big", "loud"],
+    "trainer": {"name": "Ada", "years": 3},
+    "feedings": {"7": "meat", "19": "more meat"},
+    "photo": "AAH/",
+    "weight": 81.5,
+    "tame": True,
+    "keepers": [{"name": "Bo"}, {"name": "Cy", "years": 1}],
+    "enclosure": "north",
+}
+
+
+# --- to_dict ---
+
+
+def test_to_dict_matches_to_json(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps(_ANIMAL))
+
+    actual = zoo_ctx.to_dict("zoo.Animal", data)
+    expected = json.loads(zoo_ctx.to_json("zoo.Animal", data))
+
+    assert actual.keys() == expected.keys()
+    assert actual["name"] == "Rex"
+    assert actual["diet"] == "DIET_CARNIVORE"
+    assert actual["tags"] == ["big", "loud"]
+    assert actual["trainer"] == {"name": "Ada", "years": 3}
+    assert actual["keepers"] == [{"name": "Bo"}, {"name": "Cy", "years": 1}]
+    assert actual["weight"] == 81.5
+    assert actual["tame"] is True
+    assert actual["enclosure"] == "north"
+
+
+def test_to_dict_gives_int64_as_int(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps(_ANIMAL))
+
+    assert zoo_ctx.to_dict("zoo.Animal", data)["animalId"] == 9007199254740993
+
+
+def test_to_dict_gives_bytes_as_bytes(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps(_ANIMAL))
+
+    assert zoo_ctx.to_dict("zoo.Animal", data)["photo"] == b"\x00\x01\xff"
+
+
+def test_to_dict_keeps_map_key_types(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps(_ANIMAL))
+
+    assert zoo_ctx.to_dict("zoo.Animal", data)["feedings"] == {7: "meat", 19: "more meat"}
+
+
+def test_to_dict_omits_defaults_by_default(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps({"name": "Rex"}))
+
+    assert zoo_ctx.to_dict("zoo.Animal", data) == {"name": "Rex"}
+
+
+def test_to_dict_include_defaults(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps({"name": "Rex"}))
+
+    actual = zoo_ctx.to_dict("zoo.Animal", data, include_defaults=True)
+    expected = json.loads(zoo_ctx.to_json("zoo.Animal", data, include_defaults=True))
+
+    assert list(actual) == list(expected)
+    assert actual["animalId"] == 0
+    assert actual["diet"] == "DIET_UNKNOWN"
+    assert actual["tags"] == []
+    assert actual["feedings"] == {}
+    assert actual["photo"] == b""
+    assert "note" not in actual
+    assert "trainer" not in actual
+
+
+def test_to_dict_proto_field_names(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps({"animalId": "1"}))
+
+    assert zoo_ctx.to_dict("zoo.Animal", data, proto_field_names=True) == {"animal_id": 1}
+
+
+def test_to_dict_enums_as_ints(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps({"diet": "DIET_HERBIVORE"}))
+
+    assert zoo_ctx.to_dict("zoo.Animal", data, enums_as_ints=True) == {"diet": 1}
+
+
+def test_to_dict_unknown_enum_number_is_an_int(zoo_ctx):
+    # field 3, varint 5
+    assert zoo_ctx.to_dict("zoo.Animal", b"\x18\x05") == {"diet": 5}
+
+
+def test_to_dict_unknown_type(zoo_ctx):
+    with pytest.raises(RuntimeError, match="zoo.Missing"):
+        zoo_ctx.to_dict("zoo.Missing", b"")
+
+
+def test_to_dict_invalid_payload(zoo_ctx):
+    with pytest.raises(RuntimeError):
+        zoo_ctx.to_dict("zoo.Animal", b"\xff")
+
+
+# --- from_dict ---
+
+
+def test_from_dict_round_trip(zoo_ctx):
+    data = zoo_ctx.from_json("zoo.Animal", json.dumps(_ANIMAL))
+    obj = zoo_ctx.to_dict("zoo.Animal", data)
+
+    assert zoo_ctx.from_dict("zoo.Animal", obj) == data
+
+
+def test_from_dict_matches_from_json(zoo_ctx):
+    obj = {
+        "animal_id": 5,
+        "diet": 2,
+        "photo": bytearray(b"\x01\x02"),
+        "tags": ("a", "b"),
+        "feedings": {3: "hay"},
+        "weight": 12,
+        "pool": 4,
+    }
+    expected = zoo_ctx.from_json(
+        "zoo.Animal",
+        json.dumps(
+            {
+                "animalId": "5",
+                "diet": "DIET_CARNIVORE",
+                "photo": "AQI=",
+                "tags": ["a", "b"],
+                "feedings": {"3": "hay"},
+                "weight": 12.0,
+                "pool": 4,
+            }
+        ),
+    )
+
+    assert zoo_ctx.from_dict("zoo.Animal", obj) == expected
+
+
+def test_from_dict_none_leaves_the_field_unset(zoo_ctx):
+    assert zoo_ctx.from_dict("zoo.Animal", {"name": None, "trainer": None}) == b""
+
+
+def test_from_dict_unknown_field(zoo_ctx):
+    with pytest.raises(RuntimeError, match='no field named "colour"'):
+        zoo_ctx.from_dict("zoo.Animal", {"colour": "red"})
+
+
+def test_from_dict_ignore_unknown_fields(zoo_ctx):
+    actual = zoo_ctx.from_dict(
+        "zoo.Animal", {"colour": "red", "name": "Rex"}, ignore_unknown_fields=True
+    )
+
+    assert zoo_ctx.to_dict("zoo.Animal", actual) == {"name": "Rex"}
+
+
+@pytest.mark.parametrize(
+    ("obj", "message"),
+    [
+        ({"name": 1}, 'field "name": expected str, got int'),
+        ({"animalId": "1"}, 'field "animalId": expected int, got str'),
+        ({"tame": 1}, 'field "tame": expected bool, got int'),
+        ({"weight": "1.5"}, 'field "weight": expected float, got str'),
+        ({"photo": "abc"}, 'field "photo": expected bytes, got str'),
+        ({"tags": "abc"}, 'field "tags": expected list, got str'),
+        ({"trainer": []}, 'field "trainer": expected dict, got list'),
+        ({"trainer": {"years": -1}}, 'field "trainer.years": -1 is out of range'),
+        ({"keepers": [{"name": 3}]}, 'field "keepers.name": expected str, got int'),
+        ({"feedings": {"3": "hay"}}, 'field "feedings": expected int, got str'),
+        ({"diet": "DIET_OMNIVORE"}, '"DIET_OMNIVORE" is not a value of enum "zoo.Diet"'),
+        ({"animalId": 1 << 63}, "is out of range"),
+    ],
+)
+def test_from_dict_type_errors(zoo_ctx, obj, message):
+    with pytest.raises(RuntimeError, match=message) as info:
+        zoo_ctx.from_dict("zoo.Animal", obj)
+
+    assert str(info.value).startswith('Could not convert dict to message type "zoo.Animal"')
+
+
+def test_from_dict_rejects_bool_for_int(zoo_ctx):
+    with pytest.raises(RuntimeError, match="expected int, got bool"):
+        zoo_ctx.from_dict("zoo.Animal", {"animalId": True})
+
+
+def test_from_dict_expects_a_dict(zoo_ctx):
+    with pytest.raises(RuntimeError, match="expected dict, got list"):
+        zoo_ctx.from_dict("zoo.Animal", [])
+
+
+def test_from_dict_missing_required_field(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+
+    with pytest.raises(RuntimeError, match="number"):
+        ctx.from_dict("legacy.Crate", {"size": "SMALL"})
+
+
+def test_from_dict_closed_enum_rejects_unknown_numbers(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+
+    with pytest.raises(RuntimeError, match='3 is not a value of enum "legacy.Size"'):
+        ctx.from_dict("legacy.Crate", {"number": 1, "size": 3})
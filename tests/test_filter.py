@@ -0,0 +1,300 @@
+import json
+
+import pytest
+
+from protosaurus import MessageFilter
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_JOB_PROTO = """
+    syntax = "proto3";
+    package jobs;
+    enum Status {
+        STATUS_UNKNOWN = 0;
+        RUNNING = 1;
+        FAILED = 2;
+    }
+    message Owner {
+        string name = 1;
+        uint32 level = 2;
+    }
+    message Job {
+        string region = 1;
+        Status status = 2;
+        int64 retries = 3;
+        sint32 delta = 4;
+        double cost = 5;
+        float share = 6;
+        bool urgent = 7;
+        fixed64 hash = 8;
+        repeated string tags = 9;
+        repeated int32 codes = 10;
+        Owner owner = 11;
+        repeated Owner watchers = 12;
+        bytes blob = 13;
+        sfixed32 offset = 14;
+        optional string note = 15;
+    }
+    """
+
+_JOBS = [
+    {"region": "eu", "status": "FAILED", "retries": "3", "delta": -2, "cost": 1.5},
+    {"region": "us", "status": "RUNNING", "retries": "0", "share": 0.25, "urgent": True},
+    {"region": "ap", "status": "FAILED", "tags": ["gpu", "spot"], "codes": [1, 5, 9]},
+    {"owner": {"name": "Ada", "level": 3}, "hash": "18446744073709551615", "blob": "AP8="},
+    {"watchers": [{"name": "Bo"}, {"name": "Cy", "level": 2}], "offset": -7, "note": ""},
+]
+
+
+@pytest.fixture
+def job_ctx(ctx):
+    ctx.add_proto("jobs.proto", _JOB_PROTO)
+    return ctx
+
+
+@pytest.fixture
+def jobs(job_ctx):
+    return [job_ctx.from_json("jobs.Job", json.dumps(job)) for job in _JOBS]
+
+
+def select(ctx, payloads, expression):
+    return ctx.compile_filter("jobs.Job", expression).filter_many(payloads)
+
+
+# --- comparisons ---
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ('region == "eu"', [0]),
+        ("region == 'us'", [1]),
+        ('region != "eu"', [1, 2, 3, 4]),
+        ('region < "b"', [2, 3, 4]),
+        ('region in ("eu", "us")', [0, 1]),
+        ('region not in ("eu", "us")', [2, 3, 4]),
+        ('status == "FAILED"', [0, 2]),
+        ("status == 1", [1]),
+        ('status == "STATUS_UNKNOWN"', [3, 4]),
+        ("retries >= 3", [0]),
+        ("retries < 1", [1, 2, 3, 4]),
+        ("delta == -2", [0]),
+        ("delta <= -1", [0]),
+        ("cost > 1", [0]),
+        ("cost == 1.5", [0]),
+        ("share == 0.25", [1]),
+        ("urgent == true", [1]),
+        ("urgent != true", [0, 2, 3, 4]),
+        ("hash == 18446744073709551615", [3]),
+        ("offset == -7", [4]),
+    ],
+)
+def test_scalar_comparisons(job_ctx, jobs, expression, expected):
+    assert select(job_ctx, jobs, expression) == expected
+
+
+def test_bytes_compare_with_the_utf8_of_a_string(job_ctx):
+    data = job_ctx.from_json("jobs.Job", json.dumps({"blob": "aGk="}))
+
+    assert select(job_ctx, [data], 'blob == "hi"') == [0]
+
+
+def test_string_escapes(job_ctx):
+    data = job_ctx.from_json("jobs.Job", json.dumps({"region": "a\"b'\\\n"}))
+
+    assert select(job_ctx, [data], "region == 'a\"b\\'\\\\\\n'") == [0]
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ('tags == "spot"', [2]),
+        ('tags != "spot"', [0, 1, 3, 4]),
+        ("codes > 8", [2]),
+        ("codes in (4, 5)", [2]),
+        ("codes not in (1, 5, 9)", [0, 1, 3, 4]),
+    ],
+)
+def test_repeated_fields_match_if_any_value_does(job_ctx, jobs, expression, expected):
+    assert select(job_ctx, jobs, expression) == expected
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ('owner.name == "Ada"', [3]),
+        ("owner.level == 0", [0, 1, 2, 4]),
+        ('watchers.name == "Cy"', [4]),
+        ("watchers.level == 0", [4]),
+        ("watchers.level == 2", [4]),
+    ],
+)
+def test_paths_into_submessages(job_ctx, jobs, expression, expected):
+    assert select(job_ctx, jobs, expression) == expected
+
+
+def test_unset_fields_compare_as_their_default(job_ctx, jobs):
+    assert select(job_ctx, jobs, 'note == ""') == [0, 1, 2, 3, 4]
+
+
+def test_proto2_defaults(ctx):
+    ctx.add_proto(
+        "legacy.proto",
+        """
+        syntax = "proto2";
+        message Crate {
+            optional int32 size = 1 [default = 4];
+            optional string label = 2 [default = "box"];
+        }
+        """,
+    )
+
+    assert ctx.compile_filter("Crate", 'size == 4 and label == "box"').matches(b"") is True
+
+
+def test_the_last_value_of_a_singular_field_wins(job_ctx):
+    # region "eu", then region "us"
+    data = b"\x0a\x02eu\x0a\x02us"
+
+    assert select(job_ctx, [data], 'region == "us"') == [0]
+
+
+def test_occurrences_of_a_submessage_merge(job_ctx):
+    # owner with name "A", then owner with level 2
+    data = b"\x5a\x03\x0a\x01A" + b"\x5a\x02\x10\x02"
+
+    assert select(job_ctx, [data], 'owner.name == "A" and owner.level == 2') == [0]
+
+
+def test_unpacked_repeated_scalars(job_ctx):
+    # codes 1 and 5, each with its own tag
+    data = b"\x50\x01\x50\x05"
+
+    assert select(job_ctx, [data], "codes == 5") == [0]
+
+
+# --- combining comparisons ---
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ('status == "FAILED" and region in ("eu", "us")', [0]),
+        ('region == "eu" or region == "us"', [0, 1]),
+        ('not region == "eu"', [1, 2, 3, 4]),
+        ('not not region == "eu"', [0]),
+        ('region == "eu" or region == "ap" and status == "RUNNING"', [0]),
+        ('(region == "eu" or region == "ap") and status == "FAILED"', [0, 2]),
+        ('not (region == "eu" or urgent == true)', [2, 3, 4]),
+    ],
+)
+def test_and_or_not(job_ctx, jobs, expression, expected):
+    assert select(job_ctx, jobs, expression) == expected
+
+
+# --- errors ---
+
+
+@pytest.mark.parametrize(
+    ("expression", "message"),
+    [
+        ("", "expected a field path, found the end of the expression at position 0"),
+        ('region == "eu" and', "expected a field path, found the end of the expression"),
+        ('region "eu"', 'expected a comparison operator, found ""eu"" at position 7'),
+        ("region == eu", 'expected a literal, found "eu" at position 10'),
+        ('region == "eu" region', 'expected "and", "or" or the end of the expression'),
+        ('region == "eu', "unterminated string at position 10"),
+        ('region == "\\q"', 'unknown escape sequence "\\q"'),
+        ("region in ()", "expected a literal"),
+        ("region in ('a'", 'expected ")"'),
+        ("region not 'a'", 'expected "in"'),
+        ("region == 1 # 2", 'unexpected character "#" at position 12'),
+        ('colour == "red"', 'message type "jobs.Job" has no field named "colour" at position 0'),
+        ("owner.age == 1", 'message type "jobs.Owner" has no field named "age"'),
+        ("region.x == 1", 'field "jobs.Job.region" is not a message'),
+        ("owner == 1", 'field "jobs.Job.owner" is a message, compare one of its fields instead'),
+        ("region == 1", 'cannot compare field "jobs.Job.region" of type string with 1'),
+        ('retries == "3"', 'cannot compare field "jobs.Job.retries" of type int64 with "3"'),
+        ("retries == 1.5", "of type int64 with 1.5"),
+        ("urgent == 1", "of type bool with 1"),
+        ("cost == true", "of type double with true"),
+        ('status == "DONE"', '"DONE" is not a value of enum "jobs.Status"'),
+        ("delta == 2147483648", "2147483648 is out of range"),
+        ("owner.level == -1", "-1 is out of range"),
+        ("retries == 99999999999999999999", "is out of range"),
+        ("retries == 1x", 'invalid number "1x"'),
+    ],
+)
+def test_compile_errors(job_ctx, expression, message):
+    with pytest.raises(RuntimeError, match="Could not compile filter for message type") as info:
+        job_ctx.compile_filter("jobs.Job", expression)
+
+    assert message in str(info.value)
+
+
+def test_unknown_message_type(job_ctx):
+    with pytest.raises(RuntimeError, match='Could not find message type "jobs.Missing"'):
+        job_ctx.compile_filter("jobs.Missing", 'region == "eu"')
+
+
+def test_invalid_payload(job_ctx, jobs):
+    message_filter = job_ctx.compile_filter("jobs.Job", 'region == "eu"')
+
+    with pytest.raises(RuntimeError, match="not valid protobuf wire format"):
+        message_filter.matches(b"\x0a\x05eu")
+
+    with pytest.raises(RuntimeError, match=r"^Payload 2: "):
+        message_filter.filter_many([*jobs[:2], b"\xff"])
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_groups_nested_too_deeply(job_ctx, jobs, workers):
+    # groups of field 3 inside each other, never closed
+    data = b"\x1b" * 2_000_000
+    message_filter = job_ctx.compile_filter("jobs.Job", 'region == "eu"')
+
+    with pytest.raises(RuntimeError, match="not valid protobuf wire format"):
+        message_filter.matches(data)
+
+    with pytest.raises(RuntimeError, match=r"^Payload 500: "):
+        message_filter.filter_many([*jobs * 100, data], workers=workers)
+
+
+# --- MessageFilter ---
+
+
+def test_matches(job_ctx, jobs):
+    message_filter = job_ctx.compile_filter("jobs.Job", 'region == "eu"')
+
+    assert isinstance(message_filter, MessageFilter)
+    assert message_filter.message_type == "jobs.Job"
+    assert message_filter.expression == 'region == "eu"'
+    assert [message_filter.matches(job) for job in jobs] == [True, False, False, False, False]
+
+
+@pytest.mark.parametrize("workers", [1, 4, 0])
+def test_filter_many_workers(job_ctx, jobs, workers):
+    message_filter = job_ctx.compile_filter("jobs.Job", 'status == "FAILED"')
+
+    assert message_filter.filter_many(jobs * 100, workers=workers) == [
+        i for i in range(500) if i % 5 in (0, 2)
+    ]
+
+
+def test_filter_many_reads_buffers_in_place(job_ctx, jobs):
+    message_filter = job_ctx.compile_filter("jobs.Job", 'region == "us"')
+
+    assert message_filter.filter_many([memoryview(job) for job in jobs]) == [1]
+
+
+def test_filter_outlives_its_context(jobs):
+    from protosaurus import Context
+
+    ctx = Context()
+    ctx.add_proto("jobs.proto", _JOB_PROTO)
+    message_filter = ctx.compile_filter("jobs.Job", 'region == "eu"')
+    del ctx
+
+    assert message_filter.filter_many(jobs) == [0]
@@ -154,6 +154,126 @@ def test_unquote_int64_keeps_string_when_not_representable(order_ctx):
     assert actual['orderId'] == '9007199254740993'
 
 
+# json_dumps_format
+
+_READING_PROTO = """
+    syntax = "proto3";
+    message Reading {
+        string sensor = 1;
+        double value = 2;
+        repeated float samples = 3;
+        map<string, Reading> parts = 4;
+        int64 count = 5;
+    }
+    """
+
+
+@pytest.fixture
+def reading_ctx(ctx):
+    ctx.add_proto('reading', _READING_PROTO)
+    return ctx
+
+
+def json_dumps(ctx, data, **options):
+    """What json.dumps makes of the plain to_json output."""
+    pretty = options.get('pretty', False)
+    return json.dumps(
+        json.loads(ctx.to_json('Reading', data, **options)), indent=2 if pretty else None
+    )
+
+
+@pytest.mark.parametrize('pretty', [False, True])
+@pytest.mark.parametrize(
+    'value',
+    [
+        0.1,
+        -0.0,
+        1e16,
+        1e-5,
+        123456789.125,
+        2.0**-1074,
+        2.0**1023,
+        1.7976931348623157e308,
+        'Infinity',
+    ],
+)
+def test_json_dumps_format_matches_json_dumps(reading_ctx, value, pretty):
+    reading = {
+        'sensor': 'Temperatur — Küche 🌡',
+        'value': value,
+        'samples': [0.1, 3.4028234663852886e38],
+        'parts': {'a"b\\c\n': {'sensor': '\x00\x7f'}, 'empty': {}},
+        'count': '-9007199254740993',
+    }
+    data = reading_ctx.from_json('Reading', json.dumps(reading))
+
+    actual = reading_ctx.to_json('Reading', data, pretty=pretty, json_dumps_format=True)
+
+    assert actual == json_dumps(reading_ctx, data, pretty=pretty)
+
+
+def test_json_dumps_format_combines_with_options(reading_ctx):
+    data = reading_ctx.from_json('Reading', json.dumps({'count': '7'}))
+    options = {'include_defaults': True, 'unquote_int64': True, 'pretty': True}
+
+    actual = reading_ctx.to_json('Reading', data, json_dumps_format=True, **options)
+
+    assert actual == json_dumps(reading_ctx, data, **options)
+
+
+def test_prefixes_come_before_the_fields(reading_ctx):
+    data = reading_ctx.from_json('Reading', json.dumps({'sensor': 'ключ'}))
+
+    actual = reading_ctx.to_json_many(
+        'Reading',
+        [data, b''],
+        json_dumps_format=True,
+        prefixes=['"@offset":1,"@key":"\\u00e4"', '"@offset":2'],
+    )
+
+    assert actual == [
+        json.dumps({'@offset': 1, '@key': 'ä', 'sensor': 'ключ'}),
+        json.dumps({'@offset': 2}),
+    ]
+
+
+def test_prefixes_are_indented_with_pretty(reading_ctx):
+    data = reading_ctx.from_json('Reading', json.dumps({'value': 1.5}))
+
+    [actual] = reading_ctx.to_json_many(
+        'Reading', [data], pretty=True, json_dumps_format=True, prefixes=['"@offset":1']
+    )
+
+    assert actual == json.dumps({'@offset': 1, 'value': 1.5}, indent=2)
+
+
+def test_prefixes_are_read_as_json_loads_reads_them(reading_ctx):
+    prefix = '"big": 1e999, "zero": -0, "float": 1E5, "list": [ ], "null": null'
+
+    [actual] = reading_ctx.to_json_many('Reading', [b''], json_dumps_format=True, prefixes=[prefix])
+
+    assert actual == json.dumps(json.loads('{' + prefix + '}'))
+
+
+def test_prefixes_need_json_dumps_format(reading_ctx):
+    with pytest.raises(ValueError, match='json_dumps_format'):
+        reading_ctx.to_json_many('Reading', [b''], prefixes=['"@offset":1'])
+
+
+def test_prefixes_need_one_item_per_payload(reading_ctx):
+    with pytest.raises(ValueError, match='one item per payload'):
+        reading_ctx.to_json_many(
+            'Reading', [b'', b''], json_dumps_format=True, prefixes=['"@offset":1']
+        )
+
+
+def test_invalid_prefix_names_its_payload(reading_ctx):
+    with pytest.raises(RuntimeError, match='Payload 1: Invalid JSON string'):
+        reading_ctx.to_json_many(
+            'Reading', [b'', b''], json_dumps_format=True, prefixes=['"a":1', '"a\\x":1']
+        )
+
+
 # combinations and argument handling
 
 
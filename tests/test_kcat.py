@@ -0,0 +1,207 @@
+import io
+import os
+import struct
+
+import pytest
+
+from protosaurus import read_kcat_records
+from protosaurus.kcat import iter_record_batches, iter_records
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+def _record(offset, key, payload, schema_id=7, index=b"\x00", magic=0):
+    """Build one record the way kcat -f "%o\\n%k\\n%R%s" writes it."""
+    value = struct.pack(">bI", magic, schema_id) + index + payload
+    return f"{offset}\n{key}\n".encode() + struct.pack(">I", len(value)) + value
+
+
+def _records(count):
+    return b"".join(_record(i, f"key-{i}", bytes([i]) * i) for i in range(count))
+
+
+# --- read_kcat_records ---
+
+
+def test_reads_a_record():
+    records, offset = read_kcat_records(_record(42, "user-1", b"\x08\x07", schema_id=9))
+
+    assert len(records) == 1
+    assert offset == len(_record(42, "user-1", b"\x08\x07"))
+
+    record_offset, key, schema_id, message_index, payload = records[0]
+    assert (record_offset, key, schema_id, message_index) == (42, "user-1", 9, [0])
+    assert bytes(payload) == b"\x08\x07"
+
+
+def test_payload_is_a_view_of_the_data():
+    data = bytearray(_record(0, "k", b"abc"))
+
+    records, _ = read_kcat_records(data)
+    payload = records[0][4]
+    data[-1:] = b"z"
+
+    assert isinstance(payload, memoryview)
+    assert bytes(payload) == b"abz"
+
+
+def test_reads_the_message_index_array():
+    # size 2 (zigzag 0x04), then 1 (0x02) and 3 (0x06)
+    records, _ = read_kcat_records(_record(0, "k", b"", index=b"\x04\x02\x06"))
+
+    assert records[0][3] == [1, 3]
+
+
+def test_reads_several_records():
+    records, offset = read_kcat_records(_records(5))
+
+    assert [record[0] for record in records] == [0, 1, 2, 3, 4]
+    assert [bytes(record[4]) for record in records] == [bytes([i]) * i for i in range(5)]
+    assert offset == len(_records(5))
+
+
+def test_key_may_be_empty_and_non_ascii():
+    records, _ = read_kcat_records(_record(0, "", b"") + _record(1, "Ä-ß", b""))
+
+    assert [record[1] for record in records] == ["", "Ä-ß"]
+
+
+def test_stops_before_an_incomplete_record():
+    data = _records(3)
+
+    for cut in range(len(data)):
+        records, offset = read_kcat_records(data[:cut])
+        complete, _ = read_kcat_records(data[:offset])
+
+        assert len(records) == len(complete)
+        assert data[offset:].startswith(data[offset:cut])
+
+
+def test_starts_at_the_given_offset():
+    first = _record(0, "a", b"")
+
+    records, _ = read_kcat_records(first + _record(1, "b", b""), len(first))
+
+    assert [record[1] for record in records] == ["b"]
+
+
+def test_incorrect_magic_byte():
+    with pytest.raises(RuntimeError, match=r"Incorrect magic byte \(1\)"):
+        read_kcat_records(_record(0, "k", b"", magic=1))
+
+
+def test_value_too_short_for_the_header():
+    data = b"0\nk\n" + struct.pack(">I", 3) + b"\x00\x00\x00"
+
+    with pytest.raises(RuntimeError, match="too short"):
+        read_kcat_records(data)
+
+
+def test_invalid_offset():
+    with pytest.raises(RuntimeError, match="Invalid record offset 'x1'"):
+        read_kcat_records(_record("x1", "k", b""))
+
+
+def test_invalid_message_index_length():
+    with pytest.raises(RuntimeError, match="Invalid Protobuf message_index array length"):
+        read_kcat_records(_record(0, "k", b"", index=b"\x01"))
+
+
+def test_value_ends_inside_the_message_index():
+    with pytest.raises(EOFError):
+        read_kcat_records(_record(0, "k", b"", index=b"\x06\x00"))
+
+
+def test_key_that_is_not_utf8():
+    data = b"0\n\xff\n" + struct.pack(">I", 6) + struct.pack(">bI", 0, 7) + b"\x00"
+
+    with pytest.raises(UnicodeDecodeError):
+        read_kcat_records(data)
+
+
+def test_negative_offset():
+    with pytest.raises(IndexError):
+        read_kcat_records(b"", -1)
+
+
+# --- iter_records ---
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_iter_records_across_chunks(chunk_size):
+    records = list(iter_records(io.BytesIO(_records(20)), chunk_size=chunk_size))
+
+    assert [record[0] for record in records] == list(range(20))
+    assert [record[1] for record in records] == [f"key-{i}" for i in range(20)]
+    assert [bytes(record[4]) for record in records] == [bytes([i]) * i for i in range(20)]
+
+
+def test_iter_records_record_larger_than_a_chunk():
+    payload = bytes(range(256)) * 100
+
+    records = list(iter_records(io.BytesIO(_record(5, "big", payload)), chunk_size=16))
+
+    assert bytes(records[0][4]) == payload
+
+
+def test_iter_records_reads_the_rest_of_a_large_record_before_parsing_it(monkeypatch):
+    import protosaurus.kcat
+
+    class Pipe(io.BytesIO):
+        # read1 of a pipe returns at most what is buffered, far less than a chunk
+        def read1(self, size=-1):
+            return self.read(min(size, 1 << 16))
+
+    payload = bytes(range(256)) * 4096
+    stream = Pipe(_record(5, "big", payload))
+    calls = []
+
+    def read_kcat_records_counted(data):
+        calls.append(len(data))
+        return read_kcat_records(data)
+
+    monkeypatch.setattr(protosaurus.kcat, "read_kcat_records", read_kcat_records_counted)
+
+    records = list(iter_records(stream))
+
+    assert bytes(records[0][4]) == payload
+    assert len(calls) == 2
+
+
+def test_iter_records_does_not_wait_for_a_full_chunk():
+    read, write = os.pipe()
+
+    with open(read, "rb") as reader, open(write, "wb") as writer:
+        writer.write(_record(3, "live", b"x"))
+        writer.flush()
+
+        records = iter_records(reader)
+
+        assert next(records)[:2] == (3, "live")
+
+
+def test_iter_records_empty_stream():
+    assert list(iter_records(io.BytesIO(b""))) == []
+
+
+def test_iter_records_stream_ends_inside_a_record():
+    data = _records(3)
+
+    with pytest.raises(EOFError, match="Stream ends inside a record"):
+        list(iter_records(io.BytesIO(data[:-1])))
+
+
+def test_iter_record_batches_yield_one_list_per_chunk():
+    data = _records(20)
+
+    batches = list(iter_record_batches(io.BytesIO(data), chunk_size=len(data) // 2))
+
+    assert len(batches) > 1
+    assert all(batches)
+    assert [record[0] for batch in batches for record in batch] == list(range(20))
+
+
+def test_iter_records_rejects_a_non_positive_chunk_size():
+    with pytest.raises(ValueError):
+        list(iter_records(io.BytesIO(b""), chunk_size=0))
@@ -0,0 +1,95 @@
+import gc
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from protosaurus import Context, MessageHandle
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_ANIMAL_PROTO = """
+    syntax = "proto3";
+    package zoo;
+    message Animal {
+        string name = 1;
+        int64 weight = 2;
+    }
+    """
+
+
+@pytest.fixture
+def zoo(ctx):
+    ctx.add_proto("zoo", _ANIMAL_PROTO)
+    return ctx
+
+
+def test_message_handle_knows_its_type(zoo):
+    handle = zoo.message_handle("zoo.Animal")
+
+    assert isinstance(handle, MessageHandle)
+    assert handle.message_type == "zoo.Animal"
+
+
+def test_message_handle_unknown_type(zoo):
+    with pytest.raises(RuntimeError, match='"Nope". Known types: zoo.Animal'):
+        zoo.message_handle("Nope")
+
+
+def test_message_handle_to_json_matches_context(zoo):
+    handle = zoo.message_handle("zoo.Animal")
+    payload = zoo.from_json("zoo.Animal", json.dumps({"name": "Rex", "weight": "7"}))
+
+    assert handle.to_json(payload) == zoo.to_json("zoo.Animal", payload)
+    assert handle.to_json(payload, unquote_int64=True) == '{"name":"Rex","weight":7}'
+
+
+def test_message_handle_from_json_matches_context(zoo):
+    handle = zoo.message_handle("zoo.Animal")
+    document = json.dumps({"name": "Rex", "nope": 1})
+
+    actual = handle.from_json(document, ignore_unknown_fields=True)
+
+    assert actual == zoo.from_json("zoo.Animal", document, ignore_unknown_fields=True)
+
+
+def test_message_handle_reports_errors_like_context(zoo):
+    handle = zoo.message_handle("zoo.Animal")
+
+    with pytest.raises(RuntimeError, match=r'^Could not parse 1 bytes as message type'):
+        handle.to_json(b"\xff")
+
+    with pytest.raises(RuntimeError, match=r'^Could not convert json to message type'):
+        handle.from_json("{not json")
+
+
+def test_message_handle_survives_add_proto(zoo):
+    handle = zoo.message_handle("zoo.Animal")
+    payload = handle.from_json(json.dumps({"name": "Rex"}))
+
+    zoo.add_proto("other", 'syntax = "proto3"; message Other { int32 v = 1; }')
+
+    assert json.loads(handle.to_json(payload)) == {"name": "Rex"}
+
+
+def test_message_handle_keeps_context_alive():
+    ctx = Context()
+    ctx.add_proto("zoo", _ANIMAL_PROTO)
+    handle = ctx.message_handle("zoo.Animal")
+
+    del ctx
+    gc.collect()
+
+    assert json.loads(handle.to_json(handle.from_json('{"name": "Rex"}'))) == {"name": "Rex"}
+
+
+def test_message_handle_shared_across_threads(zoo):
+    handle = zoo.message_handle("zoo.Animal")
+    payload = handle.from_json(json.dumps({"name": "Rex"}))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: handle.to_json(payload), range(1000)))
+
+    assert all(json.loads(result) == {"name": "Rex"} for result in results)
@@ -1,9 +1,12 @@
 import json
+import mmap
 from base64 import b64decode
 
 import pytest
 from deepdiff import DeepDiff
 
+from protosaurus import Context, parse_proto
+
 if __name__ == '__main__':
     pytest.main()
 
@@ -342,3 +345,231 @@ def test_package_namespace(ctx):
     actual_msg = ctx.from_json('mypackage.MyMessage', json.dumps({'name': 'foo', 'value': 42}))
 
     assert_msg_equals(actual_msg, 'CgNmb28QKg==')
+
+
+@pytest.fixture
+def my_message(ctx):
+    ctx.add_proto('test',
+        """
+        syntax = "proto3";
+        message MyMessage {
+            string name = 1;
+            int32 value = 2;
+        }
+        """)
+    return ctx
+
+
+@pytest.mark.parametrize('wrap', [bytearray, memoryview], ids=lambda w: w.__name__)
+def test_to_json_accepts_buffers(my_message, wrap):
+    actual_json = my_message.to_json('MyMessage', wrap(b64decode('CgNmb28QKg==')))
+
+    assert_json_equals(actual_json, {'name': 'foo', 'value': 42})
+
+
+def test_to_json_reads_a_memoryview_slice_in_place(my_message):
+    # a header in front of the message, as in the Confluent wire format
+    raw = b'\x00\x00\x00\x00\x01\x00' + b64decode('CgNmb28QKg==')
+
+    actual_json = my_message.to_json('MyMessage', memoryview(raw)[6:])
+
+    assert_json_equals(actual_json, {'name': 'foo', 'value': 42})
+
+
+def test_to_json_reads_an_mmap(my_message, tmp_path):
+    path = tmp_path / 'message.bin'
+    path.write_bytes(b64decode('CgNmb28QKg=='))
+
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        actual_json = my_message.to_json('MyMessage', data)
+
+    assert_json_equals(actual_json, {'name': 'foo', 'value': 42})
+
+
+def test_to_json_rejects_non_contiguous_buffers(my_message):
+    with pytest.raises(TypeError):
+        my_message.to_json('MyMessage', memoryview(b64decode('CgNmb28QKg=='))[::2])
+
+
+def test_to_json_rejects_str(my_message):
+    with pytest.raises(TypeError):
+        my_message.to_json('MyMessage', 'CgNmb28QKg==')
+
+
+def test_parse_proto_can_be_added_to_many_contexts():
+    descriptor = parse_proto('test', 'syntax = "proto3"; message MyMessage { int32 value = 1; }')
+
+    for ctx in (Context(), Context()):
+        ctx.add_file_descriptor(descriptor)
+
+        assert ctx.message_type_from_index('test', [0]) == 'MyMessage'
+        assert_json_equals(ctx.to_json('MyMessage', b'\x08\x2a'), {'value': 42})
+
+
+def test_parse_proto_does_not_resolve_imports():
+    descriptor = parse_proto('main', 'syntax = "proto3"; import "dep"; message M { D d = 1; }')
+    ctx = Context()
+
+    with pytest.raises(RuntimeError, match='Could not build "main"'):
+        ctx.add_file_descriptor(descriptor)
+
+    ctx.add_proto('dep', 'syntax = "proto3"; message D { int32 v = 1; }')
+    ctx.add_file_descriptor(descriptor)
+
+    assert ctx.message_type_from_index('main', [0]) == 'M'
+
+
+def test_parse_proto_reports_syntax_errors():
+    with pytest.raises(RuntimeError, match='Could not parse proto'):
+        parse_proto('test', 'message {')
+
+
+def test_add_file_descriptor_rejects_invalid_data(ctx):
+    with pytest.raises(RuntimeError, match='as a FileDescriptorProto'):
+        ctx.add_file_descriptor(b'\xff')
+
+
+_DIET_PROTO = 'syntax = "proto3"; enum Diet { carnivorous = 0; herbivorous = 1; }'
+_ANIMAL_PROTO = (
+    'syntax = "proto3"; import "diet.proto"; message Animal { string name = 1; Diet diet = 2; }'
+)
+
+
+def _zoo():
+    ctx = Context()
+    ctx.add_proto('diet.proto', _DIET_PROTO)
+    ctx.add_proto('animal.proto', _ANIMAL_PROTO)
+    return ctx
+
+
+def test_descriptor_set_round_trip():
+    data = _zoo().export_descriptor_set()
+
+    ctx = Context()
+    ctx.add_descriptor_set(data)
+
+    animal = ctx.to_json('Animal', b'\x0a\x03Rex\x10\x01')
+    assert_json_equals(animal, {'name': 'Rex', 'diet': 'herbivorous'})
+    assert ctx.export_descriptor_set() == data
+
+
+def test_descriptor_set_includes_files_added_as_descriptors():
+    ctx = Context()
+    ctx.add_file_descriptor(parse_proto('diet.proto', _DIET_PROTO))
+    ctx.add_file_descriptor(parse_proto('animal.proto', _ANIMAL_PROTO))
+
+    assert ctx.export_descriptor_set() == _zoo().export_descriptor_set()
+
+
+def test_descriptor_set_of_an_empty_context():
+    ctx = Context()
+    ctx.add_descriptor_set(ctx.export_descriptor_set())
+
+    assert ctx.export_descriptor_set() == b''
+
+
+def test_descriptor_set_files_already_added_are_skipped():
+    ctx = _zoo()
+    data = ctx.export_descriptor_set()
+
+    ctx.add_descriptor_set(bytearray(data))
+
+    assert ctx.export_descriptor_set() == data
+
+
+def test_descriptor_set_needs_imports_first():
+    # the set of one file lacks the file it imports
+    data = _zoo().export_descriptor_set()
+    diet_only = Context()
+    diet_only.add_proto('diet.proto', _DIET_PROTO)
+    animal_only = data[len(diet_only.export_descriptor_set()):]
+
+    with pytest.raises(RuntimeError, match='Could not build "animal.proto"'):
+        Context().add_descriptor_set(animal_only)
+
+
+def test_add_descriptor_set_rejects_invalid_data(ctx):
+    with pytest.raises(RuntimeError, match='as a FileDescriptorSet'):
+        ctx.add_descriptor_set(b'\xff')
+
+
+def _descriptor_set(*descriptors):
+    # a FileDescriptorSet is its repeated `file` field 1, length-delimited
+    data = bytearray()
+    for descriptor in descriptors:
+        data.append(0x0A)
+        size = len(descriptor)
+        while size >= 0x80:
+            data.append((size & 0x7F) | 0x80)
+            size >>= 7
+        data.append(size)
+        data += descriptor
+    return bytes(data)
+
+
+def test_descriptor_set_in_any_order():
+    animal = parse_proto('animal.proto', _ANIMAL_PROTO)
+    diet = parse_proto('diet.proto', _DIET_PROTO)
+
+    ctx = Context()
+    ctx.add_descriptor_set(_descriptor_set(animal, diet))
+
+    assert ctx.export_descriptor_set() == _zoo().export_descriptor_set()
+
+
+def test_add_protos_in_any_order():
+    ctx = Context()
+    ctx.add_protos({'animal.proto': _ANIMAL_PROTO, 'diet.proto': _DIET_PROTO})
+
+    assert ctx.export_descriptor_set() == _zoo().export_descriptor_set()
+
+
+@pytest.mark.parametrize('workers', [0, 1, 3])
+def test_add_protos_many_files(workers):
+    # a chain of imports, listed last file first
+    files = {}
+    for i in reversed(range(200)):
+        imports = f'import "f{i - 1}.proto";' if i else ''
+        files[f'f{i}.proto'] = f'syntax = "proto3"; {imports} message M{i} {{}}'
+
+    ctx = Context()
+    ctx.add_protos(files, workers=workers)
+
+    assert ctx.message_type_from_index('f199.proto', [0]) == 'M199'
+
+
+def test_add_protos_uses_files_added_before():
+    ctx = Context()
+    ctx.add_proto('diet.proto', _DIET_PROTO)
+    ctx.add_protos({'animal.proto': _ANIMAL_PROTO})
+
+    assert ctx.message_type_from_index('animal.proto', [0]) == 'Animal'
+
+
+def test_add_protos_reports_a_missing_import():
+    with pytest.raises(RuntimeError, match='Could not build "animal.proto"'):
+        Context().add_protos({'animal.proto': _ANIMAL_PROTO})
+
+
+def test_add_protos_reports_an_import_cycle():
+    files = {
+        'a.proto': 'syntax = "proto3"; import "b.proto";',
+        'b.proto': 'syntax = "proto3"; import "a.proto";',
+    }
+
+    with pytest.raises(RuntimeError, match='Import cycle: a.proto -> b.proto -> a.proto'):
+        Context().add_protos(files)
+
+
+def test_add_protos_adds_nothing_if_a_file_does_not_parse():
+    ctx = Context()
+
+    with pytest.raises(RuntimeError, match='Could not parse proto'):
+        ctx.add_protos({'diet.proto': _DIET_PROTO, 'broken.proto': 'message {'})
+
+    assert ctx.export_descriptor_set() == b''
+
+
+def test_add_protos_requires_strings():
+    with pytest.raises(TypeError):
+        Context().add_protos({'diet.proto': b'syntax = "proto3";'})
@@ -0,0 +1,246 @@
+import json
+
+import pytest
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_ZOO_PROTO = """
+    syntax = "proto3";
+    package zoo;
+    message Trainer {
+        string name = 1;
+        uint32 years = 2;
+    }
+    message Animal {
+        string name = 1;
+        int64 weight = 2;
+        repeated string tags = 3;
+        Trainer trainer = 4;
+        repeated Trainer keepers = 5;
+        repeated int32 feedings = 6;
+        map<string, Trainer> backups = 7;
+    }
+    """
+
+_LEGACY_PROTO = """
+    syntax = "proto2";
+    package legacy;
+    message Crate {
+        required int32 number = 1;
+        optional string label = 2;
+        optional group Lid = 3 {
+            optional int32 size = 4;
+        }
+        optional int32 weight = 5;
+    }
+    """
+
+_ANIMAL = {
+    "name": "Rex",
+    "weight": "81",
+    "tags": ["big", "loud"],
+    "trainer": {"name": "Ada", "years": 3},
+    "keepers": [{"name": "Bo", "years": 1}, {"name": "Cy", "years": 2}],
+    "feedings": [7, 19],
+    "backups": {"first": {"name": "Di", "years": 4}},
+}
+
+
+@pytest.fixture
+def zoo_ctx(ctx):
+    ctx.add_proto("zoo.proto", _ZOO_PROTO)
+    return ctx
+
+
+@pytest.fixture
+def animal(zoo_ctx):
+    return zoo_ctx.from_json("zoo.Animal", json.dumps(_ANIMAL))
+
+
+def decode(ctx, data, fields, **options):
+    return json.loads(ctx.to_json("zoo.Animal", data, fields=fields, **options))
+
+
+# --- selecting fields ---
+
+
+def test_top_level_fields(zoo_ctx, animal):
+    actual = decode(zoo_ctx, animal, ["name", "tags", "feedings"])
+
+    assert actual == {"name": "Rex", "tags": ["big", "loud"], "feedings": [7, 19]}
+
+
+def test_field_of_a_submessage(zoo_ctx, animal):
+    assert decode(zoo_ctx, animal, ["trainer.name"]) == {"trainer": {"name": "Ada"}}
+
+
+def test_field_of_every_message_of_a_repeated_field(zoo_ctx, animal):
+    actual = decode(zoo_ctx, animal, ["keepers.years"])
+
+    assert actual == {"keepers": [{"years": 1}, {"years": 2}]}
+
+
+def test_field_of_map_values(zoo_ctx, animal):
+    actual = decode(zoo_ctx, animal, ["backups.key", "backups.value.name"])
+
+    assert actual == {"backups": {"first": {"name": "Di"}}}
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [["trainer", "trainer.name"], ["trainer.name", "trainer"], ["trainer.name", "trainer.years"]],
+)
+def test_whole_field_wins_over_its_paths(zoo_ctx, animal, fields):
+    assert decode(zoo_ctx, animal, fields) == {"trainer": {"name": "Ada", "years": 3}}
+
+
+def test_json_names_and_field_names(ctx):
+    ctx.add_proto(
+        "order.proto",
+        """
+        syntax = "proto3";
+        message Order {
+            int32 order_id = 1;
+            string customer_name = 2;
+        }
+        """,
+    )
+    data = ctx.from_json("Order", json.dumps({"orderId": 1, "customerName": "Ada"}))
+
+    actual = json.loads(ctx.to_json("Order", data, fields=["order_id", "customerName"]))
+
+    assert actual == {"orderId": 1, "customerName": "Ada"}
+
+
+def test_no_fields(zoo_ctx, animal):
+    assert decode(zoo_ctx, animal, []) == {}
+
+
+def test_none_decodes_everything(zoo_ctx, animal):
+    assert decode(zoo_ctx, animal, None) == decode(zoo_ctx, animal, list(_ANIMAL))
+
+
+def test_options_still_apply(zoo_ctx, animal):
+    actual = decode(
+        zoo_ctx, animal, ["weight", "trainer.years"], proto_field_names=True, unquote_int64=True
+    )
+
+    assert actual == {"weight": 81, "trainer": {"years": 3}}
+
+
+def test_include_defaults_is_rejected(zoo_ctx, animal):
+    with pytest.raises(ValueError, match="fields cannot be combined with include_defaults"):
+        decode(zoo_ctx, animal, ["name"], include_defaults=True)
+
+    with pytest.raises(ValueError, match="fields cannot be combined with include_defaults"):
+        zoo_ctx.to_json_many("zoo.Animal", [animal], fields=["name"], include_defaults=True)
+
+    with pytest.raises(ValueError, match="fields cannot be combined with include_defaults"):
+        zoo_ctx.to_dict("zoo.Animal", animal, fields=["name"], include_defaults=True)
+
+
+# --- invalid paths ---
+
+
+def test_unknown_field(zoo_ctx, animal):
+    with pytest.raises(RuntimeError, match='message type "zoo.Trainer" has no field named "nme"'):
+        decode(zoo_ctx, animal, ["trainer.nme"])
+
+
+def test_path_through_a_scalar(zoo_ctx, animal):
+    with pytest.raises(RuntimeError, match='field "zoo.Animal.name" is not a message'):
+        decode(zoo_ctx, animal, ["name.first"])
+
+
+def test_empty_path(zoo_ctx, animal):
+    with pytest.raises(RuntimeError, match='Invalid field path ""'):
+        decode(zoo_ctx, animal, [""])
+
+
+# --- wire format ---
+
+
+def test_skipped_fields_are_not_validated(zoo_ctx):
+    # name is Rex, and the trainer holds a string that is not valid UTF-8
+    data = b"\x0a\x03Rex" + b"\x22\x03\x0a\x01\xff"
+
+    assert decode(zoo_ctx, data, ["name"]) == {"name": "Rex"}
+
+    with pytest.raises(RuntimeError):
+        zoo_ctx.to_json("zoo.Animal", data)
+
+
+@pytest.mark.parametrize("cut", [1, 3, 6])
+def test_truncated_data(zoo_ctx, animal, cut):
+    with pytest.raises(RuntimeError, match="not valid protobuf wire format"):
+        decode(zoo_ctx, animal[:-cut], ["name"])
+
+
+def test_unknown_fields_are_dropped(zoo_ctx, animal):
+    # field 15, varint 1
+    assert decode(zoo_ctx, animal + b"\x78\x01", ["name"]) == {"name": "Rex"}
+
+
+def test_skips_groups(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+    data = ctx.from_json("legacy.Crate", json.dumps({"number": 1, "lid": {"size": 2}, "weight": 3}))
+
+    actual = json.loads(ctx.to_json("legacy.Crate", data, fields=["number", "weight"]))
+
+    assert actual == {"number": 1, "weight": 3}
+
+
+def _nested_groups(depth, closed=True):
+    # groups of field 15 inside each other, `depth` deep
+    return b"\x7b" * depth + (b"\x7c" * depth if closed else b"")
+
+
+def test_skips_nested_groups(zoo_ctx, animal):
+    assert decode(zoo_ctx, animal + _nested_groups(100), ["name"]) == {"name": "Rex"}
+
+
+@pytest.mark.parametrize("data", [_nested_groups(101), _nested_groups(2_000_000, closed=False)])
+def test_groups_nested_too_deeply(zoo_ctx, animal, data):
+    with pytest.raises(RuntimeError, match="not valid protobuf wire format"):
+        decode(zoo_ctx, animal + data, ["name"])
+
+    with pytest.raises(RuntimeError, match=r"^Payload 1: "):
+        zoo_ctx.to_json_many("zoo.Animal", [animal, animal + data], fields=["name"], workers=4)
+
+
+def test_required_fields_are_not_checked(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+    data = ctx.from_json("legacy.Crate", json.dumps({"number": 1, "label": "fragile"}))
+
+    actual = json.loads(ctx.to_json("legacy.Crate", data, fields=["label"]))
+
+    assert actual == {"label": "fragile"}
+
+
+# --- other decoders ---
+
+
+def test_to_dict(zoo_ctx, animal):
+    actual = zoo_ctx.to_dict("zoo.Animal", animal, fields=["weight", "keepers.name"])
+
+    assert actual == {"weight": 81, "keepers": [{"name": "Bo"}, {"name": "Cy"}]}
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_to_json_many(zoo_ctx, animal, workers):
+    actual = zoo_ctx.to_json_many("zoo.Animal", [animal] * 200, fields=["name"], workers=workers)
+
+    assert [json.loads(doc) for doc in actual] == [{"name": "Rex"}] * 200
+
+
+def test_to_json_many_reports_the_position_of_an_invalid_payload(zoo_ctx, animal):
+    with pytest.raises(RuntimeError, match=r"^Payload 1: "):
+        zoo_ctx.to_json_many("zoo.Animal", [animal, b"\xff"], fields=["name"])
+
+
+def test_message_handle(zoo_ctx, animal):
+    handle = zoo_ctx.message_handle("zoo.Animal")
+
+    assert json.loads(handle.to_json(animal, fields=["tags"])) == {"tags": ["big", "loud"]}
@@ -1,7 +1,9 @@
+import threading
+
 import pytest
 import requests
 
-from protosaurus import Context, cli
+from protosaurus import Context, cli, read_varint
 
 if __name__ == "__main__":
     pytest.main()
@@ -35,6 +37,9 @@ class _FakeSession:
 def clean_cli(monkeypatch):
     """Reset the module-level globals so tests do not contaminate each other."""
     monkeypatch.setattr(cli, "_schema_cache", {})
+    monkeypatch.setattr(cli, "_reference_cache", {})
+    monkeypatch.setattr(cli, "_descriptor_cache", {})
+    monkeypatch.setattr(cli, "_schema_cache_dir", None)
     monkeypatch.setattr(cli, "_session", None)
     return cli
 
@@ -103,3 +108,246 @@ def test_get_schema_raises_on_http_error(clean_cli, monkeypatch):
 
     with pytest.raises(requests.HTTPError):
         clean_cli._get_schema("http://reg", "n.proto", "s", 1, Context())
+
+
+# --- reference graph ---
+
+
+def _schema(body, *references):
+    return {
+        "schema": f'syntax = "proto3"; {body}',
+        "references": [
+            {"name": f"{subject}.proto", "subject": subject, "version": 1} for subject in references
+        ],
+    }
+
+
+def _diamond_session():
+    # main imports left and right, which both import base
+    return _FakeSession(
+        {
+            "http://reg/schemas/ids/1": _FakeResponse(
+                _schema(
+                    'import "left.proto"; import "right.proto"; message M { L l = 1; R r = 2; }',
+                    "left",
+                    "right",
+                )
+            ),
+            "http://reg/subjects/left/versions/1": _FakeResponse(
+                _schema('import "base.proto"; message L { B b = 1; }', "base")
+            ),
+            "http://reg/subjects/right/versions/1": _FakeResponse(
+                _schema('import "base.proto"; message R { B b = 1; }', "base")
+            ),
+            "http://reg/subjects/base/versions/1": _FakeResponse(
+                _schema("message B { int32 v = 1; }")
+            ),
+        }
+    )
+
+
+def test_shared_reference_is_fetched_once(clean_cli, monkeypatch):
+    session = _diamond_session()
+    _install_session(monkeypatch, session)
+
+    ctx = clean_cli._get_schema_by_id("http://reg", 1)
+
+    assert ctx.message_type_from_index("<<<MAIN>>>", [0]) == "M"
+    assert sorted(session.requested) == [
+        "http://reg/schemas/ids/1",
+        "http://reg/subjects/base/versions/1",
+        "http://reg/subjects/left/versions/1",
+        "http://reg/subjects/right/versions/1",
+    ]
+
+
+def test_references_are_added_in_dependency_order(clean_cli, monkeypatch):
+    _install_session(monkeypatch, _diamond_session())
+    added = []
+
+    class _RecordingContext(Context):
+        def add_proto(self, filename, content):
+            added.append(filename)
+            super().add_proto(filename, content)
+
+        def add_file_descriptor(self, data):
+            # the name is field 1 of a FileDescriptorProto, so it comes first
+            size, offset = read_varint(data, 1)
+            added.append(data[offset : offset + size].decode())
+            super().add_file_descriptor(data)
+
+    monkeypatch.setattr(cli, "Context", _RecordingContext)
+
+    clean_cli._get_schema_by_id("http://reg", 1)
+
+    assert added == ["base.proto", "left.proto", "right.proto", "<<<MAIN>>>"]
+
+
+class _BarrierSession(_FakeSession):
+    """Answers reference requests only once `parties` of them are in flight."""
+
+    def __init__(self, responses, parties):
+        super().__init__(responses)
+        self._barrier = threading.Barrier(parties, timeout=5)
+
+    def get(self, url):
+        if "/subjects/" in url:
+            self._barrier.wait()
+        return super().get(url)
+
+
+def test_sibling_references_are_fetched_concurrently(clean_cli, monkeypatch):
+    subjects = [f"dep{i}" for i in range(4)]
+    responses = {
+        f"http://reg/subjects/{subject}/versions/1": _FakeResponse(
+            _schema(f"message {subject.upper()} {{ int32 v = 1; }}")
+        )
+        for subject in subjects
+    }
+    responses["http://reg/schemas/ids/1"] = _FakeResponse(
+        _schema("message M { int32 v = 1; }", *subjects)
+    )
+    # a serial fetch would block on the barrier and time out
+    _install_session(monkeypatch, _BarrierSession(responses, parties=len(subjects)))
+
+    ctx = clean_cli._get_schema_by_id("http://reg", 1)
+
+    assert ctx.message_type_from_index("<<<MAIN>>>", [0]) == "M"
+
+
+def test_failed_reference_is_not_cached(clean_cli, monkeypatch):
+    session = _FakeSession(
+        {
+            "http://reg/schemas/ids/1": _FakeResponse(
+                _schema("message M { int32 v = 1; }", "gone")
+            ),
+            "http://reg/subjects/gone/versions/1": _FakeResponse({}, status_code=404),
+        }
+    )
+    _install_session(monkeypatch, session)
+
+    with pytest.raises(requests.HTTPError):
+        clean_cli._get_schema_by_id("http://reg", 1)
+
+    assert 1 not in clean_cli._schema_cache
+
+
+def test_references_are_shared_across_schema_ids(clean_cli, monkeypatch):
+    session = _diamond_session()
+    session._responses["http://reg/schemas/ids/2"] = _FakeResponse(
+        _schema('import "left.proto"; message N { L l = 1; }', "left")
+    )
+    _install_session(monkeypatch, session)
+    parsed = []
+    parse_proto = cli.parse_proto
+    monkeypatch.setattr(
+        cli, "parse_proto", lambda name, content: parsed.append(name) or parse_proto(name, content)
+    )
+
+    first = clean_cli._get_schema_by_id("http://reg", 1)
+    second = clean_cli._get_schema_by_id("http://reg", 2)
+
+    assert first is not second
+    assert second.message_type_from_index("<<<MAIN>>>", [0]) == "N"
+    # left and base were downloaded and parsed for schema 1 only
+    assert session.requested.count("http://reg/subjects/left/versions/1") == 1
+    assert session.requested.count("http://reg/subjects/base/versions/1") == 1
+    assert sorted(parsed) == ["<<<MAIN>>>", "<<<MAIN>>>", "base.proto", "left.proto", "right.proto"]
+
+
+# --- on-disk cache ---
+
+
+class _OfflineSession(_FakeSession):
+    def __init__(self):
+        super().__init__({})
+
+    def get(self, url):
+        raise requests.ConnectionError(f"offline: {url}")
+
+
+def _forget_in_memory(monkeypatch):
+    monkeypatch.setattr(cli, "_schema_cache", {})
+    monkeypatch.setattr(cli, "_reference_cache", {})
+    monkeypatch.setattr(cli, "_descriptor_cache", {})
+
+
+def test_warm_cache_dir_works_offline(clean_cli, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "_schema_cache_dir", tmp_path)
+    _install_session(monkeypatch, _diamond_session())
+    clean_cli._get_schema_by_id("http://reg", 1)
+
+    # a later run: nothing in memory, no registry, no .proto parsing
+    _forget_in_memory(monkeypatch)
+    _install_session(monkeypatch, _OfflineSession())
+    monkeypatch.setattr(cli, "parse_proto", None)
+
+    ctx = clean_cli._get_schema_by_id("http://reg", 1)
+
+    assert ctx.message_type_from_index("<<<MAIN>>>", [0]) == "M"
+    assert ctx.describe("L")["fields"][0]["type_name"] == "B"
+
+
+def test_cache_dir_layout(clean_cli, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "_schema_cache_dir", tmp_path)
+    _install_session(monkeypatch, _diamond_session())
+
+    clean_cli._get_schema_by_id("http://reg", 1)
+
+    [registry] = tmp_path.iterdir()
+    files = sorted(str(path.relative_to(registry)) for path in registry.rglob("*.*"))
+    assert files == [
+        "ids/1.json",
+        "ids/1.pb",
+        "subjects/base/1.json",
+        "subjects/base/1/base.proto.pb",
+        "subjects/left/1.json",
+        "subjects/left/1/left.proto.pb",
+        "subjects/right/1.json",
+        "subjects/right/1/right.proto.pb",
+    ]
+
+
+def test_cache_dir_quotes_slashes(clean_cli, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "_schema_cache_dir", tmp_path)
+
+    path = cli._cache_path("http://reg", "subjects", "a/b", "1.json")
+
+    assert path.relative_to(tmp_path).parts[1:] == ("subjects", "a%2Fb", "1.json")
+
+
+def test_cache_dir_keeps_registries_apart(clean_cli, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "_schema_cache_dir", tmp_path)
+
+    for url, name in [("http://one", "One"), ("http://two", "Two")]:
+        _forget_in_memory(monkeypatch)
+        schema = _schema(f'import "base.proto"; message {name} {{ {name}Base b = 1; }}', "base")
+        base = _schema(f"message {name}Base {{}}")
+        session = _FakeSession(
+            {
+                f"{url}/schemas/ids/1": _FakeResponse(schema),
+                f"{url}/subjects/base/versions/1": _FakeResponse(base),
+            }
+        )
+        _install_session(monkeypatch, session)
+        clean_cli._get_schema_by_id(url, 1)
+
+    # the same schema ID and subject version again, from the cache of each
+    for url, name in [("http://one", "One"), ("http://two", "Two")]:
+        _forget_in_memory(monkeypatch)
+        _install_session(monkeypatch, _OfflineSession())
+
+        ctx = clean_cli._get_schema_by_id(url, 1)
+
+        assert ctx.message_type_from_index("<<<MAIN>>>", [0]) == name
+        assert ctx.describe(name)["fields"][0]["type_name"] == f"{name}Base"
+
+
+def test_cold_cache_dir_offline_fails(clean_cli, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "_schema_cache_dir", tmp_path)
+    _install_session(monkeypatch, _OfflineSession())
+
+    with pytest.raises(requests.ConnectionError):
+        clean_cli._get_schema_by_id("http://reg", 1)
+
+    assert list(tmp_path.iterdir()) == []
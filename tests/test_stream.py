@@ -0,0 +1,160 @@
+import io
+import json
+
+import pytest
+
+from protosaurus.stream import iter_delimited, iter_messages, write_delimited, write_messages
+
+if __name__ == '__main__':
+    pytest.main()
+
+
+_ANIMAL_PROTO = """
+    syntax = "proto3";
+    package zoo;
+    message Animal {
+        string name = 1;
+        int64 weight = 2;
+    }
+    """
+
+
+@pytest.fixture
+def zoo(ctx):
+    ctx.add_proto('zoo', _ANIMAL_PROTO)
+    return ctx
+
+
+def animals(count):
+    return [json.dumps({'name': f'dino-{i}', 'weight': str(i + 1)}) for i in range(count)]
+
+
+def stream_of(ctx, documents):
+    fileobj = io.BytesIO()
+    write_delimited(ctx, 'zoo.Animal', fileobj, documents)
+    fileobj.seek(0)
+    return fileobj
+
+
+# --- writing ---
+
+
+def test_write_messages_prefixes_lengths():
+    fileobj = io.BytesIO()
+
+    count = write_messages(fileobj, [b'\x08\x01', b'', b'x' * 300])
+
+    assert count == 3
+    assert fileobj.getvalue() == b'\x02\x08\x01' + b'\x00' + b'\xac\x02' + b'x' * 300
+
+
+def test_write_delimited_encodes_documents(zoo):
+    documents = animals(3)
+    fileobj = io.BytesIO()
+
+    count = write_delimited(zoo, 'zoo.Animal', fileobj, iter(documents))
+
+    expected = io.BytesIO()
+    write_messages(expected, [zoo.from_json('zoo.Animal', doc) for doc in documents])
+    assert count == 3
+    assert fileobj.getvalue() == expected.getvalue()
+
+
+def test_write_delimited_notes_where_a_batch_starts(zoo):
+    documents = [*animals(1500), '{not json']
+
+    with pytest.raises(RuntimeError, match=r'^Document 476: ') as info:
+        write_delimited(zoo, 'zoo.Animal', io.BytesIO(), documents)
+
+    assert info.value.__notes__ == ['Document positions count from document 1024.']
+
+
+# --- reading ---
+
+
+def test_iter_delimited_round_trips(zoo):
+    documents = animals(100)
+
+    actual = list(iter_delimited(zoo, 'zoo.Animal', stream_of(zoo, documents)))
+
+    assert [json.loads(doc) for doc in actual] == [json.loads(doc) for doc in documents]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64])
+def test_iter_delimited_reassembles_messages_across_chunks(zoo, chunk_size):
+    documents = animals(50)
+
+    fileobj = stream_of(zoo, documents)
+
+    actual = list(iter_delimited(zoo, 'zoo.Animal', fileobj, chunk_size=chunk_size))
+
+    assert [json.loads(doc) for doc in actual] == [json.loads(doc) for doc in documents]
+
+
+def test_iter_delimited_passes_fields_through(zoo):
+    documents = animals(3)
+
+    actual = list(iter_delimited(zoo, 'zoo.Animal', stream_of(zoo, documents), fields=['name']))
+
+    assert [json.loads(doc) for doc in actual] == [{'name': f'dino-{i}'} for i in range(3)]
+
+
+def test_iter_delimited_reads_messages_larger_than_a_chunk(zoo):
+    documents = [json.dumps({'name': 'x' * 100_000}), json.dumps({'name': 'Rex'})]
+
+    actual = list(iter_delimited(zoo, 'zoo.Animal', stream_of(zoo, documents), chunk_size=16))
+
+    assert [json.loads(doc) for doc in actual] == [json.loads(doc) for doc in documents]
+
+
+def test_iter_delimited_applies_options(zoo):
+    fileobj = stream_of(zoo, [json.dumps({'weight': '7'})])
+
+    (actual,) = iter_delimited(
+        zoo, 'zoo.Animal', fileobj, include_defaults=True, unquote_int64=True
+    )
+
+    assert json.loads(actual) == {'name': '', 'weight': 7}
+
+
+def test_iter_delimited_empty_stream(zoo):
+    assert list(iter_delimited(zoo, 'zoo.Animal', io.BytesIO())) == []
+
+
+def test_iter_delimited_truncated_stream_raises_eof(zoo):
+    data = stream_of(zoo, animals(2)).getvalue()
+
+    with pytest.raises(EOFError, match='Stream ends inside a message'):
+        list(iter_delimited(zoo, 'zoo.Animal', io.BytesIO(data[:-1])))
+
+
+def test_iter_delimited_notes_where_a_chunk_starts(zoo):
+    messages = [zoo.from_json('zoo.Animal', doc) for doc in animals(3)]
+    fileobj = io.BytesIO()
+    write_messages(fileobj, [*messages, b'\xff'])
+    fileobj.seek(0)
+
+    # two messages per chunk, so the invalid one is the second of the second chunk
+    chunk_size = 2 * (1 + len(messages[0]))
+
+    with pytest.raises(RuntimeError, match=r'^Payload 1: ') as info:
+        list(iter_delimited(zoo, 'zoo.Animal', fileobj, chunk_size=chunk_size))
+
+    assert info.value.__notes__ == ['Payload positions count from message 2 of the stream.']
+
+
+def test_iter_messages_yields_raw_slices():
+    fileobj = io.BytesIO()
+    messages = [b'\x08\x01', b'', b'x' * 300]
+    write_messages(fileobj, messages)
+    fileobj.seek(0)
+
+    actual = list(iter_messages(fileobj, chunk_size=5))
+
+    assert all(isinstance(message, memoryview) for message in actual)
+    assert [bytes(message) for message in actual] == messages
+
+
+def test_iter_messages_rejects_non_positive_chunk_size():
+    with pytest.raises(ValueError, match='chunk_size'):
+        list(iter_messages(io.BytesIO(), chunk_size=0))
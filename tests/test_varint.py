@@ -1,6 +1,8 @@
+from array import array
+
 import pytest
 
-from protosaurus import read_varint
+from protosaurus import read_varint, read_varints
 
 if __name__ == "__main__":
     pytest.main()
@@ -41,6 +43,11 @@ def test_returned_offset_allows_sequential_reads():
     assert offset == len(data)
 
 
+def test_accepts_buffers():
+    assert read_varint(bytearray(b"\x96\x01")) == (150, 2)
+    assert read_varint(memoryview(b"\x00\x96\x01")[1:]) == (150, 2)
+
+
 def test_trailing_data_is_ignored():
     value, offset = read_varint(b"\x08rest")
 
@@ -126,3 +133,81 @@ def test_too_long_varint_is_rejected():
 def test_negative_offset_raises_index_error():
     with pytest.raises((IndexError, TypeError, OverflowError)):
         read_varint(b"\x08", -1)
+
+
+# --- read_varints ---
+
+
+def test_read_varints_reads_to_the_end():
+    values, offset = read_varints(b"\x01\x96\x01\x7f")
+
+    assert values.typecode == "Q"
+    assert values.tolist() == [1, 150, 127]
+    assert offset == 4
+
+
+def test_read_varints_reads_count_values_from_offset():
+    values, offset = read_varints(b"\xff\x01\x02\x03\x04", 1, 2)
+
+    assert values.tolist() == [1, 2]
+    assert offset == 3
+
+
+def test_read_varints_matches_read_varint():
+    data = b"".join(bytes([0x80 | (i & 0x7F), i >> 7]) for i in range(1, 1000))
+
+    expected = []
+    offset = 0
+    while offset < len(data):
+        value, offset = read_varint(data, offset)
+        expected.append(value)
+
+    assert read_varints(data) == (array("Q", expected), len(data))
+
+
+def test_read_varints_zigzag():
+    values, _ = read_varints(b"\x00\x01\x02\x03\xfe\xff\xff\xff\x0f", zigzag=True)
+
+    assert values.typecode == "q"
+    assert values.tolist() == [0, -1, 1, -2, 2147483647]
+
+
+def test_read_varints_max_uint64():
+    values, _ = read_varints(b"\xff" * 9 + b"\x01")
+
+    assert values.tolist() == [2**64 - 1]
+
+
+def test_read_varints_accepts_buffers():
+    assert read_varints(memoryview(b"\x00\x01\x02")[1:])[0].tolist() == [1, 2]
+
+
+def test_read_varints_empty():
+    assert read_varints(b"") == (array("Q"), 0)
+    assert read_varints(b"\x01", 1) == (array("Q"), 1)
+    assert read_varints(b"\x01", 0, 0) == (array("Q"), 0)
+
+
+def test_read_varints_count_past_the_end_raises_eof():
+    with pytest.raises(EOFError):
+        read_varints(b"\x01\x02", 0, 3)
+
+
+def test_read_varints_truncated_varint_raises_eof():
+    with pytest.raises(EOFError):
+        read_varints(b"\x01\x80")
+
+
+def test_read_varints_too_long_varint_is_rejected():
+    with pytest.raises(RuntimeError):
+        read_varints(b"\x80" * 11 + b"\x01")
+
+
+def test_read_varints_offset_past_end_raises_index_error():
+    with pytest.raises(IndexError):
+        read_varints(b"\x08", 5)
+
+
+def test_read_varints_negative_count_raises_value_error():
+    with pytest.raises(ValueError):
+        read_varints(b"\x08", 0, -1)
@@ -0,0 +1,275 @@
+import json
+
+import pytest
+
+from protosaurus import Context, MessageView
+
+if __name__ == "__main__":
+    pytest.main()
+
+
+_ZOO_PROTO = """
+    syntax = "proto3";
+    package zoo;
+    enum Diet {
+        DIET_UNKNOWN = 0;
+        DIET_HERBIVORE = 1;
+        DIET_CARNIVORE = 2;
+    }
+    message Trainer {
+        string name = 1;
+        uint32 years = 2;
+    }
+    message Animal {
+        string name = 1;
+        int64 weight = 2;
+        repeated string tags = 3;
+        Trainer trainer = 4;
+        repeated Trainer keepers = 5;
+        repeated sint32 feedings = 6;
+        map<string, Trainer> backups = 7;
+        map<int32, string> meals = 8;
+        Diet diet = 9;
+        bytes photo = 10;
+        double length = 11;
+        float height = 12;
+        optional bool tame = 13;
+        fixed64 tag_id = 14;
+        sfixed32 offset = 15;
+    }
+    """
+
+_LEGACY_PROTO = """
+    syntax = "proto2";
+    package legacy;
+    message Crate {
+        optional int32 size = 1 [default = 4];
+        optional string label = 2 [default = "box"];
+        optional group Lid = 3 {
+            optional int32 width = 4;
+        }
+        repeated int32 codes = 5;
+    }
+    """
+
+_ANIMAL = {
+    "name": "Rex",
+    "weight": "-81",
+    "tags": ["big", "loud"],
+    "trainer": {"name": "Ada", "years": 3},
+    "keepers": [{"name": "Bo"}, {"name": "Cy", "years": 2}],
+    "feedings": [7, -19],
+    "backups": {"first": {"name": "Di", "years": 4}},
+    "meals": {"3": "hay"},
+    "diet": "DIET_CARNIVORE",
+    "photo": "AAH/",
+    "length": 12.5,
+    "height": 0.25,
+    "tame": False,
+    "tagId": "18446744073709551615",
+    "offset": -7,
+}
+
+
+@pytest.fixture
+def zoo_ctx(ctx):
+    ctx.add_proto("zoo.proto", _ZOO_PROTO)
+    return ctx
+
+
+@pytest.fixture
+def animal(zoo_ctx):
+    return zoo_ctx.view("zoo.Animal", zoo_ctx.from_json("zoo.Animal", json.dumps(_ANIMAL)))
+
+
+# --- field access ---
+
+
+def test_scalars(animal):
+    assert isinstance(animal, MessageView)
+    assert animal.message_type == "zoo.Animal"
+    assert animal["name"] == "Rex"
+    assert animal["weight"] == -81
+    assert animal["length"] == 12.5
+    assert animal["height"] == 0.25
+    assert animal["tame"] is False
+    assert animal["tag_id"] == 18446744073709551615
+    assert animal["offset"] == -7
+
+
+def test_enums_give_the_name_of_their_value(animal):
+    assert animal["diet"] == "DIET_CARNIVORE"
+
+
+def test_unknown_enum_number_is_an_int(zoo_ctx):
+    # field 9, varint 5
+    assert zoo_ctx.view("zoo.Animal", b"\x48\x05")["diet"] == 5
+
+
+def test_bytes_are_bytes(animal):
+    assert animal["photo"] == b"\x00\x01\xff"
+
+
+def test_submessages_are_views(animal):
+    trainer = animal["trainer"]
+
+    assert isinstance(trainer, MessageView)
+    assert trainer.message_type == "zoo.Trainer"
+    assert trainer["name"] == "Ada"
+    assert trainer["years"] == 3
+
+
+def test_submessage_views_are_kept(animal):
+    assert animal["trainer"] is animal["trainer"]
+
+
+def test_repeated_fields(animal):
+    assert animal["tags"] == ["big", "loud"]
+    assert animal["feedings"] == [7, -19]
+    assert [keeper["name"] for keeper in animal["keepers"]] == ["Bo", "Cy"]
+
+
+def test_maps(animal):
+    assert animal["meals"] == {3: "hay"}
+    assert animal["backups"]["first"]["years"] == 4
+
+
+def test_attribute_access(animal):
+    assert animal.trainer.name == "Ada"
+    assert animal.tagId == animal["tag_id"]
+
+
+def test_json_names(animal):
+    assert animal["tagId"] == 18446744073709551615
+
+
+# --- unset fields ---
+
+
+def test_unset_fields_give_their_default(zoo_ctx):
+    empty = zoo_ctx.view("zoo.Animal", b"")
+
+    assert empty["name"] == ""
+    assert empty["weight"] == 0
+    assert empty["diet"] == "DIET_UNKNOWN"
+    assert empty["photo"] == b""
+    assert empty["tags"] == []
+    assert empty["backups"] == {}
+    assert empty["trainer"]["name"] == ""
+
+
+def test_proto2_defaults(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+    crate = ctx.view("legacy.Crate", b"")
+
+    assert crate["size"] == 4
+    assert crate["label"] == "box"
+
+
+def test_contains(animal):
+    assert "tame" in animal
+    assert "trainer" in animal
+    assert "tags" in animal
+    assert "tagId" in animal
+    assert "nickname" not in animal
+    assert "years" not in animal["keepers"][0]
+
+
+# --- wire format ---
+
+
+def test_the_last_value_of_a_singular_field_wins(zoo_ctx):
+    # name "Rex", then name "Max"
+    assert zoo_ctx.view("zoo.Animal", b"\x0a\x03Rex\x0a\x03Max")["name"] == "Max"
+
+
+def test_occurrences_of_a_submessage_merge(zoo_ctx):
+    # trainer with name "A", then trainer with years 2
+    trainer = zoo_ctx.view("zoo.Animal", b"\x22\x03\x0a\x01A" + b"\x22\x02\x10\x02")["trainer"]
+
+    assert (trainer["name"], trainer["years"]) == ("A", 2)
+
+
+def test_packed_and_unpacked_values(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+    # codes 1 and 2 unpacked, then 3 and 4 packed
+    data = b"\x28\x01\x28\x02" + b"\x2a\x02\x03\x04"
+
+    assert ctx.view("legacy.Crate", data)["codes"] == [1, 2, 3, 4]
+
+
+def test_groups(ctx):
+    ctx.add_proto("legacy.proto", _LEGACY_PROTO)
+    data = ctx.from_json("legacy.Crate", json.dumps({"lid": {"width": 300}, "codes": [1]}))
+
+    view = ctx.view("legacy.Crate", data)
+
+    assert view["lid"]["width"] == 300
+    assert view["codes"] == [1]
+
+
+def test_fields_are_read_from_the_buffer_given(zoo_ctx):
+    data = bytearray(zoo_ctx.from_json("zoo.Animal", json.dumps({"name": "Rex"})))
+
+    view = zoo_ctx.view("zoo.Animal", memoryview(data))
+
+    assert view["name"] == "Rex"
+
+    with pytest.raises(BufferError):
+        data.clear()
+
+
+def test_view_outlives_its_context_and_data(zoo_ctx):
+    ctx = Context()
+    ctx.add_proto("zoo.proto", _ZOO_PROTO)
+    view = ctx.view("zoo.Animal", bytes(ctx.from_json("zoo.Animal", json.dumps(_ANIMAL))))
+    del ctx
+
+    assert view["backups"]["first"]["name"] == "Di"
+
+
+# --- errors ---
+
+
+def test_unknown_message_type(zoo_ctx):
+    with pytest.raises(RuntimeError, match='Could not find message type "zoo.Missing"'):
+        zoo_ctx.view("zoo.Missing", b"")
+
+
+def test_unknown_field(animal):
+    with pytest.raises(KeyError, match='message type "zoo.Animal" has no field named "colour"'):
+        animal["colour"]
+
+    with pytest.raises(AttributeError, match='message type "zoo.Trainer" has no field named "c"'):
+        _ = animal.trainer.c
+
+
+@pytest.mark.parametrize("data", [b"\x0a\x05Rex", b"\xff", b"\x00\x01"])
+def test_invalid_payload(zoo_ctx, data):
+    view = zoo_ctx.view("zoo.Animal", data)
+
+    with pytest.raises(RuntimeError, match="not valid protobuf wire format"):
+        view["name"]
+
+
+def test_groups_nested_too_deeply(zoo_ctx):
+    # groups of field 3 inside each other, never closed
+    view = zoo_ctx.view("zoo.Animal", b"\x1b" * 2_000_000)
+
+    with pytest.raises(RuntimeError, match="not valid protobuf wire format"):
+        view["name"]
+
+
+def test_invalid_submessage_fails_when_it_is_read(zoo_ctx):
+    # name "Rex", and a trainer whose name is cut short
+    view = zoo_ctx.view("zoo.Animal", b"\x0a\x03Rex" + b"\x22\x02\x0a\x05")
+
+    assert view["name"] == "Rex"
+
+    with pytest.raises(RuntimeError, match='as message type "zoo.Trainer"'):
+        view["trainer"]["name"]
+
+
+def test_invalid_utf8(zoo_ctx):
+    with pytest.raises(UnicodeDecodeError):
+        zoo_ctx.view("zoo.Animal", b"\x0a\x01\xff")["name"]